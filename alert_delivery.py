@@ -0,0 +1,289 @@
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+log = logging.getLogger(__name__)
+
+REQUEST_SECONDS = metrics.histogram("wasms_request_seconds", "WaSMS send request latency")
+REQUESTS = metrics.counter("wasms_requests_total", "WaSMS send requests by result", ["result"])
+_SENT = REQUESTS.labels("sent")
+_FAILED = REQUESTS.labels("failed")
+_ERRORS = REQUESTS.labels("error")
+
+
+class AlertDelivery:
+    """Background WhatsApp delivery so a slow WaSMS API never stalls the monitor.
+
+    `submit()` only puts the alert on a bounded queue and returns. A worker
+    thread sends it to every recipient concurrently over one pooled
+    `requests.Session`, and recipients that fail are retried with exponential
+    backoff. Alerts that are not fully delivered yet are kept in a small JSON
+    spool file, so they are sent after a restart too, unless they are older
+    than `max_age` seconds by then: a "grid down" from hours ago is no news
+    any more. With `digests` (an
+    alert_messages.AlertCoalescer) the worker also queues the digests of
+    coalescing windows as they close.
+    """
+
+    def __init__(self, api_url, secret, account, spool_path=None, max_queue=100,
+                 max_workers=4, max_attempts=6, base_delay=2.0, max_delay=300.0, timeout=15,
+                 digests=None, max_age=3600.0):
+        self.api_url = api_url
+        self.secret = secret
+        self.account = account
+        self.spool_path = spool_path
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.digests = digests
+        self.max_age = max_age
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="wasms")
+
+        self._incoming = queue.Queue(maxsize=max_queue)
+        self._retries = []  # heap of (due_time, seq, alert_id)
+        self._seq = itertools.count()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.stats = {'submitted': 0, 'delivered': 0, 'failed_attempts': 0, 'dropped': 0, 'expired': 0}
+        self._load_spool()
+
+    # ------------------------------------------------------------------ public
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="alert-delivery", daemon=True)
+            self._thread.start()
+        return self
+
+    async def run_async(self):
+        """Deliver from an asyncio task instead of the worker thread (see async_runtime.py).
+
+        The waiting and the HTTP requests still run on executor threads; the
+        task just drives them, and ends within a second of `stop()`.
+        """
+        loop = asyncio.get_running_loop()
+        while not self._stop.is_set():
+            self._submit_digests()
+            ready = await loop.run_in_executor(None, self._next_ready)
+            # After stop() they stay in the spool for the next start
+            if ready and not self._stop.is_set():
+                await loop.run_in_executor(None, self._deliver, ready)
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        # Sends under way end with their request timeout; the cancelled ones stay in the spool
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, message, recipients):
+        """Queue `message` for every recipient; returns False if the queue is full"""
+        recipients = [r for r in recipients if r]
+        if not recipients:
+            return False
+
+        alert = {
+            'id': uuid.uuid4().hex,
+            'message': message,
+            'recipients': recipients,
+            'attempts': 0,
+            'created': time.time(),
+        }
+        with self._lock:
+            try:
+                self._incoming.put_nowait(alert['id'])
+            except queue.Full:
+                self.stats['dropped'] += 1
+                log.error("❌ Alert queue full, dropping alert: %s", message.splitlines()[0])
+                return False
+            # The worker takes the lock before reading _pending, so it sees this entry
+            self._pending[alert['id']] = alert
+            self.stats['submitted'] += 1
+            self._save_spool()
+        return True
+
+    def pending_count(self):
+        return len(self._pending)
+
+    def pending_alerts(self):
+        """Copies of the alerts not yet delivered to all their recipients"""
+        with self._lock:
+            return [dict(alert, recipients=list(alert['recipients'])) for alert in self._pending.values()]
+
+    def send_now(self, message, recipient):
+        """Send one message synchronously over the pooled session; returns True on success"""
+        payload = {
+            'secret': self.secret,
+            'account': self.account,
+            'recipient': recipient,
+            'type': 'text',
+            'message': message,
+            'priority': 1
+        }
+        log.debug("📤 Sending WhatsApp message to %s", recipient)
+        try:
+            with REQUEST_SECONDS.time():
+                response = self.session.post(self.api_url, data=payload, timeout=self.timeout)
+        except requests.RequestException as e:
+            _ERRORS.inc()
+            log.warning("❌ Error sending to %s: %s", recipient, e)
+            return False
+
+        if response.status_code == 200:
+            _SENT.inc()
+            log.info("✅ Sent to %s | Response: %s", recipient, response.text[:200])
+            return True
+        _FAILED.inc()
+        log.warning("❌ Failed to send to %s | %s: %s", recipient, response.status_code, response.text[:200])
+        return False
+
+    # ------------------------------------------------------------------ worker
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._submit_digests()
+            ready = self._next_ready()
+            if ready:
+                self._deliver(ready)
+
+    def _submit_digests(self):
+        if self.digests is not None:
+            for message, recipients in self.digests.due():
+                self.submit(message, recipients)
+
+    def _next_ready(self):
+        """Wait for new alerts or due retries and return the ids ready to send"""
+        timeout = 1.0
+        if self._retries:
+            timeout = max(0.0, min(timeout, self._retries[0][0] - time.monotonic()))
+
+        ready = []
+        try:
+            ready.append(self._incoming.get(timeout=timeout))
+            while True:
+                ready.append(self._incoming.get_nowait())
+        except queue.Empty:
+            pass
+
+        now = time.monotonic()
+        while self._retries and self._retries[0][0] <= now:
+            ready.append(heapq.heappop(self._retries)[2])
+        return ready
+
+    def _deliver(self, alert_ids):
+        with self._lock:
+            alerts = []
+            for alert in (self._pending[i] for i in alert_ids if i in self._pending):
+                if self._expired(alert):
+                    # Kept retrying for so long that it is stale now
+                    self._drop_expired(alert)
+                else:
+                    alerts.append(alert)
+            if len(alerts) < len(alert_ids):
+                self._save_spool()
+
+        jobs = []
+        for alert in alerts:
+            alert['attempts'] += 1
+            for recipient in list(alert['recipients']):
+                jobs.append((alert, recipient, self._pool.submit(self.send_now, alert['message'], recipient)))
+
+        results = []
+        for alert, recipient, future in jobs:
+            try:
+                delivered = future.result()
+            except Exception as e:
+                log.warning("❌ Error sending to %s: %s", recipient, e)
+                delivered = False
+            results.append((alert, recipient, delivered))
+
+        with self._lock:
+            for alert, recipient, delivered in results:
+                if delivered:
+                    alert['recipients'].remove(recipient)
+                    self.stats['delivered'] += 1
+                else:
+                    self.stats['failed_attempts'] += 1
+
+            for alert in {id(a): a for a, _, _ in results}.values():
+                if not alert['recipients']:
+                    self._pending.pop(alert['id'], None)
+                elif alert['attempts'] >= self.max_attempts:
+                    log.error("❌ Giving up on alert after %d attempts: %s",
+                              alert['attempts'], alert['message'].splitlines()[0])
+                    self._pending.pop(alert['id'], None)
+                    self.stats['dropped'] += 1
+                else:
+                    delay = min(self.max_delay, self.base_delay * 2 ** (alert['attempts'] - 1))
+                    delay *= random.uniform(0.8, 1.2)
+                    log.info("🔁 Retrying alert in %.0fs (%d recipients left)", delay, len(alert['recipients']))
+                    heapq.heappush(self._retries, (time.monotonic() + delay, next(self._seq), alert['id']))
+            self._save_spool()
+
+    # ------------------------------------------------------------------- spool
+
+    def _load_spool(self):
+        if not self.spool_path or not os.path.exists(self.spool_path):
+            return
+        try:
+            with open(self.spool_path, "r", encoding="utf-8") as f:
+                alerts = json.load(f)
+        except (OSError, ValueError) as e:
+            log.error("❌ Could not read alert spool %s: %s", self.spool_path, e)
+            return
+
+        for alert in alerts:
+            if self._expired(alert):
+                self._drop_expired(alert)
+                continue
+            self._pending[alert['id']] = alert
+            heapq.heappush(self._retries, (time.monotonic(), next(self._seq), alert['id']))
+        if self._pending:
+            log.info("📬 Resending %d undelivered alerts from %s", len(self._pending), self.spool_path)
+
+    def _expired(self, alert):
+        return self.max_age is not None and time.time() - alert['created'] > self.max_age
+
+    def _drop_expired(self, alert):
+        # Caller holds self._lock (or is still in __init__)
+        self._pending.pop(alert['id'], None)
+        self.stats['expired'] += 1
+        log.warning("⌛ Dropping alert from %s, older than %.0f min: %s",
+                    time.strftime('%Y-%m-%d %H:%M', time.localtime(alert['created'])),
+                    self.max_age / 60, alert['message'].splitlines()[0])
+
+    def _save_spool(self):
+        # Caller holds self._lock
+        if not self.spool_path:
+            return
+        tmp_path = self.spool_path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(list(self._pending.values()), f, ensure_ascii=False)
+            os.replace(tmp_path, self.spool_path)
+        except OSError as e:
+            log.error("❌ Could not write alert spool %s: %s", self.spool_path, e)
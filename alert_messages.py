@@ -0,0 +1,170 @@
+"""WhatsApp alert texts: templates compiled once, and digests for alert storms.
+
+`AlertTemplates` turns a rule id and its rendered message into the WhatsApp
+text. `AlertCoalescer` keeps a flapping condition (e.g. the grid going down
+and up every few seconds) from sending one message per change: the first
+alert of a group goes out at once, the ones that follow within the window
+are only counted, and when the window closes a single digest ("Grid
+flapped 7 times in 10 min") goes to the recipients instead.
+"""
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+TIME_FORMAT = '%Y-%m-%d %I:%M:%S %p'
+
+# Rule id -> (WhatsApp headline, short label used in digests)
+ALERT_TYPES = {
+    '01': ("⚠️ *INVERTER ALERT – BATTERY DRAINING FAST* ⚡️", "Battery draining fast"),
+    '02': ("🔥 *INVERTER ALERT – BATTERY LOAD LIMIT REACHED* 🚨", "Battery load limit reached"),
+    '03': ("⚠️ *INVERTER ALERT – LOW BATTERY* ⚠️", "Low battery"),
+    '04': ("🚨 *INVERTER ALERT – K-ELECTRIC POWER OUTAGE* 💡❌", "K-Electric power outage"),
+    '05': ("⚡ *INVERTER ALERT – K-ELECTRIC POWER RESTORED* ✅", "K-Electric power restored"),
+    '06': ("🌥️ *INVERTER ALERT – INSUFFICIENT SOLAR POWER* ☀️🔋", "Insufficient solar power"),
+    '07': ("📉 *INVERTER ALERT – BATTERY VOLTAGE FALLING* 🔋", "Battery voltage falling"),
+    '08': ("⏳ *INVERTER ALERT – BATTERY RUNTIME LOW* 🪫", "Battery runtime low"),
+}
+
+ALERT_TEMPLATE = "{title}\n\n{{message}}\n\n⏰ Time: {{time}}"
+DEFAULT_TEMPLATE = "🔋 INVERTER ALERT\n\n{message}\n\nTimestamp: {time}"
+
+# First line of a digest, per rule group ("group" in alert_rules.json)
+DIGEST_SUMMARIES = {
+    'grid': "Grid flapped {count} times in {minutes} min",
+}
+DEFAULT_DIGEST_SUMMARY = "{count} more alerts in {minutes} min"
+DIGEST_TEMPLATE = "🔁 *INVERTER ALERT DIGEST*\n\n{device}{summary}\n{counts}\n\nLast: {last} at {last_time}\n\n⏰ Time: {time}"
+
+
+class AlertTemplates:
+    """Alert texts by rule id, each template compiled to a bound str.format once"""
+
+    def __init__(self, types=ALERT_TYPES):
+        self.labels = {topic: label for topic, (_, label) in types.items()}
+        self._formats = {topic: ALERT_TEMPLATE.format(title=title).format
+                         for topic, (title, _) in types.items()}
+        self._default = DEFAULT_TEMPLATE.format
+        self._digest = DIGEST_TEMPLATE.format
+
+    def render(self, topic, message, when=None):
+        """WhatsApp text for rule `topic`; `when` defaults to now"""
+        stamp = datetime.fromtimestamp(when if when is not None else time.time()).strftime(TIME_FORMAT)
+        return self._formats.get(topic, self._default)(message=message, time=stamp)
+
+    def label(self, topic):
+        return self.labels.get(topic, f"Alert {topic}")
+
+    def render_digest(self, group, counts, last_topic, last_time, seconds, device=None, when=None):
+        """One message for the `counts` ({topic: n}) alerts held back over `seconds`"""
+        summary = DIGEST_SUMMARIES.get(group, DEFAULT_DIGEST_SUMMARY).format(
+            count=sum(counts.values()), minutes=max(1, round(seconds / 60)))
+        return self._digest(
+            device=f"{device}\n" if device else "",
+            summary=summary,
+            counts="\n".join(f"• {self.label(topic)} ×{n}" for topic, n in sorted(counts.items())),
+            last=self.label(last_topic),
+            last_time=datetime.fromtimestamp(last_time).strftime('%I:%M:%S %p'),
+            time=datetime.fromtimestamp(when if when is not None else time.time()).strftime(TIME_FORMAT),
+        )
+
+
+class _Window:
+    __slots__ = ('group', 'device', 'opened', 'closes', 'counts', 'last_topic', 'last_time', 'recipients')
+
+    def __init__(self, group, device, now, window):
+        self.group = group
+        self.device = device
+        self.opened = now
+        self.closes = now + window
+        self.counts = Counter()
+        self.last_topic = None
+        self.last_time = None
+        self.recipients = []
+
+
+class AlertCoalescer:
+    """Merges bursts of related alerts into one digest per window.
+
+    `admit()` is asked for every alert: True means send it now (the first
+    of its group, or coalescing is off), False means it was counted for the
+    digest. `due()` returns the digests of the windows that have closed as
+    (text, recipients); a window that produced a digest is opened again,
+    so a storm that goes on gets one digest per window, and a quiet window
+    ends it. A window of 0 turns coalescing off.
+    """
+
+    def __init__(self, window, templates):
+        self.window = float(window)
+        self.templates = templates
+        self.stats = {'sent_immediately': 0, 'held': 0, 'digests': 0}
+        self._windows = {}
+        self._closed = []
+        self._lock = threading.Lock()
+
+    def admit(self, topic, recipients, group=None, device=None, now=None):
+        now = time.time() if now is None else now
+        if self.window <= 0:
+            self.stats['sent_immediately'] += 1
+            return True
+        key = (device, group or topic)
+        with self._lock:
+            entry = self._windows.get(key)
+            if entry is not None and now >= entry.closes:
+                # Closed but not collected by due() yet
+                if entry.counts:
+                    self._closed.append(self._digest(entry, now))
+                entry = None
+            if entry is None:
+                self._windows[key] = _Window(group or topic, device, now, self.window)
+                self.stats['sent_immediately'] += 1
+                return True
+            entry.counts[topic] += 1
+            entry.last_topic = topic
+            entry.last_time = now
+            entry.recipients.extend(r for r in recipients if r and r not in entry.recipients)
+            self.stats['held'] += 1
+            return False
+
+    def due(self, now=None):
+        """Digests of the windows that closed by `now`, as [(text, recipients)]"""
+        now = time.time() if now is None else now
+        with self._lock:
+            digests, self._closed = self._closed, []
+            for key, entry in list(self._windows.items()):
+                if now < entry.closes:
+                    continue
+                if entry.counts:
+                    digests.append(self._digest(entry, now))
+                    self._windows[key] = _Window(entry.group, entry.device, now, self.window)
+                else:
+                    del self._windows[key]
+        return digests
+
+    def export_state(self):
+        with self._lock:
+            return [{'group': e.group, 'device': e.device, 'opened': e.opened, 'closes': e.closes,
+                     'counts': dict(e.counts), 'last_topic': e.last_topic, 'last_time': e.last_time,
+                     'recipients': list(e.recipients)} for e in self._windows.values()]
+
+    def import_state(self, saved):
+        """Reopen the saved windows, so a restart during a storm does not send its first alert again"""
+        with self._lock:
+            for values in saved:
+                entry = _Window(values['group'], values['device'], values['opened'], 0)
+                entry.closes = values['closes']
+                entry.counts.update(values['counts'])
+                entry.last_topic = values['last_topic']
+                entry.last_time = values['last_time']
+                entry.recipients = list(values['recipients'])
+                self._windows[(entry.device, entry.group)] = entry
+
+    def held_count(self):
+        with self._lock:
+            return sum(sum(entry.counts.values()) for entry in self._windows.values())
+
+    def _digest(self, entry, now):
+        self.stats['digests'] += 1
+        text = self.templates.render_digest(entry.group, entry.counts, entry.last_topic, entry.last_time,
+                                            now - entry.opened, device=entry.device, when=now)
+        return text, entry.recipients
@@ -0,0 +1,214 @@
+import json
+import os
+import re
+from string import Formatter
+
+from qpigs_parser import QPIGS_FIELDS
+from rolling import MetricSpec, MetricsTracker
+
+NUMERIC_FIELDS = frozenset(name for name, kind in QPIGS_FIELDS if kind is not str)
+
+OPERATORS = {'<', '<=', '>', '>=', '==', '!='}
+
+# Record attributes a message can show besides the metrics (the bit strings too)
+MESSAGE_FIELDS = frozenset(name for name, _ in QPIGS_FIELDS) | {'epoch', 'received'}
+
+
+class AlertRule:
+    """One alert rule compiled from its config entry.
+
+    A rule fires when all of its `when` conditions hold, its cooldown has
+    passed and it has fired fewer than `max_repeats` times since its `reset`
+    conditions last held. `start_armed: false` makes a rule wait for its
+    reset first, e.g. "grid restored" should only follow a "grid down".
+    Rules with the same `group` are coalesced into one WhatsApp digest when
+    they fire in a burst (see alert_messages.py).
+    """
+
+    def __init__(self, config, metric_names=()):
+        self.id = str(config['id'])
+        self.key = config.get('key', self.id)
+        self.severity = config.get('severity', 'warning')
+        self.group = config.get('group', self.id)
+        self.recipients = config.get('recipients', 'primary')
+        self.cooldown = float(config.get('cooldown', 0))
+        self.max_repeats = config.get('max_repeats')
+        self.start_armed = config.get('start_armed', True)
+        self.message = check_message(config.get('message', ''), f"rule {self.id} message", metric_names)
+        self.condition = compile_conditions(config['when'], f"rule {self.id} when", metric_names)
+        self.reset = (compile_conditions(config['reset'], f"rule {self.id} reset", metric_names)
+                      if config.get('reset') else None)
+
+    def render(self, sample, metrics=None):
+        return self.message.format_map(SampleFields(sample, metrics))
+
+
+class RuleState:
+    """Mutable per-rule state: repeats since the last reset and when it last fired"""
+
+    __slots__ = ('count', 'last_sent')
+
+    def __init__(self, count=0, last_sent=None):
+        self.count = count
+        self.last_sent = last_sent
+
+
+class Firing:
+    __slots__ = ('rule', 'sample', 'time', 'message')
+
+    def __init__(self, rule, sample, time, message):
+        self.rule = rule
+        self.sample = sample
+        self.time = time
+        self.message = message
+
+
+class SampleFields(dict):
+    """format_map() view of a record's attributes plus the derived metrics"""
+
+    def __init__(self, sample, metrics=None):
+        super().__init__()
+        self.sample = sample
+        self.metrics = metrics or {}
+
+    def __missing__(self, key):
+        if key in self.metrics:
+            value = self.metrics[key]
+            return round(value, 2) if isinstance(value, float) else value
+        return getattr(self.sample, key)
+
+
+def check_message(message, where, metric_names=()):
+    """Return `message` if every {placeholder} in it names a sample field or metric.
+
+    Checked when the rules load, because a bad name would otherwise only
+    fail when the rule fires, after its state has already changed.
+    """
+    try:
+        fields = [name for _, name, _, _ in Formatter().parse(message) if name is not None]
+    except ValueError as e:
+        raise ValueError(f"{where}: {e}") from None
+    for name in fields:
+        # "{battery_voltage:.1f}" is parsed already; "{x.y}" and "{x[0]}" start with the field name
+        base = re.split(r"[.\[]", name, maxsplit=1)[0]
+        if base not in MESSAGE_FIELDS and base not in metric_names:
+            raise ValueError(f"{where}: unknown field {name!r}" if base else
+                             f"{where}: placeholders need a field name")
+    return message
+
+
+def compile_conditions(conditions, where, metric_names=()):
+    """Compile [[field, op, value], ...] into one function (sample, metrics) -> bool.
+
+    Field names and operators are checked against fixed whitelists and values
+    must be numbers, so the generated expression is safe to compile. `between`
+    takes [low, high] and is inclusive. A field may also name a derived
+    metric; a metric that is not available yet (None) makes the term false.
+    """
+    terms = []
+    for condition in conditions:
+        if len(condition) != 3:
+            raise ValueError(f"{where}: expected [field, op, value], got {condition!r}")
+        field, op, value = condition
+        if field in NUMERIC_FIELDS:
+            ref, guard = f"s.{field}", ""
+        elif field in metric_names:
+            ref = f"m[{field!r}]"
+            guard = f"{ref} is not None and "
+        else:
+            raise ValueError(f"{where}: unknown field {field!r}")
+        if op == 'between':
+            low, high = (float(v) for v in value)
+            terms.append(f"({guard}{low!r} <= {ref} <= {high!r})")
+        elif op in OPERATORS:
+            terms.append(f"({guard}{ref} {op} {float(value)!r})")
+        else:
+            raise ValueError(f"{where}: unknown operator {op!r}")
+    if not terms:
+        raise ValueError(f"{where}: no conditions")
+    return eval(compile(f"lambda s, m: {' and '.join(terms)}", where, "eval"), {})
+
+
+class AlertEngine:
+    """Evaluates compiled rules over samples, keeping per-rule state.
+
+    The engine only decides what fires; sending is left to the caller, and
+    `now` is passed in so replays can run on simulated time. Derived metrics
+    (rolling windows, slopes, runtime estimates) are updated on sample time
+    before the rules run.
+    """
+
+    def __init__(self, rules, metric_specs=()):
+        self.rules = rules
+        self.metrics = MetricsTracker(list(metric_specs))
+        self.state = {rule.id: RuleState(0 if rule.start_armed else (rule.max_repeats or 1))
+                      for rule in rules}
+        self._plan = [(rule, self.state[rule.id]) for rule in rules]
+
+    def evaluate(self, sample, now):
+        metrics = self.metrics.update(sample, sample.epoch if sample.epoch is not None else now)
+        fired = []
+        for rule, state in self._plan:
+            if (rule.condition(sample, metrics)
+                    and (rule.max_repeats is None or state.count < rule.max_repeats)
+                    and (state.last_sent is None or now - state.last_sent > rule.cooldown)):
+                state.last_sent = now
+                state.count += 1
+                fired.append(Firing(rule, sample, now, rule.render(sample, metrics)))
+            if rule.reset is not None and rule.reset(sample, metrics):
+                state.count = 0
+        return fired
+
+    def evaluate_batch(self, samples, now):
+        """Evaluate samples in order; `now` is a number or a function sample -> time"""
+        fired = []
+        clock = now if callable(now) else (lambda sample: now)
+        for sample in samples:
+            fired.extend(self.evaluate(sample, clock(sample)))
+        return fired
+
+    def export_state(self):
+        return {rule_id: {'count': s.count, 'last_sent': s.last_sent} for rule_id, s in self.state.items()}
+
+    def import_state(self, saved):
+        for rule_id, values in saved.items():
+            state = self.state.get(rule_id)
+            if state is not None:
+                state.count = values.get('count', state.count)
+                state.last_sent = values.get('last_sent', state.last_sent)
+
+
+def load_rule_config(path):
+    """Read a rules file: JSON, or YAML when PyYAML is installed"""
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith((".yml", ".yaml")):
+            import yaml
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+def build_engine(config):
+    """Compile a rules config ({"metrics": {...}, "rules": [...]}) into an AlertEngine"""
+    metric_specs = [MetricSpec(name, spec) for name, spec in config.get('metrics', {}).items()]
+    for spec in metric_specs:
+        if spec.field not in NUMERIC_FIELDS:
+            raise ValueError(f"metric {spec.name}: unknown field {spec.field!r}")
+        if spec.name in NUMERIC_FIELDS:
+            raise ValueError(f"metric {spec.name}: name clashes with a sample field")
+    metric_names = {spec.name for spec in metric_specs}
+
+    rules = [AlertRule(entry, metric_names) for entry in config['rules']]
+    ids = [rule.id for rule in rules]
+    if len(ids) != len(set(ids)):
+        raise ValueError("duplicate rule ids")
+    return AlertEngine(rules, metric_specs)
+
+
+def load_alert_engine(path=None):
+    """Build the AlertEngine from ALERT_RULES (alert_rules.json by default) or `path`"""
+    return build_engine(load_rule_config(path or default_rules_path()))
+
+
+def default_rules_path():
+    return os.getenv("ALERT_RULES") or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "alert_rules.json")
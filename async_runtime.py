@@ -0,0 +1,248 @@
+"""Run the whole monitor as asyncio tasks in one process.
+
+Alternative entry point to inverter_monitor_mqtt.py with the same
+configuration, endpoints and hooks:
+
+    source readers -> lines -> parsers -> samples -> MQTT / history
+                                       -> alerts  -> MQTT / WaSMS queue
+    WaSMS delivery, web server (HTTP + SSE)
+
+The stages are tasks linked by bounded asyncio.Queues, so a slow stage
+makes the one before it wait (back-pressure) instead of letting memory
+grow. Blocking work stays off the event loop: source reads and QPIGS
+parsing run on executor threads, SQLite writes on one history thread.
+Each device has its own lines queue and parser task, so devices are
+parsed in parallel while the batches of one device stay in order.
+There is no async WSGI server to hand, so waitress (or the Flask dev
+server) runs in a thread as one more supervised task; paho-mqtt keeps
+its own network thread. SIGINT/SIGTERM stop everything in order: the
+readers stop, the queues drain (for at most ASYNC_DRAIN_SECONDS, and not
+at all when a stage has died), then delivery, MQTT and history are
+flushed and closed, and the state checkpoint is written one last time.
+
+    python async_runtime.py
+"""
+import asyncio
+import logging
+import os
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import inverter_monitor_mqtt as monitor
+from charts import ChartCache
+from history_store import open_history_store
+
+log = logging.getLogger("inverter_monitor.async")
+
+QUEUE_SIZE = int(os.getenv("ASYNC_QUEUE_SIZE", "100"))
+PARSE_WORKERS = int(os.getenv("ASYNC_PARSE_WORKERS", "0")) or None
+DRAIN_SECONDS = float(os.getenv("ASYNC_DRAIN_SECONDS", "10"))
+
+_STOP = object()
+
+
+class AsyncRuntime:
+    """The monitor's pipeline as asyncio tasks; `run()` until `stop()`"""
+
+    def __init__(self, registry, queue_size=QUEUE_SIZE, parse_workers=PARSE_WORKERS,
+                 drain_seconds=DRAIN_SECONDS):
+        self.registry = registry
+        self.queue_size = queue_size
+        # One parser task per device, so more threads than devices would never be used
+        self.parse_workers = min(parse_workers or 8, len(registry))
+        self.drain_seconds = drain_seconds
+        self.stats = {'batches': 0, 'read_errors': 0, 'max_lines_queued': 0}
+        self._stopping = None
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.stop)
+            except (NotImplementedError, RuntimeError):
+                # Windows: Ctrl+C still raises KeyboardInterrupt in asyncio.run()
+                pass
+
+        # Readers block in inotify waits or serial round trips, so each device gets its own thread
+        self._readers = ThreadPoolExecutor(max_workers=len(self.registry), thread_name_prefix="reader")
+        self._parsers = ThreadPoolExecutor(max_workers=self.parse_workers, thread_name_prefix="parse")
+        # HistoryStore keeps a connection per thread; one thread keeps writes ordered
+        self._history = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history")
+        self.lines = {device.id: asyncio.Queue(self.queue_size) for device in self.registry}
+        self.samples = asyncio.Queue(self.queue_size)
+        self.alerts = asyncio.Queue(self.queue_size)
+
+        serve_forever, shutdown_server = monitor.create_web_server()
+        monitor.log_endpoints()
+        web = asyncio.create_task(asyncio.to_thread(serve_forever), name="web")
+        delivery = asyncio.create_task(monitor.alert_delivery.run_async(), name="alert-delivery")
+        readers = [asyncio.create_task(self._read_device(device), name=f"read-{device.id}")
+                   for device in self.registry]
+        parsers = [asyncio.create_task(self._parse(device), name=f"parse-{device.id}")
+                   for device in self.registry]
+        consumers = [
+            asyncio.create_task(self._send_alerts(), name="alerts"),
+            asyncio.create_task(self._record_samples(), name="samples"),
+        ]
+        pipeline = parsers + consumers
+        log.info("🔁 Asyncio runtime: %d devices, queues of %d, %d parse threads",
+                 len(self.registry), self.queue_size, self.parse_workers)
+
+        # A crashed stage or server stops the whole process instead of leaving it half alive
+        stopping = asyncio.create_task(self._stopping.wait())
+        done, _ = await asyncio.wait([stopping, web, delivery, *readers, *pipeline],
+                                     return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if task is not stopping and not task.cancelled() and task.exception() is not None:
+                log.error("❌ Task %s failed: %r", task.get_name(), task.exception())
+        log.info("🛑 Shutting down...")
+
+        for task in readers:
+            task.cancel()
+        await asyncio.gather(*readers, return_exceptions=True)
+        # A dead stage leaves the one before it waiting on a full queue, so only drain a whole pipeline
+        if any(task.done() for task in pipeline):
+            log.warning("⚠️ Pipeline incomplete, dropping the queued samples")
+        else:
+            try:
+                await asyncio.wait_for(self._drain(parsers, consumers), self.drain_seconds)
+            except asyncio.TimeoutError:
+                log.warning("⚠️ Queues not drained within %gs, dropping the rest", self.drain_seconds)
+        for task in pipeline:
+            task.cancel()
+        await asyncio.gather(*pipeline, return_exceptions=True)
+
+        monitor.close_live_streams()
+        monitor.alert_delivery.stop()
+        shutdown_server()
+        await asyncio.gather(web, delivery, return_exceptions=True)
+        stopping.cancel()
+        await self._close()
+
+    async def _drain(self, parsers, consumers):
+        """Let the queued work through, in pipeline order"""
+        for queue in self.lines.values():
+            await queue.put(_STOP)
+        await asyncio.gather(*parsers)
+        await self.alerts.put(_STOP)
+        await self.samples.put(_STOP)
+        await asyncio.gather(*consumers)
+
+    def stop(self):
+        if self._stopping is not None:
+            self._stopping.set()
+
+    async def _close(self):
+        loop = asyncio.get_running_loop()
+        if monitor.mqtt_publisher is not None:
+            monitor.mqtt_publisher.stop()
+        if monitor.history_store is not None:
+            await loop.run_in_executor(self._history, monitor.history_store.close)
+        monitor.state_checkpoint.stop()
+        for device in self.registry:
+            device.source.close()
+        # A reader may still be blocked in a wait; it is not worth holding up the exit for
+        self._readers.shutdown(wait=False, cancel_futures=True)
+        self._parsers.shutdown(wait=True)
+        self._history.shutdown(wait=True)
+        log.info("👋 Stopped cleanly")
+
+    async def _read_device(self, device):
+        """Feed a device's new data lines into its lines queue"""
+        loop = asyncio.get_running_loop()
+        lines = self.lines[device.id]
+        # One device can block in read() (inotify wakes it up); several are polled on their interval
+        blocking = len(self.registry) == 1
+        next_due = loop.time()
+        while True:
+            if not blocking:
+                await asyncio.sleep(max(0.0, next_due - loop.time()))
+                next_due = max(next_due + device.interval, loop.time())
+            try:
+                data_lines = await loop.run_in_executor(
+                    self._readers, device.source.read if blocking else device.source.poll)
+            except Exception as e:
+                self.stats['read_errors'] += 1
+                log.error("❌ Error reading from %s source: %s", device.source.name, e)
+                await asyncio.sleep(device.interval)
+                continue
+            if data_lines:
+                # The reader is idle between reads, so this is the position right after these lines
+                await lines.put((data_lines, time.monotonic(), device.source.export_state()))
+                self.stats['max_lines_queued'] = max(self.stats['max_lines_queued'], lines.qsize())
+            if monitor.history_store is not None and device is monitor.primary_device:
+                # Buffered samples still get written when the log goes quiet
+                await loop.run_in_executor(self._history, monitor.history_store.flush_if_due)
+
+    async def _parse(self, device):
+        """Parse on the executor, then run energy model and alert rules and publish, on the loop"""
+        loop = asyncio.get_running_loop()
+        lines = self.lines[device.id]
+        while (item := await lines.get()) is not _STOP:
+            data_lines, queued, position = item
+            batch = await loop.run_in_executor(self._parsers, device.parse, data_lines)
+            if not batch:
+                continue
+            firings = device.evaluate(batch)
+            device.publish(batch)
+            self.stats['batches'] += 1
+            if device is monitor.primary_device:
+                if device.source.last_event_time is None:
+                    monitor.watch_latency.record(time.monotonic() - queued)
+                else:
+                    monitor.watch_latency.record_event(device.source.last_event_time)
+            if firings:
+                await self.alerts.put((device, firings))
+            await self.samples.put((device, batch, position))
+
+    async def _send_alerts(self):
+        """MQTT alert messages and the WaSMS queue; delivery itself is its own task"""
+        while (item := await self.alerts.get()) is not _STOP:
+            monitor.send_device_alerts(*item)
+
+    async def _record_samples(self):
+        loop = asyncio.get_running_loop()
+        while (item := await self.samples.get()) is not _STOP:
+            device, batch, position = item
+            monitor.publish_samples_mqtt(device, batch)
+            if monitor.history_store is not None and device is monitor.primary_device:
+                await loop.run_in_executor(self._history, monitor.history_store.append, batch)
+            # Last stage of the batch: the checkpoint may now resume after it
+            device.source_state = position
+
+    def summary(self):
+        return dict(self.stats, lines_queued=sum(queue.qsize() for queue in self.lines.values()),
+                    samples_queued=self.samples.qsize(), alerts_queued=self.alerts.qsize())
+
+
+def main():
+    log.info("🔋 Inverter Monitoring System Starting (asyncio runtime)...")
+    if not monitor.MULTI_DEVICE and not monitor.data_source.ready():
+        log.error("❌ Data source not available!")
+        return
+    monitor.warm_start()
+    for device in monitor.device_registry:
+        if not device.source.ready():
+            log.warning("⚠️ Device %s not available yet, will keep polling", device.id)
+
+    if monitor.mqtt_publisher is not None:
+        monitor.mqtt_publisher.start()
+    if monitor.HISTORY_ENABLED:
+        monitor.history_store = open_history_store()
+        monitor.chart_cache = ChartCache(monitor.history_store)
+        monitor.state_checkpoint.history = monitor.history_store
+        log.info("🗄️ Recording history to: %s", monitor.history_store.path)
+
+    runtime = AsyncRuntime(monitor.device_registry)
+    monitor.async_runtime = runtime
+    monitor.state_checkpoint.start()
+    try:
+        asyncio.run(runtime.run())
+    except KeyboardInterrupt:
+        log.info("🛑 Interrupted")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Import historical WatchPower Serial-QPIGS.log files into the history store.
+
+Every "YYYY-MM-DD Serial-QPIGS.log" in the debug directory is parsed in a
+process pool with the same QPIGS parser as the live monitor, then written to
+the history database from this process (SQLite has a single writer). Files
+already imported with the same size and mtime are skipped, so the command
+can be re-run safely, e.g. from a nightly scheduled task.
+
+    python backfill.py [--directory DIR] [--db PATH] [--workers N] [--force]
+"""
+import argparse
+import mmap
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from dotenv import load_dotenv
+
+from energy_model import create_energy_model
+from history_store import open_history_store, record_row
+from qpigs_parser import parse_qpigs_line
+
+LOG_NAME = re.compile(r"^\d{4}-\d{2}-\d{2} Serial-QPIGS\.log$")
+
+
+def find_daily_logs(directory):
+    """Sorted paths of the daily QPIGS logs in `directory`"""
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                  if LOG_NAME.match(name))
+
+
+def parse_log_file(path):
+    """Parse one daily log into history rows; runs in a worker process.
+
+    Returns (path, lines_read, rows). Each day gets a fresh energy model,
+    so its battery SoC starts from the voltage curve.
+    """
+    rows = []
+    energy = create_energy_model()
+    lines = 0
+    if os.path.getsize(path) == 0:
+        return path, lines, rows
+
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for raw in iter(mm.readline, b""):
+            lines += 1
+            if b"(" not in raw:
+                continue
+            record = parse_qpigs_line(raw.decode("utf-8", errors="ignore"), received=0)
+            if record is not None and record.epoch is not None:
+                energy.update(record)
+                rows.append(record_row(record))
+    return path, lines, rows
+
+
+def backfill(directory, store, workers=None, force=False):
+    """Import every new or changed daily log in `directory` into `store`"""
+    pending = []
+    for path in find_daily_logs(directory):
+        st = os.stat(path)
+        name = os.path.basename(path)
+        if not force and store.is_imported(name, st.st_size, st.st_mtime):
+            continue
+        pending.append((path, st.st_size, st.st_mtime))
+
+    print(f"📂 {len(pending)} log files to import from {directory}")
+    if not pending:
+        return 0
+
+    started = time.perf_counter()
+    total_lines = total_samples = 0
+    stats = {path: (size, mtime) for path, size, mtime in pending}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(parse_log_file, path) for path, _, _ in pending]
+        for future in as_completed(futures):
+            try:
+                path, lines, rows = future.result()
+            except Exception as e:
+                print(f"❌ Failed to parse log: {e}")
+                continue
+            written = store.append_rows(rows)
+            size, mtime = stats[path]
+            store.mark_imported(os.path.basename(path), size, mtime, len(rows))
+            total_lines += lines
+            total_samples += written
+            print(f"✅ {os.path.basename(path)}: {len(rows)} samples ({written} new)")
+
+    elapsed = time.perf_counter() - started
+    print(f"📊 Imported {total_samples} samples from {total_lines} lines in {elapsed:.1f}s "
+          f"({total_lines / elapsed:,.0f} lines/s)")
+    return total_samples
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--directory", default=os.getenv("DEBUG_DIRECTORY"),
+                        help="WatchPower debug log directory (default: DEBUG_DIRECTORY)")
+    parser.add_argument("--db", default=None, help="history database (default: HISTORY_DB)")
+    parser.add_argument("--workers", type=int, default=None, help="parser processes (default: CPU count)")
+    parser.add_argument("--force", action="store_true", help="re-import files already imported")
+    args = parser.parse_args()
+
+    if not args.directory or not os.path.isdir(args.directory):
+        parser.error("set DEBUG_DIRECTORY or pass --directory")
+
+    store = open_history_store(args.db)
+    try:
+        backfill(args.directory, store, args.workers, args.force)
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
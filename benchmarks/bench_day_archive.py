@@ -0,0 +1,103 @@
+"""Size and load time of columnar day files (.qpc) against the text logs.
+
+Writes `--days` synthetic daily logs, converts them with day_archive, then
+loads a month of battery voltage and PV power both ways: parsing the text
+logs with the QPIGS parser, and opening the day files through numpy.memmap.
+The page cache is warm for both after the first round, so the text side is
+measured at its best; the day files also get a first-touch (open only) time.
+
+    python benchmarks/bench_day_archive.py [--days 30] [--interval 3] [--rounds 3]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic_log import write_day_log  # noqa: E402
+from backfill import find_daily_logs  # noqa: E402
+from day_archive import DayFile, convert_log, day_file_path, find_day_files, load_days  # noqa: E402
+from qpigs_parser import parse_qpigs_lines  # noqa: E402
+
+FIELDS = ('epoch', 'battery_voltage', 'pv_power')
+
+
+def load_text(paths):
+    columns = {field: [] for field in FIELDS}
+    for path in paths:
+        with open(path, "r", errors="ignore") as f:
+            for record in parse_qpigs_lines(f):
+                for field, values in columns.items():
+                    values.append(getattr(record, field))
+    return {field: np.array(values) for field, values in columns.items()}
+
+
+def load_columnar(paths):
+    columns = load_days(paths, FIELDS)
+    # Touch the data so the pages are really read
+    for values in columns.values():
+        float(values.sum())
+    return columns
+
+
+def best_of(rounds, func, *args):
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        result = func(*args)
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--interval", type=int, default=3, help="seconds between samples")
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as logs, tempfile.TemporaryDirectory() as archive:
+        first = date(2025, 10, 1)
+        samples = sum(write_day_log(os.path.join(logs, f"{first + timedelta(days=i)} Serial-QPIGS.log"),
+                                    first + timedelta(days=i), args.interval, seed=i)
+                      for i in range(args.days))
+        log_paths = find_daily_logs(logs)
+
+        started = time.perf_counter()
+        for path in log_paths:
+            convert_log(path, day_file_path(archive, path))
+        convert_seconds = time.perf_counter() - started
+        day_paths = find_day_files(archive)
+
+        text_bytes = sum(os.path.getsize(p) for p in log_paths)
+        day_bytes = sum(os.path.getsize(p) for p in day_paths)
+        print(f"📅 {args.days} days, {samples:,} samples every {args.interval}s")
+        print(f"   text logs  {text_bytes / 1e6:8.1f} MB  {text_bytes / samples:6.1f} B/sample")
+        print(f"   day files  {day_bytes / 1e6:8.1f} MB  {day_bytes / samples:6.1f} B/sample "
+              f"({text_bytes / day_bytes:.1f}x smaller)")
+        print(f"   convert    {convert_seconds:8.2f} s  ({samples / convert_seconds:,.0f} samples/s, one process)")
+
+        started = time.perf_counter()
+        opened = [DayFile(path) for path in day_paths]
+        open_seconds = time.perf_counter() - started
+
+        text_seconds, text = best_of(args.rounds, load_text, log_paths)
+        day_seconds, columnar = best_of(args.rounds, load_columnar, day_paths)
+        single_seconds, _ = best_of(args.rounds, load_columnar, day_paths[:1])
+        for field in FIELDS:
+            assert np.allclose(text[field], columnar[field], atol=0.01), field
+
+        print(f"⏱️ loading {', '.join(FIELDS)} for {len(opened)} days (best of {args.rounds})")
+        print(f"   parse text logs     {text_seconds * 1000:10.1f} ms")
+        print(f"   open day files      {open_seconds * 1000:10.1f} ms  (headers only)")
+        print(f"   memmap + concat     {day_seconds * 1000:10.1f} ms  ({text_seconds / day_seconds:,.0f}x faster)")
+        print(f"   one day, zero-copy  {single_seconds * 1000:10.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Run many simulated inverters through the device pool and check they keep up.
+
+Each device has its own synthetic source (a random walk around the usual
+operating point), alert engine, snapshot and live stream, exactly as in
+multi-device mode, and all of them are scheduled on one DevicePool. The
+process is pinned to a single CPU where the OS allows it.
+
+    python benchmarks/bench_devices.py [--devices 50] [--rate 1] [--seconds 30] [--workers 8]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic_log import qpigs_line  # noqa: E402
+from alert_rules import load_alert_engine  # noqa: E402
+from data_sources import DataSource  # noqa: E402
+from devices import Device, DevicePool, DeviceRegistry  # noqa: E402
+
+
+class SyntheticSource(DataSource):
+    """One fresh QPIGS line per poll, drifting like a real inverter"""
+
+    name = "synthetic"
+
+    def __init__(self, seed, interval):
+        self.rng = random.Random(seed)
+        self.interval = interval
+        self.battery_voltage = self.rng.uniform(24.5, 27.0)
+        self.load = self.rng.randint(200, 1500)
+        self.pv_power = self.rng.randint(0, 2500)
+        self.grid_voltage = 230.0
+
+    def poll(self):
+        rng = self.rng
+        self.battery_voltage = min(28.8, max(21.0, self.battery_voltage + rng.uniform(-0.05, 0.05)))
+        self.load = max(0, self.load + rng.randint(-30, 30))
+        self.pv_power = max(0, min(3000, self.pv_power + rng.randint(-50, 50)))
+        if rng.random() < 0.002:
+            self.grid_voltage = 0.0 if self.grid_voltage else 230.0
+        discharge = 0 if self.grid_voltage or self.pv_power > self.load else self.load // 24
+        self.last_event_time = time.monotonic()
+        return [qpigs_line(datetime.now(), grid_voltage=self.grid_voltage, ac_output_power=self.load,
+                           battery_voltage=round(self.battery_voltage, 2), discharge_current=discharge,
+                           pv_power=self.pv_power, pv_voltage=250.0 if self.pv_power else 0.0)]
+
+
+class TimedPool(DevicePool):
+    """DevicePool that keeps every tick's duration and start lag for percentiles"""
+
+    def __init__(self, devices, workers):
+        super().__init__(devices, workers)
+        self.durations = []
+        self.lags = []
+
+    def _tick(self, device, due):
+        started = time.monotonic()
+        self.lags.append(started - due)
+        super()._tick(device, due)
+        self.durations.append(time.monotonic() - started)
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] if ordered else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--devices", type=int, default=50)
+    parser.add_argument("--rate", type=float, default=1.0, help="samples per second per device")
+    parser.add_argument("--seconds", type=float, default=30.0)
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    if hasattr(os, "sched_setaffinity"):
+        cpu = min(os.sched_getaffinity(0))
+        os.sched_setaffinity(0, {cpu})
+        print(f"📌 Pinned to CPU {cpu}")
+
+    registry = DeviceRegistry([
+        Device(f"inv{i:02d}", SyntheticSource(i, 1.0 / args.rate), load_alert_engine(), site=f"site{i % 5}")
+        for i in range(args.devices)
+    ])
+    alerts = []
+    registry.set_hooks(on_alerts=lambda device, firings: alerts.extend(firings))
+    pool = TimedPool(registry, workers=args.workers)
+
+    cpu_started = time.process_time()
+    wall_started = time.perf_counter()
+    pool.start()
+    time.sleep(args.seconds)
+    pool.stop()
+    wall = time.perf_counter() - wall_started
+    cpu = time.process_time() - cpu_started
+
+    samples = sum(device.stats['total_samples'] for device in registry)
+    expected = args.devices * args.rate * args.seconds
+    print(f"🏭 {args.devices} devices at {args.rate:g} Hz for {args.seconds:g}s on {args.workers} workers")
+    print(f"   samples    {samples} of ~{expected:.0f} expected ({samples / expected * 100:.1f}%)")
+    print(f"   cpu        {cpu:.2f}s in {wall:.2f}s wall = {cpu / wall * 100:.1f}% of one core")
+    print(f"   per sample {cpu / max(1, samples) * 1e6:.0f} µs cpu")
+    print(f"   tick       p50 {percentile(pool.durations, 50) * 1000:.3f} ms  "
+          f"p99 {percentile(pool.durations, 99) * 1000:.3f} ms")
+    print(f"   start lag  p50 {percentile(pool.lags, 50) * 1000:.3f} ms  "
+          f"p99 {percentile(pool.lags, 99) * 1000:.3f} ms")
+    print(f"   overruns   {pool.stats['overruns']}, errors {pool.stats['errors']}, alerts {len(alerts)}")
+    totals = registry.aggregate()['total']
+    print(f"   aggregate  {totals['online']} online, PV {totals['pv_power']} W, load {totals['ac_output_power']} W")
+
+
+if __name__ == "__main__":
+    main()
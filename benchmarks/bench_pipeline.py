@@ -0,0 +1,267 @@
+"""End-to-end benchmark of the ingestion -> alert -> API pipeline, with regression checks.
+
+Writes a synthetic day of Serial-QPIGS.log (solar curve, load spikes and
+grid outages, see synthetic_log.py; `--interval` sets the daily size) and
+times each monitor stage on it on its own, then all of them together:
+
+    copy_and_read_file        copy the whole day log aside and read it
+    get_latest_inverter_data  find the newest data line in a day of lines
+    parse_inverter_data       parse one line into the dashboard dict
+    check_alerts              run the alert rules on one sample
+    api_data                  GET /api/data through Flask's test client
+    end_to_end                append a line, poll, process, GET /api/data
+
+Every stage runs in a fresh process, so its peak RSS is its own. The
+results (throughput, p50/p99 latency, peak RSS) can be saved as JSON and
+compared with an earlier run; a stage that got slower or bigger by more
+than `--threshold` percent is flagged and the exit status is 1.
+
+    python benchmarks/bench_pipeline.py [--interval 3] [--out results.json] [--baseline old.json]
+    python benchmarks/bench_pipeline.py --compare old.json new.json [--threshold 10]
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+from multiprocessing import get_context
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+from synthetic_log import day_samples, write_day_log  # noqa: E402
+
+STAGES = ('copy_and_read_file', 'get_latest_inverter_data', 'parse_inverter_data',
+          'check_alerts', 'api_data', 'end_to_end')
+
+# Metric -> whether a larger value is better, for --compare
+COMPARED = {'per_second': True, 'p50_us': False, 'p99_us': False, 'peak_rss_mb': False}
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] if ordered else 0.0
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kB on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def timed_calls(func, args_list):
+    """Call func(*args) for each args, returning the per-call durations"""
+    durations = []
+    perf_counter = time.perf_counter
+    for args in args_list:
+        started = perf_counter()
+        func(*args)
+        durations.append(perf_counter() - started)
+    return durations
+
+
+def load_monitor(log_dir):
+    """Import the monitor against `log_dir`, quietly and without touching real state"""
+    os.environ.update(
+        DEBUG_DIRECTORY=log_dir,
+        WATCH_MODE="poll",
+        LOG_LEVEL="WARNING",
+        ALERT_SPOOL=os.path.join(log_dir, "alert_spool.json"),
+    )
+    for name in ("MQTT_HOST", "DEVICES_CONFIG", "SEND_WASMS_NUM1", "SEND_WASMS_NUM2"):
+        os.environ.pop(name, None)
+    import inverter_monitor_mqtt as monitor
+    logging.getLogger().setLevel(logging.WARNING)
+    return monitor
+
+
+def run_stage(stage, log_path, options):
+    """Run one stage in this (fresh) process; returns its result dict"""
+    monitor = load_monitor(os.path.dirname(log_path))
+    with open(log_path, "r") as f:
+        lines = f.read().splitlines()
+    extra = {}
+
+    if stage == 'copy_and_read_file':
+        durations = timed_calls(monitor.data_source.copy_and_read_file, [()] * options['rounds'])
+        extra = {'lines_per_call': len(lines), 'mb_per_call': round(os.path.getsize(log_path) / 1e6, 2)}
+    elif stage == 'get_latest_inverter_data':
+        durations = timed_calls(monitor.get_latest_inverter_data, [(lines,)] * options['rounds'])
+        extra = {'lines_per_call': len(lines)}
+    elif stage == 'parse_inverter_data':
+        durations = timed_calls(monitor.parse_inverter_data, [(line,) for line in lines])
+    elif stage == 'check_alerts':
+        records = [monitor.parse_qpigs_line(line) for line in lines]
+        durations = timed_calls(monitor.check_alerts, [(record,) for record in records if record])
+        extra = {'alerts_fired': monitor.alert_coalescer.stats['sent_immediately']
+                 + monitor.alert_coalescer.stats['held']}
+    elif stage == 'api_data':
+        monitor.process_samples(lines[-1:])
+        client = monitor.app.test_client()
+        durations = timed_calls(client.get, [('/api/data',)] * options['requests'])
+    elif stage == 'end_to_end':
+        durations = run_end_to_end(monitor, log_path, options['samples'])
+    else:
+        raise ValueError(f"unknown stage {stage!r}")
+
+    total = sum(durations)
+    return dict({
+        'calls': len(durations),
+        'seconds': round(total, 4),
+        'per_second': round(len(durations) / total, 1) if total else None,
+        'p50_us': round(percentile(durations, 50) * 1e6, 2),
+        'p99_us': round(percentile(durations, 99) * 1e6, 2),
+        'peak_rss_mb': peak_rss_mb(),
+    }, **extra)
+
+
+def run_end_to_end(monitor, log_path, samples):
+    """Append one sample at a time and take it through poll -> process -> /api/data"""
+    client = monitor.app.test_client()
+    source = monitor.data_source
+    source.poll()  # catch up with what is already in the file
+    start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    new_lines = [line for _, line in day_samples(start.date(), interval=1, seed=99)][:samples]
+    durations = []
+    with open(log_path, "a", newline="\n") as f:
+        for line in new_lines:
+            f.write(line + "\n")
+            f.flush()
+            started = time.perf_counter()
+            data_lines = source.poll()
+            if data_lines:
+                monitor.process_samples(data_lines)
+            response = client.get('/api/data')
+            durations.append(time.perf_counter() - started)
+            assert response.status_code == 200 and data_lines, "sample did not reach /api/data"
+    return durations
+
+
+def run_suite(options):
+    with tempfile.TemporaryDirectory() as log_dir:
+        today = date.today()
+        log_path = os.path.join(log_dir, f"{today} Serial-QPIGS.log")
+        samples = write_day_log(log_path, today - timedelta(days=1), options['interval'])
+        print(f"📄 Synthetic day log: {samples:,} samples every {options['interval']}s, "
+              f"{os.path.getsize(log_path) / 1e6:.1f} MB")
+
+        results = {}
+        spawn = get_context("spawn")
+        for stage in options['stages']:
+            # A new process per stage keeps each peak RSS separate
+            with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as pool:
+                results[stage] = pool.submit(run_stage, stage, log_path, options).result()
+            print_stage(stage, results[stage])
+
+    return {
+        'meta': {
+            'time': datetime.now().isoformat(timespec="seconds"),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'samples_per_day': samples,
+            'options': options,
+        },
+        'stages': results,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_stage(stage, result):
+    rss = f"{result['peak_rss_mb']:7.1f} MB" if result['peak_rss_mb'] is not None else "      -"
+    print(f"   {stage:<25} {result['calls']:>7} calls  {result['per_second'] or 0:>12,.1f}/s  "
+          f"p50 {result['p50_us']:>10.1f} us  p99 {result['p99_us']:>10.1f} us  rss {rss}")
+
+
+def compare(baseline, current, threshold):
+    """Print the change of every compared metric; returns the regressions as strings"""
+    regressions = []
+    print(f"📊 {baseline['meta'].get('commit')} -> {current['meta'].get('commit')} "
+          f"(regression threshold {threshold:g}%)")
+    for stage, result in current['stages'].items():
+        before = baseline['stages'].get(stage)
+        if before is None:
+            print(f"   {stage:<25} (not in baseline)")
+            continue
+        changes = []
+        for metric, higher_is_better in COMPARED.items():
+            old, new = before.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) * 100.0 / old
+            worse = -change if higher_is_better else change
+            flag = ""
+            if worse > threshold:
+                flag = " ❌"
+                regressions.append(f"{stage} {metric} {old:g} -> {new:g} ({change:+.1f}%)")
+            changes.append(f"{metric} {change:+6.1f}%{flag}")
+        print(f"   {stage:<25} " + "  ".join(changes))
+    return regressions
+
+
+def load_results(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--interval", type=int, default=3, help="seconds between samples in the day log")
+    parser.add_argument("--rounds", type=int, default=20, help="calls of the whole-log stages")
+    parser.add_argument("--requests", type=int, default=5000, help="/api/data requests")
+    parser.add_argument("--samples", type=int, default=2000, help="samples through the end-to-end stage")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--out", help="write the results as JSON")
+    parser.add_argument("--baseline", help="earlier results to compare this run with")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"),
+                        help="only compare two saved results")
+    parser.add_argument("--threshold", type=float, default=10.0,
+                        help="percent change that counts as a regression (default 10)")
+    args = parser.parse_args()
+
+    if args.compare:
+        baseline, current = (load_results(path) for path in args.compare)
+    else:
+        options = {'interval': args.interval, 'rounds': args.rounds, 'requests': args.requests,
+                   'samples': args.samples, 'stages': args.stages}
+        current = run_suite(options)
+        if args.out:
+            with open(args.out, "w", encoding="utf-8") as f:
+                json.dump(current, f, indent=2)
+            print(f"💾 Results written to {args.out}")
+        if not args.baseline:
+            return
+        baseline = load_results(args.baseline)
+
+    regressions = compare(baseline, current, args.threshold)
+    if regressions:
+        print(f"❌ {len(regressions)} regressions:")
+        for regression in regressions:
+            print(f"   {regression}")
+        sys.exit(1)
+    print("✅ No regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Microbenchmark of the typed QPIGS parser against the old dict-of-strings parser.
+
+The old parser is reproduced below as it was before qpigs_parser.py existed
+(minus its check_alerts call, which is now a separate pipeline stage). Its
+per-line debug print is sent to /dev/null so only formatting cost is counted.
+
+    python benchmarks/bench_qpigs_parser.py [--lines 1000000]
+"""
+import argparse
+import contextlib
+import os
+import sys
+import time
+from datetime import date, datetime
+from itertools import islice
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic_log import day_samples  # noqa: E402
+from qpigs_parser import parse_qpigs_line, parse_qpigs_lines  # noqa: E402
+
+
+def legacy_parse_inverter_data(data_line):
+    """The pre-qpigs_parser implementation of parse_inverter_data"""
+    try:
+        start = data_line.find('(')
+        if start == -1:
+            return None
+
+        data_part = data_line[start+1:].strip()
+        parts = data_part.split()
+
+        print(f"🔍 Parsing {len(parts)} parts: {parts}")
+
+        if len(parts) < 21:
+            return None
+
+        timestamp_str = data_line[1:20] if data_line.startswith('[') else 'Unknown'
+        timestamp_obj = datetime.strptime(timestamp_str, "%Y-%m-%d %H:%M:%S")
+        timestamp_12h = timestamp_obj.strftime("%Y-%m-%d %I:%M:%S %p")
+
+        return {
+            'grid_voltage': parts[0],
+            'grid_frequency': parts[1],
+            'ac_output_voltage': parts[2],
+            'ac_output_frequency': parts[3],
+            'output_apparent_power': parts[4],
+            'ac_output_power': parts[5],
+            'load_percentage': parts[6],
+            'bus_voltage': parts[7],
+            'battery_voltage': parts[8],
+            'battery_charging_current': parts[9],
+            'battery_discharge_current': parts[15],
+            'battery_capacity': parts[10],
+            'heat_sink_temp': parts[11],
+            'pv_voltage': parts[13],
+            'pv_power': parts[19],
+            'reserved': parts[15],
+            'status_bits': parts[16],
+            'fan_battery_offset': parts[17],
+            'eeprom_fw': parts[18],
+            'pv_charging_power': parts[12],
+            'device_status': parts[20],
+            'timestamp': timestamp_12h,
+            'last_updated': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+    except Exception:
+        return None
+
+
+def legacy_alert_fields(parsed):
+    """The float() conversions check_alerts used to redo on every sample"""
+    return (float(parsed.get('ac_output_power', 0)), float(parsed.get('battery_voltage', 0)),
+            float(parsed.get('grid_voltage', 0)), float(parsed.get('pv_power', 0)),
+            float(parsed.get('battery_discharge_current', 0)),
+            float(parsed.get('battery_charging_current', 0)))
+
+
+def run(label, func, lines):
+    start = time.perf_counter()
+    func(lines)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<34} {elapsed:8.2f}s {len(lines) / elapsed:>12,.0f} lines/s")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lines", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    day = [line for _, line in day_samples(date(2025, 10, 11), interval=1)]
+    lines = [day[i % len(day)] for i in range(args.lines)]
+    print(f"Parsing {len(lines):,} synthetic QPIGS lines")
+
+    def legacy(batch):
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            for line in batch:
+                legacy_alert_fields(legacy_parse_inverter_data(line))
+
+    def typed(batch):
+        for line in batch:
+            parse_qpigs_line(line)
+
+    def typed_batch(batch):
+        parse_qpigs_lines(batch)
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for a, b in zip(islice(lines, 1000), parse_qpigs_lines(islice(lines, 1000))):
+            assert legacy_parse_inverter_data(a)['timestamp'] == b.to_dict()['timestamp']
+
+    old = run("legacy parse + float() in alerts", legacy, lines)
+    new = run("parse_qpigs_line", typed, lines)
+    run("parse_qpigs_lines (batch)", typed_batch, lines)
+    print(f"speedup: {old / new:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
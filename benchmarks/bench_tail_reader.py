@@ -0,0 +1,87 @@
+"""Compare the incremental LogTailReader with the old copy+read-everything poll.
+
+Builds a synthetic 24 h Serial-QPIGS.log and, at several points during the
+day, appends one new sample and times a single monitor poll with each
+approach (the log is the size it would be at that hour).
+
+    python benchmarks/bench_tail_reader.py [--interval 3] [--polls 50]
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic_log import day_samples  # noqa: E402
+
+
+def load_monitor(directory):
+    """Import the monitor module pointed at the benchmark directory"""
+    os.environ["DEBUG_DIRECTORY"] = directory
+    with contextlib.redirect_stdout(io.StringIO()):
+        import inverter_monitor_mqtt
+    return inverter_monitor_mqtt
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--interval", type=int, default=3, help="seconds between synthetic samples")
+    parser.add_argument("--polls", type=int, default=50, help="polls timed per checkpoint")
+    args = parser.parse_args()
+
+    lines = [line + "\n" for _, line in day_samples(date(2025, 10, 11), args.interval)]
+    checkpoints = [1, 6, 12, 18, 24]
+
+    with tempfile.TemporaryDirectory() as directory:
+        monitor = load_monitor(directory)
+        from data_sources import LogTailSource
+        from log_tail import LogTailReader
+
+        path = os.path.join(directory, "2025-10-11 Serial-QPIGS.log")
+        source = LogTailSource(directory, watch_mode="poll")
+        source.file_path = path
+
+        print(f"{'hour':>4} {'log size':>10} {'copy+read ms':>13} {'tail ms':>9} {'speedup':>8}")
+        written = 0
+        for hour in checkpoints:
+            target = min(len(lines), len(lines) * hour // 24) - args.polls
+            with open(path, "a") as f:
+                f.writelines(lines[written:target])
+            written = target
+
+            reader = LogTailReader()
+            reader.read_new_lines(path)
+
+            copy_total = tail_total = 0.0
+            sink = io.StringIO()
+            for _ in range(args.polls):
+                with open(path, "a") as f:
+                    f.write(lines[written])
+                written += 1
+
+                with contextlib.redirect_stdout(sink):
+                    start = time.perf_counter()
+                    latest = monitor.get_latest_inverter_data(source.copy_and_read_file())
+                    copy_total += time.perf_counter() - start
+
+                    start = time.perf_counter()
+                    tailed = monitor.get_latest_inverter_data(reader.read_new_lines(path))
+                    tail_total += time.perf_counter() - start
+                sink.seek(0)
+                sink.truncate()
+
+                assert latest == tailed, (latest, tailed)
+
+            size_mb = os.path.getsize(path) / 1e6
+            copy_ms = copy_total / args.polls * 1000
+            tail_ms = tail_total / args.polls * 1000
+            print(f"{hour:>4} {size_mb:>8.2f}MB {copy_ms:>13.3f} {tail_ms:>9.3f} {copy_ms / tail_ms:>7.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""HTTP load test for /api/data.
+
+Hits a running server, or starts the app in-process with the chosen server,
+from several keep-alive connections and reports requests/sec.
+
+    python benchmarks/load_test.py --url http://192.168.18.101:5000/api/data
+    python benchmarks/load_test.py --serve dev          # Flask dev server
+    python benchmarks/load_test.py --serve waitress --etag
+"""
+import argparse
+import contextlib
+import http.client
+import io
+import logging
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def serve_in_background(server):
+    """Start the monitor's Flask app on localhost with `server` ("dev" or "waitress")"""
+    os.environ.setdefault("DEBUG_DIRECTORY", tempfile.gettempdir())
+    with contextlib.redirect_stdout(io.StringIO()):
+        import inverter_monitor_mqtt as monitor
+    from synthetic_log import qpigs_line
+    from datetime import datetime
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        monitor.process_samples([qpigs_line(datetime.now())])
+
+    port = free_port()
+    if server == "waitress":
+        from waitress import serve
+        target = lambda: serve(monitor.app, host="127.0.0.1", port=port, threads=16, _quiet=True)  # noqa: E731
+    else:
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+        target = lambda: monitor.app.run(host="127.0.0.1", port=port, threaded=True)  # noqa: E731
+    threading.Thread(target=target, daemon=True).start()
+
+    for _ in range(100):
+        with contextlib.suppress(OSError), socket.create_connection(("127.0.0.1", port), timeout=0.1):
+            break
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}/api/data"
+
+
+def worker(url, deadline, use_etag, latencies, statuses):
+    parts = urlsplit(url)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=10)
+    etag = None
+    while time.perf_counter() < deadline:
+        headers = {"If-None-Match": etag} if use_etag and etag else {}
+        start = time.perf_counter()
+        try:
+            conn.request("GET", parts.path or "/", headers=headers)
+            response = conn.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            statuses["error"] = statuses.get("error", 0) + 1
+            conn.close()
+            conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=10)
+            continue
+        latencies.append(time.perf_counter() - start)
+        statuses[response.status] = statuses.get(response.status, 0) + 1
+        etag = response.getheader("ETag") or etag
+        if response.getheader("Connection", "").lower() == "close":
+            conn.close()
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="URL of a running /api/data endpoint")
+    parser.add_argument("--serve", choices=("dev", "waitress"), help="start the app in-process instead")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--etag", action="store_true", help="send If-None-Match like a polling dashboard")
+    args = parser.parse_args()
+
+    if not args.url and not args.serve:
+        parser.error("pass --url or --serve")
+    url = args.url or serve_in_background(args.serve)
+
+    latencies, statuses = [], {}
+    deadline = time.perf_counter() + args.duration
+    threads = [threading.Thread(target=worker, args=(url, deadline, args.etag, latencies, statuses))
+               for _ in range(args.clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    latencies.sort()
+    total = len(latencies)
+    print(f"{url} ({args.serve or 'external'}, {args.clients} clients, etag={'on' if args.etag else 'off'})")
+    print(f"  requests/sec: {total / args.duration:,.0f}")
+    if total:
+        print(f"  latency p50: {statistics.median(latencies) * 1000:.2f} ms, "
+              f"p99: {latencies[int(total * 0.99) - 1] * 1000:.2f} ms")
+    print(f"  status counts: {statuses}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Synthetic WatchPower Serial-QPIGS.log generator used by the benchmarks"""
+import math
+import random
+from datetime import datetime, timedelta
+
+
+def qpigs_line(ts, grid_voltage=230.0, ac_output_power=450, battery_voltage=26.4,
+               charging_current=0, discharge_current=0, pv_power=0, pv_voltage=0.0):
+    """Build one log line in the same shape WatchPower writes for a QPIGS response"""
+    grid_frequency = 50.0 if grid_voltage > 0 else 0.0
+    apparent_power = int(ac_output_power * 1.12)
+    pv_current = pv_power / pv_voltage if pv_voltage else 0.0
+    device_status = "101" if grid_voltage > 0 else ("110" if pv_power > 0 else "010")
+    return (
+        f"[{ts:%Y-%m-%d %H:%M:%S}] "
+        f"({grid_voltage:05.1f} {grid_frequency:04.1f} 230.0 50.0 "
+        f"{apparent_power:04d} {ac_output_power:04d} {ac_output_power * 100 // 3000:03d} 390 "
+        f"{battery_voltage:05.2f} {charging_current:03d} {max(0, min(100, int((battery_voltage - 21) * 13))):03d} 0041 "
+        f"{pv_current:04.1f} {pv_voltage:05.1f} {battery_voltage:05.2f} {discharge_current:05d} "
+        f"00010110 00 00 {pv_power:05d} {device_status}"
+    )
+
+
+def day_samples(day, interval=3, seed=1):
+    """Yield (timestamp, line) pairs for a full day of samples every `interval` seconds.
+
+    The profile has a solar curve around noon, a few grid outages and
+    occasional discharge spikes so alert paths get exercised too.
+    """
+    rng = random.Random(seed)
+    start = datetime(day.year, day.month, day.day)
+    outages = [(rng.randint(0, 86400 - 7200), rng.randint(600, 7200)) for _ in range(3)]
+    battery_voltage = 26.8
+    for second in range(0, 86400, interval):
+        ts = start + timedelta(seconds=second)
+        sun = max(0.0, math.sin((second / 86400 - 0.25) * 2 * math.pi))
+        pv_power = int(3200 * sun * rng.uniform(0.85, 1.0))
+        pv_voltage = 110.0 + 20 * sun if pv_power else 0.0
+        load = rng.randint(300, 1200)
+        if rng.random() < 0.001:
+            load = rng.randint(2200, 2600)
+        grid_down = any(s <= second < s + d for s, d in outages)
+        grid_voltage = 0.0 if grid_down else rng.uniform(215, 240)
+
+        charging = discharge = 0
+        if grid_down and load > pv_power:
+            discharge = int((load - pv_power) / max(battery_voltage, 1))
+            battery_voltage = max(21.5, battery_voltage - 0.00005 * discharge)
+        elif pv_power > load or not grid_down:
+            charging = int(max(0, pv_power - load) / max(battery_voltage, 1))
+            battery_voltage = min(28.4, battery_voltage + 0.0001 * (charging + 1))
+
+        yield ts, qpigs_line(ts, grid_voltage, load, battery_voltage, charging,
+                             discharge, pv_power, pv_voltage)
+
+
+def write_day_log(path, day, interval=3, seed=1):
+    """Write a full synthetic day log to `path` and return the number of samples written"""
+    count = 0
+    with open(path, "w", newline="\n") as f:
+        for _, line in day_samples(day, interval, seed):
+            f.write(line + "\n")
+            count += 1
+    return count
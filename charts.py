@@ -0,0 +1,136 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from history_store import ROLLUP_STEPS
+
+# Chart ranges offered by /api/chart, in seconds
+CHART_RANGES = {
+    '1h': 3600,
+    '24h': 86400,
+    '7d': 7 * 86400,
+}
+
+MAX_WIDTH = 2000
+
+# Read at least this many source points per output point, so LTTB has peaks to choose from
+OVERSAMPLE = 4
+
+
+def lttb(x, y, threshold):
+    """Largest-Triangle-Three-Buckets downsampling of (x, y) to `threshold` points.
+
+    Keeps the first and last point and, from each of the threshold - 2
+    equal-count buckets in between, the point that forms the largest
+    triangle with the point kept from the previous bucket and the average
+    of the next one, so peaks and dips survive. Bucket edges and averages
+    are computed for all buckets at once; only the choice of point walks
+    the buckets in order, since each depends on the previous choice.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return x, y
+
+    edges = np.floor(np.linspace(1, n - 1, threshold - 1)).astype(np.int64)
+    counts = np.diff(edges)
+    # Average of each bucket (the "next bucket" point for the one before it), plus the last point
+    avg_x = np.append(np.add.reduceat(x[1:n - 1], edges[:-1] - 1) / counts, x[-1])
+    avg_y = np.append(np.add.reduceat(y[1:n - 1], edges[:-1] - 1) / counts, y[-1])
+
+    keep = np.empty(threshold, dtype=np.int64)
+    keep[0] = 0
+    keep[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        ax, ay = x[a], y[a]
+        area = np.abs((ax - avg_x[i + 1]) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (avg_y[i + 1] - ay))
+        a = lo + int(area.argmax())
+        keep[i + 1] = a
+    return x[keep], y[keep]
+
+
+def choose_source_step(span, width):
+    """Coarsest rollup step (0 = raw samples) that still gives OVERSAMPLE points per pixel"""
+    fitting = [step for step in ROLLUP_STEPS if span / step >= width * OVERSAMPLE]
+    return max(fitting) if fitting else 0
+
+
+def load_series(store, field, start, end, step):
+    """(t, value) arrays of `field`, raw samples or rollup averages; NULLs are dropped"""
+    if step == 0:
+        rows = store.sample_rows([field], start, end)
+    else:
+        rows = [(bucket, avg) for bucket, _, avg in store.rollup_rows(step, [field], start, end)]
+    data = np.array(rows, dtype=np.float64).reshape(-1, 2)
+    data = data[~np.isnan(data[:, 1])]
+    return data[:, 0], data[:, 1]
+
+
+class ChartCache:
+    """Downsampled chart series, cached per (field, range, width) with LRU eviction.
+
+    The end of the range is rounded up to a multiple of one output point's
+    worth of time, so repeated requests inside that window (every open
+    dashboard refreshing) share one entry, and the chart still moves on as
+    new samples arrive. Entries are stored as ready-to-send JSON.
+    """
+
+    def __init__(self, store, maxsize=64):
+        self.store = store
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, field, range_name, width, now=None):
+        if range_name not in CHART_RANGES:
+            raise ValueError(f"Unknown chart range {range_name!r} (use {', '.join(CHART_RANGES)})")
+        span = CHART_RANGES[range_name]
+        width = max(10, min(MAX_WIDTH, int(width)))
+        resolution = max(1, span // width)
+        end = int(now if now is not None else time.time()) // resolution * resolution + resolution
+        key = (field, range_name, width, end)
+
+        with self._lock:
+            chart = self._entries.get(key)
+            if chart is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return chart
+            self.misses += 1
+
+        chart = self._build(field, range_name, width, end - span, end)
+        with self._lock:
+            self._entries[key] = chart
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return chart
+
+    def _build(self, field, range_name, width, start, end):
+        source = choose_source_step(end - start, width)
+        t, v = load_series(self.store, field, start, end, source)
+        t, v = lttb(t, v, width)
+        t = t.astype(np.int64)
+        # Times as offsets from the previous point keep the payload small
+        return json.dumps({
+            'field': field,
+            'range': range_name,
+            'width': width,
+            'from': start,
+            'to': end,
+            'source_step': source,
+            't0': int(t[0]) if len(t) else start,
+            'dt': np.diff(t).tolist(),
+            'v': np.round(v, 2).tolist(),
+        }, separators=(',', ':'))
+
+    def stats(self):
+        return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,153 @@
+"""Small on-disk checkpoint of the monitor's live state, for fast warm restarts.
+
+Every few seconds `StateCheckpoint` writes, per device, where its source is
+up to (the log offset), the last published snapshot, the alert rule state
+(repeat counts and cooldowns), the rolling metric windows and the energy
+model (SoC, today's kWh), plus the open WhatsApp digest windows. The file
+is replaced atomically, so a crash leaves either the old or the new one.
+
+After a restart `restore()` puts all of it back before anything else runs:
+the dashboard serves the last snapshot straight away, a grid outage that
+was already reported is not reported again, and the log is tailed from
+the saved offset. That offset is the one after the last batch the
+pipeline fully processed, and history is flushed before it is written,
+so even after a crash no sample before it is missing. Alerts not yet delivered are not part of it; they are in
+AlertDelivery's spool, which is written on every change anyway.
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+VERSION = 1
+
+
+class StateCheckpoint:
+    """Periodically saves and, at startup, restores the state of a DeviceRegistry"""
+
+    def __init__(self, path, registry, coalescer=None, interval=5.0, history=None):
+        self.path = path
+        self.registry = registry
+        self.coalescer = coalescer
+        # HistoryStore, flushed before an offset is saved so no buffered sample is behind it
+        self.history = history
+        self.interval = interval
+        self.stats = {'saves': 0, 'unchanged': 0, 'errors': 0, 'last_save_ms': None, 'restored': False}
+        self._last_body = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def collect(self):
+        devices = {}
+        for device in self.registry:
+            devices[device.id] = {
+                # Recorded by the pipeline after each batch, never ahead of what was processed
+                'source': device.source_state or {},
+                # The published snapshot is an immutable copy, so this never races the pipeline
+                'data': device.snapshot.current.data,
+                'rules': device.engine.export_state(),
+                'metrics': device.engine.metrics.export_state(),
+                'energy': device.energy.export_state(),
+            }
+        state = {'version': VERSION, 'saved': time.time(), 'devices': devices}
+        if self.coalescer is not None:
+            state['alert_digests'] = self.coalescer.export_state()
+        return state
+
+    def save(self):
+        """Write the checkpoint if anything changed since the last one; returns True if written"""
+        with self._lock:
+            started = time.perf_counter()
+            state = self.collect()
+            # Every batch behind the saved offsets was appended before collect(), so this covers it
+            if self.history is not None:
+                self.history.flush()
+            saved = state.pop('saved')
+            body = json.dumps(state, ensure_ascii=False, separators=(',', ':'))
+            if body == self._last_body:
+                self.stats['unchanged'] += 1
+                return False
+            state['saved'] = saved
+            tmp_path = self.path + ".tmp"
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(state, f, ensure_ascii=False, separators=(',', ':'))
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                self.stats['errors'] += 1
+                log.error("❌ Could not write state checkpoint %s: %s", self.path, e)
+                return False
+            self._last_body = body
+            self.stats['saves'] += 1
+            self.stats['last_save_ms'] = round((time.perf_counter() - started) * 1000, 2)
+            return True
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            log.error("❌ Could not read state checkpoint %s: %s", self.path, e)
+            return None
+        if state.get('version') != VERSION:
+            log.warning("⚠️ Ignoring state checkpoint %s (version %s)", self.path, state.get('version'))
+            return None
+        return state
+
+    def restore(self):
+        """Put the saved state back into the devices; returns True if there was a checkpoint"""
+        state = self.load()
+        if state is None:
+            return False
+        age = time.time() - state.get('saved', 0)
+        for device_id, saved in state['devices'].items():
+            device = self.registry.get(device_id)
+            if device is None:
+                continue
+            try:
+                device.engine.import_state(saved.get('rules', {}))
+                device.engine.metrics.import_state(saved.get('metrics', {}))
+                device.energy.import_state(saved.get('energy', {}))
+                if saved.get('data'):
+                    device.data.update(saved['data'])
+                    device.snapshot.publish(device.data)
+                    device.broadcaster.publish(device.data)
+                resumed = device.source.import_state(saved.get('source', {}))
+                device.source_state = saved.get('source') if resumed else None
+            except (KeyError, TypeError, ValueError) as e:
+                log.error("❌ Could not restore state of device %s: %s", device_id, e)
+                continue
+            log.info("♻️ Restored %s from a %.0fs old checkpoint (%s)", device_id, age,
+                     "resuming log at saved offset" if resumed else "source starts fresh")
+        if self.coalescer is not None:
+            self.coalescer.import_state(state.get('alert_digests', []))
+        self.stats['restored'] = True
+        return True
+
+    def start(self):
+        if self._thread is None and self.interval > 0:
+            self._thread = threading.Thread(target=self._run, name="checkpoint", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop the writer and save one last time"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(5)
+            self._thread = None
+        self.save()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.save()
+            except Exception as e:
+                self.stats['errors'] += 1
+                log.exception("❌ State checkpoint failed: %s", e)
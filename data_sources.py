@@ -0,0 +1,434 @@
+import logging
+import os
+import shutil
+import time
+from datetime import datetime
+
+from log_tail import LogTailReader
+from log_watcher import create_watcher
+import metrics
+from voltronic import ProtocolError, build_command, parse_response
+
+log = logging.getLogger(__name__)
+
+READ_SECONDS = metrics.histogram(
+    "inverter_source_read_seconds", "Time spent reading new samples from the data source", ["source"])
+READ_BYTES = metrics.histogram(
+    "inverter_source_read_bytes", "Bytes read from the data source per poll", ["source"],
+    buckets=metrics.BYTES_BUCKETS)
+SOURCE_ERRORS = metrics.counter(
+    "inverter_source_errors_total", "Failed data source reads", ["source", "kind"])
+SAMPLES_SKIPPED = metrics.counter(
+    "inverter_source_samples_skipped_total",
+    "Samples dropped when a log is recovered or re-read (only the newest one is processed)")
+_READ_SECONDS_LOG = READ_SECONDS.labels("log")
+_READ_BYTES_LOG = READ_BYTES.labels("log")
+_READ_SECONDS_SERIAL = READ_SECONDS.labels("serial")
+_READ_BYTES_SERIAL = READ_BYTES.labels("serial")
+
+DATA_SOURCES = ('log', 'serial')
+
+
+class DataSource:
+    """Where the monitor gets its QPIGS samples from.
+
+    `poll()` returns whatever samples are available right now as data lines
+    in the WatchPower log format ("[YYYY-MM-DD HH:MM:SS] (<QPIGS payload>"),
+    so every source feeds the same parser and pipeline; it returns an empty
+    list when there is nothing new. `read()` first waits for the source's
+    next sample, for the single-device monitor loop, while the device pool
+    calls `poll()` every `interval` seconds instead. `last_event_time` is
+    the monotonic time the newest data arrived, for the latency stats.
+    """
+
+    name = "source"
+    interval = 5.0
+    last_event_time = None
+
+    def describe(self):
+        return self.name
+
+    def ready(self):
+        """Whether the source looks usable at startup"""
+        return True
+
+    def wait(self):
+        time.sleep(self.interval)
+
+    def read(self):
+        self.wait()
+        return self.poll()
+
+    def poll(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def export_state(self):
+        """Where the source is up to, for the state checkpoint (JSON-serializable)"""
+        return {}
+
+    def import_state(self, saved):
+        """Continue from export_state() after a restart; returns True if it could"""
+        return False
+
+
+def iter_data_lines(lines):
+    """Yield every inverter data line (with parentheses) in file order"""
+    for line in lines:
+        line = line.strip()
+        if line and '(' in line:
+            yield line
+
+
+def is_qpigs_log(filename):
+    """Filter watcher events down to the WatchPower QPIGS logs (not our temp copy)"""
+    return filename.endswith("Serial-QPIGS.log") and not filename.startswith("temp_")
+
+
+class LogTailSource(DataSource):
+    """Follows today's WatchPower "Serial-QPIGS.log", switching files at midnight.
+
+    New lines are read incrementally with LogTailReader. When the log cannot
+    be opened directly (WatchPower holding it locked), the whole file is
+    copied aside and only its newest sample is used.
+    """
+
+    name = "log"
+
+    def __init__(self, directory, watch_mode="auto", interval=5, tail_reader=None):
+        self.directory = directory
+        self.interval = interval
+        self.tail_reader = tail_reader or LogTailReader()
+        self.watcher = create_watcher(watch_mode, directory, interval, is_qpigs_log)
+        self.file_path = self.todays_path()
+        self.temp_file_path = os.path.join(directory, "temp_Serial-QPIGS.log")
+        self.file_read_attempts = 0
+        self.last_size = 0
+        self.last_raw_data = None
+        self.read_from_start = False
+        self._first = True
+
+    def describe(self):
+        return f"log {self.file_path} ({self.watcher.mode} watcher)"
+
+    @property
+    def last_event_time(self):
+        return self.watcher.last_event_time
+
+    def todays_path(self):
+        """Get today's QPIGS file path"""
+        today = datetime.now().strftime("%Y-%m-%d")
+        return os.path.join(self.directory, f"{today} Serial-QPIGS.log")
+
+    def ready(self):
+        return os.path.exists(self.file_path)
+
+    def wait(self):
+        if not self._first:
+            self.watcher.wait(self.interval)
+        self._first = False
+
+    def poll(self):
+        try:
+            current_file_path = self.todays_path()
+            if current_file_path != self.file_path:
+                log.info("🔄 Date changed, switching to: %s", current_file_path)
+                self.file_path = current_file_path
+                self.last_size = 0
+                self.read_from_start = True
+
+            if not os.path.exists(self.file_path):
+                log.warning("❌ Today's QPIGS file not found!")
+                return []
+
+            size = os.path.getsize(self.file_path)
+            log.debug("📏 File size: %d bytes (previous: %d)", size, self.last_size)
+        except Exception as e:
+            log.error("❌ Error checking file: %s", e)
+            return []
+
+        if size == self.last_size and self.last_raw_data is not None:
+            log.debug("ℹ️ No file change detected")
+            return []
+
+        log.debug("🔄 File changed or no previous data - processing...")
+        self.last_size = size
+
+        started = time.perf_counter()
+        bytes_before = self.tail_reader.bytes_read
+        lines = self.tail_reader.read_new_lines(self.file_path, from_start=self.read_from_start)
+        read_bytes = self.tail_reader.bytes_read - bytes_before
+        if lines is not None:
+            self.read_from_start = False
+            latest_only = self.tail_reader.recovered
+            log.debug("📄 Read %d new lines (offset %d)", len(lines), self.tail_reader.offset)
+        else:
+            # Direct read failed (e.g. file locked by WatchPower), fall back to a full copy
+            lines = self.copy_and_read_file()
+            latest_only = True
+            read_bytes = size
+        _READ_SECONDS_LOG.observe(time.perf_counter() - started)
+        _READ_BYTES_LOG.observe(read_bytes)
+
+        if lines is None:
+            SOURCE_ERRORS.labels("log", "read").inc()
+            log.error("❌ Failed to read file")
+            return []
+
+        data_lines = list(iter_data_lines(lines))
+        if latest_only:
+            # Recovered or re-read history: only the newest sample is live
+            if len(data_lines) > 1:
+                SAMPLES_SKIPPED.inc(len(data_lines) - 1)
+            data_lines = data_lines[-1:]
+        if data_lines:
+            self.last_raw_data = data_lines[-1]
+        else:
+            log.debug("🔍 No inverter data lines found in new data; last lines read: %r", lines[-5:])
+        return data_lines
+
+    def copy_and_read_file(self):
+        """Copy the source file to temp location and read it"""
+        try:
+            if os.path.exists(self.temp_file_path):
+                os.remove(self.temp_file_path)
+
+            shutil.copy2(self.file_path, self.temp_file_path)
+            self.file_read_attempts += 1
+
+            with open(self.temp_file_path, "r", errors="ignore") as f:
+                lines = f.read().splitlines()
+
+            log.debug("📋 Copied file (attempt #%d), read %d lines from temp file",
+                      self.file_read_attempts, len(lines))
+            return lines
+
+        except Exception as e:
+            log.error("❌ Error copying/reading file: %s", e)
+            return None
+
+    def close(self):
+        self.watcher.close()
+
+    def export_state(self):
+        reader = self.tail_reader
+        if reader.path != self.file_path or reader.handle is None:
+            return {}
+        # Resume from the start of a held-back partial line, so it is read again whole
+        return {'path': reader.path, 'offset': reader.offset - len(reader.partial),
+                'file_id': list(reader.file_id)}
+
+    def import_state(self, saved, max_gap=None):
+        """Resume tailing today's log at the saved offset.
+
+        Only when the log is the same file and at most `max_gap` bytes
+        (default: the reader's recovery window) were written while the
+        monitor was down; otherwise the usual recovery from EOF applies, so
+        a long outage does not replay hours of stale samples into the alerts.
+        """
+        path = saved.get('path')
+        if not path or path != self.todays_path() or not os.path.exists(path):
+            return False
+        max_gap = max_gap if max_gap is not None else self.tail_reader.recover_bytes
+        if os.path.getsize(path) - saved['offset'] > max_gap:
+            return False
+        if not self.tail_reader.resume(path, saved['offset'], saved.get('file_id')):
+            return False
+        self.file_path = path
+        self.read_from_start = False
+        return True
+
+
+class SerialQpigsSource(DataSource):
+    """Polls the inverter directly over its serial port with QPIGS.
+
+    Speaks the Voltronic/Axpert protocol through pyserial, without
+    WatchPower in between. Polls run on a fixed schedule of `interval`
+    seconds (1 Hz by default, faster is fine), and a response is
+    collected with short non-blocking reads, so a silent inverter costs at
+    most `response_timeout`. On errors the port is closed and reopened with
+    backoff. With `log_directory` set, every sample is also appended to a
+    daily "Serial-QPIGS.log" there, so backfill and replay keep working.
+    """
+
+    name = "serial"
+    MAX_MISSED = 3
+
+    def __init__(self, port, baudrate=2400, interval=1.0, response_timeout=1.5, log_directory=None):
+        self.port = port
+        self.baudrate = baudrate
+        self.interval = interval
+        self.response_timeout = response_timeout
+        self.log_directory = log_directory
+        self.command = build_command("QPIGS")
+        self.last_event_time = None
+        self.stats = {'polls': 0, 'samples': 0, 'timeouts': 0, 'crc_errors': 0, 'reopens': 0}
+        self._serial = None
+        self._next_poll = time.monotonic()
+        self._retry_delay = 1.0
+        self._retry_at = 0.0
+        self._missed = 0
+        self._log_file = None
+        self._log_day = None
+
+    def describe(self):
+        return f"serial {self.port} @ {self.baudrate} baud, every {self.interval}s"
+
+    def ready(self):
+        try:
+            self._open()
+        except Exception as e:
+            log.error("❌ Cannot open serial port %s: %s", self.port, e)
+            return False
+        return True
+
+    def _open(self):
+        if self._serial is None:
+            import serial
+            # timeout=0: reads return immediately with whatever bytes are waiting
+            self._serial = serial.Serial(self.port, self.baudrate, bytesize=8, parity="N",
+                                         stopbits=1, timeout=0, write_timeout=1)
+            log.info("🔌 Opened serial port %s", self.port)
+        return self._serial
+
+    def _reset_port(self):
+        if self._serial is not None:
+            try:
+                self._serial.close()
+            except Exception:
+                pass
+            self._serial = None
+        self.stats['reopens'] += 1
+
+    def query(self, port):
+        """Send QPIGS and return the verified response payload"""
+        port.reset_input_buffer()
+        port.write(self.command)
+        deadline = time.monotonic() + self.response_timeout
+        frame = bytearray()
+        while True:
+            chunk = port.read(port.in_waiting or 1)
+            if chunk:
+                frame += chunk
+                end = frame.find(b"\r")
+                if end != -1:
+                    return parse_response(bytes(frame[:end + 1]))
+            elif time.monotonic() >= deadline:
+                self.stats['timeouts'] += 1
+                raise TimeoutError(f"no QPIGS response within {self.response_timeout}s")
+            else:
+                # Wait roughly one character time at the port's baud rate
+                time.sleep(min(0.005, 10.0 / self.baudrate))
+
+    def wait(self):
+        delay = self._next_poll - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def poll(self):
+        if time.monotonic() < self._retry_at:
+            # Still backing off after a port error
+            return []
+        # Fixed schedule; if a poll overran, start the next one right away
+        self._next_poll = max(self._next_poll + self.interval, time.monotonic())
+
+        self.stats['polls'] += 1
+        started = time.perf_counter()
+        try:
+            payload = self.query(self._open())
+        except ProtocolError as e:
+            self.stats['crc_errors'] += 1
+            SOURCE_ERRORS.labels("serial", "crc").inc()
+            log.warning("⚠️ Bad QPIGS response: %s", e)
+            return []
+        except TimeoutError as e:
+            # A missed answer is usually a glitch; only reopen the port if it keeps happening
+            self._missed += 1
+            SOURCE_ERRORS.labels("serial", "timeout").inc()
+            log.warning("⚠️ %s (%d in a row)", e, self._missed)
+            if self._missed >= self.MAX_MISSED:
+                self._reset_port()
+                self._missed = 0
+            return []
+        except Exception as e:
+            SOURCE_ERRORS.labels("serial", "port").inc()
+            log.error("❌ Serial error on %s: %s, reopening in %.0fs", self.port, e, self._retry_delay)
+            self._reset_port()
+            self._retry_at = self._next_poll = time.monotonic() + self._retry_delay
+            self._retry_delay = min(self._retry_delay * 2, 60.0)
+            return []
+
+        _READ_SECONDS_SERIAL.observe(time.perf_counter() - started)
+        _READ_BYTES_SERIAL.observe(len(payload) + 4)
+        self._retry_delay = 1.0
+        self._missed = 0
+        self.last_event_time = time.monotonic()
+        self.stats['samples'] += 1
+        line = f"[{datetime.now():%Y-%m-%d %H:%M:%S}] ({payload}"
+        if self.log_directory:
+            self._append_log(line)
+        return [line]
+
+    def _append_log(self, line):
+        day = line[1:11]
+        try:
+            if day != self._log_day:
+                if self._log_file is not None:
+                    self._log_file.close()
+                self._log_file = open(os.path.join(self.log_directory, f"{day} Serial-QPIGS.log"),
+                                      "a", buffering=1)
+                self._log_day = day
+            self._log_file.write(line + "\n")
+        except OSError as e:
+            log.error("❌ Could not write sample log: %s", e)
+
+    def close(self):
+        self._reset_port()
+        if self._log_file is not None:
+            self._log_file.close()
+            self._log_file = None
+
+
+def create_data_source(config):
+    """Build a data source from a config dict such as {"type": "serial", "port": "/dev/ttyUSB0"}"""
+    kind = config.get("type", "log")
+    if kind == "serial":
+        if not config.get("port"):
+            raise ValueError("serial data source needs a port")
+        return SerialQpigsSource(
+            config["port"],
+            baudrate=int(config.get("baudrate", 2400)),
+            interval=float(config.get("interval", 1)),
+            response_timeout=float(config.get("response_timeout", 1.5)),
+            log_directory=config.get("log_directory") or None,
+        )
+    if kind == "log":
+        if not config.get("directory"):
+            raise ValueError("log data source needs a directory")
+        return LogTailSource(
+            config["directory"],
+            watch_mode=config.get("watch_mode", "auto"),  # auto, inotify or poll
+            interval=float(config.get("interval", 5)),
+        )
+    raise ValueError(f"unknown data source type {kind!r}, expected one of {DATA_SOURCES}")
+
+
+def open_data_source():
+    """Build the data source selected by DATA_SOURCE (log or serial) from the environment"""
+    if os.getenv("DATA_SOURCE", "log") == "serial":
+        return create_data_source({
+            "type": "serial",
+            "port": os.getenv("SERIAL_PORT"),
+            "baudrate": os.getenv("SERIAL_BAUDRATE", "2400"),
+            "interval": os.getenv("SERIAL_POLL_INTERVAL", "1"),
+            "response_timeout": os.getenv("SERIAL_RESPONSE_TIMEOUT", "1.5"),
+            "log_directory": os.getenv("SERIAL_LOG_DIRECTORY"),
+        })
+    return create_data_source({
+        "type": os.getenv("DATA_SOURCE", "log"),
+        "directory": os.getenv("DEBUG_DIRECTORY"),
+        "watch_mode": os.getenv("WATCH_MODE", "auto"),
+        "interval": os.getenv("POLL_INTERVAL", "5"),
+    })
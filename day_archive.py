@@ -0,0 +1,301 @@
+"""Compact columnar day files (.qpc) for archived QPIGS samples.
+
+One file per day holds every sample of a Serial-QPIGS.log as fixed-dtype
+NumPy columns: epoch as int32, float fields as float32, the watt fields as
+int32, the other integer fields as int16 and the bit-string fields packed
+into uint8. A day of 3 s samples is ~1.9 MB instead of ~3.7 MB of text, and `DayFile` maps it with numpy.memmap,
+so opening a month of files costs a few header reads and the columns are
+paged in only when touched. No text parsing is involved.
+
+Layout: 8 byte magic, uint32 header length, a JSON header (day, sample
+count and each column's name, dtype and offset), then the columns. The
+data starts on the first 64 byte boundary after the header, column
+offsets are relative to it and each column is 64 byte aligned too.
+
+    python day_archive.py convert [--directory DIR] [--out DIR] [--workers N] [--force]
+    python day_archive.py info FILE [...]
+"""
+import argparse
+import json
+import mmap
+import os
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import numpy as np
+from dotenv import load_dotenv
+
+from backfill import find_daily_logs
+from qpigs_parser import QPIGS_FIELDS, parse_qpigs_line
+
+MAGIC = b"QPIGSCOL"
+VERSION = 1
+ALIGN = 64
+SUFFIX = ".qpc"
+
+# Bit-string fields stored as small integers: (base, width) to parse and re-format them
+PACKED_FIELDS = {
+    'status_bits': (2, 8),
+    'eeprom_fw': (10, 2),
+    'device_status': (2, 3),
+}
+
+# Watts go past int16's 32767 on big arrays; the other integer fields (%, A, °C, V) stay far below it
+WIDE_FIELDS = frozenset({'output_apparent_power', 'ac_output_power', 'pv_power'})
+
+COLUMNS = (('epoch', '<i4'),) + tuple(
+    (name, 'u1' if name in PACKED_FIELDS else '<f4' if kind is float
+     else '<i4' if name in WIDE_FIELDS else '<i2')
+    for name, kind in QPIGS_FIELDS)
+
+_header_prefix = struct.Struct("<8sI")
+
+
+def _align(offset):
+    return -(-offset // ALIGN) * ALIGN
+
+
+def _pack(value, base):
+    try:
+        return int(value, base)
+    except ValueError:
+        return 0
+
+
+def write_day_file(path, day, columns):
+    """Write `columns` ({name: array}, all the same length) as a day file, atomically"""
+    samples = len(columns['epoch'])
+    arrays = [(name, np.ascontiguousarray(columns[name], dtype=dtype)) for name, dtype in COLUMNS]
+
+    layout = []
+    offset = 0
+    for name, array in arrays:
+        layout.append({'name': name, 'dtype': array.dtype.str, 'offset': offset})
+        offset = _align(offset + array.nbytes)
+    encoded = json.dumps({'version': VERSION, 'day': day, 'samples': samples,
+                          'columns': layout}).encode("ascii")
+    data_start = _align(_header_prefix.size + len(encoded))
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_header_prefix.pack(MAGIC, len(encoded)))
+        f.write(encoded)
+        for column, (_, array) in zip(layout, arrays):
+            f.write(b"\0" * (data_start + column['offset'] - f.tell()))
+            f.write(array.tobytes())
+    os.replace(tmp_path, path)
+    return samples
+
+
+def read_log_columns(path):
+    """Parse a Serial-QPIGS.log into ({name: array}, lines_read)"""
+    values = {name: [] for name, _ in COLUMNS}
+    appenders = [(name, values[name].append) for name, _ in COLUMNS[1:]]
+    append_epoch = values['epoch'].append
+    lines = 0
+    if os.path.getsize(path) == 0:
+        return {name: np.array([], dtype=dtype) for name, dtype in COLUMNS}, lines
+
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for raw in iter(mm.readline, b""):
+            lines += 1
+            if b"(" not in raw:
+                continue
+            record = parse_qpigs_line(raw.decode("utf-8", errors="ignore"), received=0)
+            if record is None or record.epoch is None:
+                continue
+            append_epoch(int(record.epoch))
+            for name, append in appenders:
+                value = getattr(record, name)
+                if name in PACKED_FIELDS:
+                    value = _pack(value, PACKED_FIELDS[name][0])
+                append(value)
+    return {name: _column(name, values[name], dtype) for name, dtype in COLUMNS}, lines
+
+
+def _column(name, values, dtype):
+    """`values` as an array of `dtype`, refusing integers that would wrap around"""
+    dtype = np.dtype(dtype)
+    if dtype.kind in "iu" and values:
+        limits = np.iinfo(dtype)
+        if min(values) < limits.min or max(values) > limits.max:
+            raise ValueError(f"{name} out of range for {dtype.name}: {min(values)}..{max(values)}")
+    return np.array(values, dtype=dtype)
+
+
+def convert_log(log_path, out_path):
+    """Convert one daily log into a day file; runs in a worker process.
+
+    Returns (log_path, lines_read, samples).
+    """
+    columns, lines = read_log_columns(log_path)
+    day = os.path.basename(log_path)[:10]
+    return log_path, lines, write_day_file(out_path, day, columns)
+
+
+class DayFile:
+    """Read-only, memory-mapped view of one day file.
+
+    `day_file['pv_power']` (or `.column()`) returns a NumPy array backed
+    directly by the mapping, without copying.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._map = np.memmap(path, dtype=np.uint8, mode="r")
+        magic, header_len = _header_prefix.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a QPIGS day file")
+        header = json.loads(bytes(self._map[_header_prefix.size:_header_prefix.size + header_len]))
+        if header['version'] != VERSION:
+            raise ValueError(f"{path}: unsupported day file version {header['version']}")
+        self.day = header['day']
+        self.samples = header['samples']
+        data_start = _align(_header_prefix.size + header_len)
+        self._columns = {c['name']: (np.dtype(c['dtype']), data_start + c['offset'])
+                         for c in header['columns']}
+
+    def __len__(self):
+        return self.samples
+
+    def __getitem__(self, name):
+        return self.column(name)
+
+    @property
+    def columns(self):
+        return tuple(self._columns)
+
+    def column(self, name):
+        try:
+            dtype, offset = self._columns[name]
+        except KeyError:
+            raise KeyError(f"No column {name!r} in {self.path}") from None
+        return np.ndarray((self.samples,), dtype=dtype, buffer=self._map, offset=offset)
+
+    def iter_lines(self):
+        """Rebuild the samples as WatchPower log lines, e.g. to replay them"""
+        columns = [self.column(name).tolist() for name, _ in COLUMNS]
+        formats = [_field_formatter(name, kind) for name, kind in QPIGS_FIELDS]
+        for row in zip(*columns):
+            ts = datetime.fromtimestamp(row[0])
+            yield f"[{ts:%Y-%m-%d %H:%M:%S}] (" + " ".join(
+                fmt(value) for fmt, value in zip(formats, row[1:]))
+
+
+def _field_formatter(name, kind):
+    if name in PACKED_FIELDS:
+        base, width = PACKED_FIELDS[name]
+        spec = f"0{width}b" if base == 2 else f"0{width}d"
+        return lambda value: format(value, spec)
+    if kind is float:
+        # float32 -> two decimals, the most any QPIGS field has
+        return "{:.2f}".format
+    return str
+
+
+def load_days(paths, fields):
+    """{field: array} for `fields` over several day files, in the order given.
+
+    A single file returns views straight into its mapping; several are
+    concatenated, which copies only the requested columns.
+    """
+    files = [DayFile(path) for path in paths]
+    if len(files) == 1:
+        return {field: files[0].column(field) for field in fields}
+    return {field: np.concatenate([f.column(field) for f in files]) if files else np.array([])
+            for field in fields}
+
+
+def find_day_files(directory):
+    """Sorted paths of the day files in `directory`"""
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                  if name.endswith(SUFFIX))
+
+
+def day_file_path(out_dir, log_path):
+    return os.path.join(out_dir, os.path.basename(log_path)[:10] + SUFFIX)
+
+
+def convert_directory(directory, out_dir, workers=None, force=False):
+    """Convert every daily log newer than its day file; returns the number converted.
+
+    A log that fails to convert is reported and skipped, the others go on.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    pending = []
+    for path in find_daily_logs(directory):
+        out_path = day_file_path(out_dir, path)
+        if not force and os.path.exists(out_path) and os.path.getmtime(out_path) >= os.path.getmtime(path):
+            continue
+        pending.append((path, out_path))
+
+    if not pending:
+        print("✅ All day files are up to date")
+        return 0
+
+    started = time.perf_counter()
+    log_bytes = file_bytes = 0
+    failed = []
+    print(f"📦 Converting {len(pending)} log files with {workers or os.cpu_count()} workers...")
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(convert_log, path, out_path): (path, out_path) for path, out_path in pending}
+        for future in as_completed(futures):
+            path, out_path = futures[future]
+            try:
+                _, lines, samples = future.result()
+            except Exception as e:
+                failed.append(path)
+                print(f"❌ Failed to convert {os.path.basename(path)}: {e}")
+                continue
+            log_bytes += os.path.getsize(path)
+            file_bytes += os.path.getsize(out_path)
+            print(f"   {os.path.basename(path)}: {samples} samples from {lines} lines")
+
+    converted = len(pending) - len(failed)
+    ratio = log_bytes / file_bytes if file_bytes else 0
+    print(f"✅ Converted {converted} files in {time.perf_counter() - started:.1f}s "
+          f"({log_bytes / 1e6:.1f} MB of logs -> {file_bytes / 1e6:.1f} MB, {ratio:.1f}x smaller)")
+    if failed:
+        print(f"❌ {len(failed)} files failed:")
+        for path in sorted(failed):
+            print(f"   {path}")
+    return converted
+
+
+def default_archive_directory():
+    return os.getenv("ARCHIVE_DIRECTORY") or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "archive")
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Convert QPIGS logs to columnar day files")
+    commands = parser.add_subparsers(dest="command", required=True)
+    convert = commands.add_parser("convert", help="convert the daily logs in a directory")
+    convert.add_argument("--directory", default=os.getenv("DEBUG_DIRECTORY"),
+                         help="directory with the daily logs (default: DEBUG_DIRECTORY)")
+    convert.add_argument("--out", default=default_archive_directory(),
+                         help="output directory (default: ARCHIVE_DIRECTORY or ./archive)")
+    convert.add_argument("--workers", type=int, default=None)
+    convert.add_argument("--force", action="store_true", help="rewrite day files that are up to date")
+    info = commands.add_parser("info", help="show the header of day files")
+    info.add_argument("files", nargs="+")
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        if not args.directory:
+            parser.error("set DEBUG_DIRECTORY or pass --directory")
+        convert_directory(args.directory, args.out, workers=args.workers, force=args.force)
+    else:
+        for path in args.files:
+            day_file = DayFile(path)
+            first, last = (day_file['epoch'][[0, -1]].tolist() if len(day_file) else (None, None))
+            span = f"{datetime.fromtimestamp(first):%H:%M:%S}-{datetime.fromtimestamp(last):%H:%M:%S}" if first else "-"
+            print(f"📅 {day_file.day}: {len(day_file)} samples ({span}), "
+                  f"{os.path.getsize(path) / 1e3:.0f} kB, {len(day_file.columns)} columns")
+
+
+if __name__ == "__main__":
+    main()
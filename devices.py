@@ -0,0 +1,326 @@
+import heapq
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from alert_rules import load_alert_engine
+from data_sources import create_data_source
+from energy_model import create_energy_model
+from live_updates import Broadcaster
+from log_watcher import LatencyStats
+import metrics
+from qpigs_parser import parse_qpigs_lines
+from snapshot import SnapshotHolder
+
+log = logging.getLogger(__name__)
+
+PARSE_SECONDS = metrics.histogram(
+    "inverter_parse_seconds", "Time spent parsing one batch of QPIGS lines", ["device"])
+ALERT_EVAL_SECONDS = metrics.histogram(
+    "inverter_alert_eval_seconds", "Time spent evaluating alert rules for one batch", ["device"])
+SAMPLES = metrics.counter("inverter_samples_total", "QPIGS samples parsed", ["device"])
+PARSE_FAILURES = metrics.counter(
+    "inverter_parse_failures_total", "Data lines that did not parse as QPIGS samples", ["device"])
+
+# Fields summed across devices by DeviceRegistry.aggregate()
+AGGREGATE_FIELDS = ('pv_power', 'ac_output_power', 'output_apparent_power')
+
+
+class Device:
+    """One inverter: its data source plus its own alert state, snapshot and live stream.
+
+    `process()` is the per-device pipeline: parse the data lines, run this
+    device's energy model and alert rules, hand the batch to the registry
+    hooks (WhatsApp, MQTT, history) and publish the newest sample. A device is only ever
+    processed by one thread at a time.
+    """
+
+    def __init__(self, device_id, source, engine, name=None, site=None, data=None, energy=None):
+        self.id = device_id
+        self.name = name or device_id
+        self.site = site or "default"
+        self.source = source
+        self.engine = engine
+        self.energy = energy or create_energy_model()
+        self.data = dict(data or {'timestamp': 'No data', 'last_updated': 'Never'})
+        self.snapshot = SnapshotHolder(self.data)
+        self.broadcaster = Broadcaster()
+        self.broadcaster.publish(self.data)
+        self.latest = None
+        # The source's export_state() as of the last fully processed batch; what checkpoints save
+        self.source_state = None
+        self.on_alerts = None
+        self.on_batch = None
+        self.on_tick = None
+        self.stats = {
+            'batches': 0,
+            'last_batch_samples': 0,
+            'total_samples': 0,
+            'parse_failures': 0,
+        }
+        self.tick_time = LatencyStats(target=0.05)
+        self._parse_seconds = PARSE_SECONDS.labels(device_id)
+        self._alert_eval_seconds = ALERT_EVAL_SECONDS.labels(device_id)
+        self._samples = SAMPLES.labels(device_id)
+        self._parse_failures = PARSE_FAILURES.labels(device_id)
+
+    @property
+    def interval(self):
+        return self.source.interval
+
+    def process(self, data_lines):
+        """Parse every new sample, check alerts on each in order and publish the newest one"""
+        batch = self.parse(data_lines)
+        if batch:
+            firings = self.evaluate(batch)
+            if firings and self.on_alerts is not None:
+                self.on_alerts(self, firings)
+            if self.on_batch is not None:
+                self.on_batch(self, batch)
+            self.publish(batch)
+        # Read and processed on this thread, so the source is exactly past this batch
+        self.source_state = self.source.export_state()
+        return batch
+
+    def parse(self, data_lines):
+        """Parse the data lines and count samples and failures (safe to run off the pipeline thread)"""
+        started = time.perf_counter()
+        batch = parse_qpigs_lines(data_lines)
+        self._parse_seconds.observe(time.perf_counter() - started)
+
+        self.stats['batches'] += 1
+        self.stats['last_batch_samples'] = len(batch)
+        self.stats['total_samples'] += len(batch)
+        self.stats['parse_failures'] += len(data_lines) - len(batch)
+        self._samples.inc(len(batch))
+        if len(data_lines) > len(batch):
+            self._parse_failures.inc(len(data_lines) - len(batch))
+        return batch
+
+    def evaluate(self, batch):
+        """Run the energy model and alert rules over a parsed batch; returns the firings"""
+        started = time.perf_counter()
+        self.energy.update_batch(batch)
+        try:
+            firings = self.engine.evaluate_batch(batch, time.time())
+        except (AttributeError, TypeError) as e:
+            log.error("❌ Error processing alerts for %s: %s", self.id, e)
+            firings = []
+        self._alert_eval_seconds.observe(time.perf_counter() - started)
+        return firings
+
+    def publish(self, batch):
+        """Make the newest sample of a batch the device's current data (snapshot + live stream)"""
+        self.latest = batch[-1]
+        self.data.update(batch[-1].to_dict())
+        self.data.update(self.energy.snapshot(batch[-1]))
+        self.data['metrics'] = self.engine.metrics.snapshot()
+        self.snapshot.publish(self.data)
+        self.broadcaster.publish(self.data)
+
+    def tick(self):
+        """Poll the source once and process whatever it returned (used by DevicePool)"""
+        started = time.perf_counter()
+        data_lines = self.source.poll()
+        if data_lines:
+            self.process(data_lines)
+        if self.on_tick is not None:
+            self.on_tick(self)
+        self.tick_time.record(time.perf_counter() - started)
+
+    def is_online(self, now=None, stale_after=None):
+        """Whether the newest sample is recent enough to count in aggregates"""
+        if self.latest is None:
+            return False
+        stale_after = stale_after or max(60.0, self.interval * 3)
+        return (now or time.time()) - self.latest.received <= stale_after
+
+    def status(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'site': self.site,
+            'source': self.source.describe(),
+            'online': self.is_online(),
+            'timestamp': self.data.get('timestamp'),
+            'pipeline': dict(self.stats),
+            'tick_time': self.tick_time.summary(),
+        }
+
+
+class DeviceRegistry:
+    """The configured devices, by id, in config order"""
+
+    def __init__(self, devices):
+        ids = [device.id for device in devices]
+        if not devices:
+            raise ValueError("no devices configured")
+        if len(ids) != len(set(ids)):
+            raise ValueError("duplicate device ids")
+        self.devices = list(devices)
+        self.by_id = {device.id: device for device in devices}
+
+    def __iter__(self):
+        return iter(self.devices)
+
+    def __len__(self):
+        return len(self.devices)
+
+    def get(self, device_id):
+        return self.by_id.get(device_id)
+
+    def set_hooks(self, on_alerts=None, on_batch=None, on_tick=None):
+        for device in self.devices:
+            device.on_alerts = on_alerts
+            device.on_batch = on_batch
+            device.on_tick = on_tick
+
+    def aggregate(self):
+        """PV, load and battery power summed over the online devices, in total and per site"""
+        now = time.time()
+        total = _empty_totals()
+        sites = {}
+        for device in self.devices:
+            site = sites.setdefault(device.site, _empty_totals())
+            for totals in (total, site):
+                totals['devices'] += 1
+            record = device.latest
+            if record is None or not device.is_online(now):
+                continue
+            charge_w = record.battery_voltage * record.battery_charging_current
+            discharge_w = record.battery_voltage * record.battery_discharge_current
+            for totals in (total, site):
+                totals['online'] += 1
+                for field in AGGREGATE_FIELDS:
+                    totals[field] += getattr(record, field)
+                totals['battery_charge_power'] += round(charge_w)
+                totals['battery_discharge_power'] += round(discharge_w)
+                totals['grid_up'] += 1 if record.grid_voltage > 10 else 0
+        return {'total': total, 'sites': sites}
+
+
+def _empty_totals():
+    totals = {'devices': 0, 'online': 0, 'grid_up': 0,
+              'battery_charge_power': 0, 'battery_discharge_power': 0}
+    totals.update((field, 0) for field in AGGREGATE_FIELDS)
+    return totals
+
+
+class DevicePool:
+    """Polls many devices on a shared thread pool instead of one thread per device.
+
+    A scheduler thread keeps a heap of (due time, device) and hands each
+    device to the pool when its interval comes round. A device is put back
+    on the heap only after its tick finishes, so one device never runs on two
+    workers at once, and a slow device just skips ahead instead of piling up
+    ticks. Polls are I/O-bound (file reads, serial round trips), which is
+    why threads are enough.
+    """
+
+    def __init__(self, devices, workers=None):
+        self.devices = list(devices)
+        self.workers = workers or min(32, (os.cpu_count() or 1) * 4)
+        self.schedule_lag = LatencyStats(target=0.1)
+        self.stats = {'ticks': 0, 'errors': 0, 'overruns': 0}
+        self._executor = None
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return self
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="device")
+        now = time.monotonic()
+        with self._cond:
+            for i, device in enumerate(self.devices):
+                # Spread first polls over one interval so devices do not all tick together
+                offset = device.interval * i / len(self.devices)
+                heapq.heappush(self._heap, (now + offset, next(self._seq), device))
+        self._thread = threading.Thread(target=self._run, name="device-scheduler", daemon=True)
+        self._thread.start()
+        log.info("🧵 Polling %d devices on %d worker threads", len(self.devices), self.workers)
+        return self
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            with self._cond:
+                while not self._stop.is_set():
+                    now = time.monotonic()
+                    if self._heap and self._heap[0][0] <= now:
+                        due, _, device = heapq.heappop(self._heap)
+                        break
+                    self._cond.wait(self._heap[0][0] - now if self._heap else 1.0)
+                else:
+                    return
+            self.schedule_lag.record(now - due)
+            self._executor.submit(self._tick, device, due)
+
+    def _tick(self, device, due):
+        try:
+            device.tick()
+        except Exception as e:
+            self.stats['errors'] += 1
+            log.exception("❌ Error polling device %s: %s", device.id, e)
+        finally:
+            self.stats['ticks'] += 1
+            next_due = due + device.interval
+            now = time.monotonic()
+            if next_due < now:
+                self.stats['overruns'] += 1
+                next_due = now
+            with self._cond:
+                heapq.heappush(self._heap, (next_due, next(self._seq), device))
+                self._cond.notify()
+
+    def summary(self):
+        return dict(self.stats, workers=self.workers, devices=len(self.devices),
+                    schedule_lag=self.schedule_lag.summary())
+
+
+def load_device_registry(path, initial_data=None):
+    """Build a DeviceRegistry from a devices config file.
+
+    {"devices": [{"id": "home", "name": "Home", "site": "Karachi",
+                  "source": {"type": "log", "directory": "C:/WatchPower/debug"},
+                  "rules": "alert_rules.json"}, ...]}
+
+    `rules` is optional and defaults to ALERT_RULES; `battery` is optional
+    too ({"capacity_ah": 200}) and sets up the energy model. Log sources
+    default to the polling watcher here, since the pool schedules every
+    device anyway.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+
+    devices = []
+    for entry in config['devices']:
+        source_config = dict(entry.get('source', {}))
+        source_config.setdefault('watch_mode', 'poll')
+        devices.append(Device(
+            str(entry['id']),
+            create_data_source(source_config),
+            load_alert_engine(entry.get('rules')),
+            name=entry.get('name'),
+            site=entry.get('site'),
+            data=initial_data,
+            energy=create_energy_model(entry.get('battery')),
+        ))
+    return DeviceRegistry(devices)
@@ -0,0 +1,161 @@
+import os
+import time
+
+from energy_report import GRID_PRESENT_VOLTS, MAX_SAMPLE_GAP
+
+# Per-sample values the model adds to every QpigsRecord (record.derived), in this order
+DERIVED_FIELDS = (
+    'load_current',
+    'battery_net_current',
+    'battery_power',
+    'battery_soc',
+    'grid_power',
+    'solar_share',
+    'grid_share',
+    'battery_share',
+)
+
+# Resting voltage vs state of charge of the 24 V LiFePO4 bank (was updateBatteryPercentage in script.js)
+SOC_CURVE = (
+    (21.0, 0.0),
+    (23.0, 10.0),
+    (25.0, 40.0),
+    (26.0, 70.0),
+    (27.0, 90.0),
+    (28.6, 100.0),
+)
+
+# Below this net current (A) the battery voltage is close enough to its resting voltage to trust the curve
+REST_CURRENT = 2.0
+
+# Time constant (s) with which the coulomb count is pulled towards the curve while resting
+CORRECTION_SECONDS = 600.0
+
+ENERGY_TODAY_KEYS = ('pv_kwh', 'load_kwh', 'grid_kwh', 'battery_charge_kwh', 'battery_discharge_kwh')
+
+
+def voltage_soc(voltage, curve=SOC_CURVE):
+    """State of charge (%) for a resting battery voltage, interpolated on `curve`"""
+    if voltage <= curve[0][0]:
+        return curve[0][1]
+    for (v1, p1), (v2, p2) in zip(curve, curve[1:]):
+        if voltage <= v2:
+            return p1 + (voltage - v1) / (v2 - v1) * (p2 - p1)
+    return curve[-1][1]
+
+
+def _next_midnight(epoch):
+    day = time.localtime(epoch)
+    return time.mktime((day.tm_year, day.tm_mon, day.tm_mday + 1, 0, 0, 0, 0, 0, -1))
+
+
+class EnergyModel:
+    """Derived energy values for one inverter, updated once per sample.
+
+    Works out load current, net battery current and power, grid power and
+    how much of the load solar, grid and battery each cover, plus the
+    battery state of charge. SoC is coulomb-counted from the charge and
+    discharge currents and, whenever the battery is close to resting,
+    pulled towards the voltage curve so counting errors do not build up.
+    It is re-seeded from the curve after a long gap in the samples. Daily
+    kWh totals reset at local midnight.
+
+    Power flows follow energy_report.power_flows, so live values and the
+    daily report agree.
+    """
+
+    def __init__(self, capacity_ah=100.0, charge_efficiency=0.98, curve=SOC_CURVE):
+        self.capacity_ah = float(capacity_ah)
+        self.charge_efficiency = float(charge_efficiency)
+        self.curve = tuple(tuple(point) for point in curve)
+        self.soc = None
+        self.last_epoch = None
+        self.last_flows = None
+        self.day_end = None
+        self.energy_today = dict.fromkeys(ENERGY_TODAY_KEYS, 0.0)
+
+    def update(self, record):
+        """Fold one sample into the model and store its derived values on `record.derived`"""
+        epoch = record.epoch if record.epoch is not None else record.received
+        voltage = record.battery_voltage
+        load = record.ac_output_power
+        pv = record.pv_power
+        charge_w = voltage * record.battery_charging_current
+        discharge_w = voltage * record.battery_discharge_current
+        net_current = record.battery_charging_current - record.battery_discharge_current
+        grid = max(0.0, load + charge_w - pv - discharge_w) if record.grid_voltage > GRID_PRESENT_VOLTS else 0.0
+        flows = (pv, load, grid, charge_w, discharge_w)
+
+        if self.day_end is None or epoch >= self.day_end:
+            self.day_end = _next_midnight(epoch)
+            self.energy_today = dict.fromkeys(ENERGY_TODAY_KEYS, 0.0)
+            self.last_flows = None
+
+        dt = epoch - self.last_epoch if self.last_epoch is not None else None
+        if dt is None or dt > MAX_SAMPLE_GAP or dt < 0 or self.soc is None:
+            # Nothing to count from: start again from the voltage curve
+            self.soc = voltage_soc(voltage, self.curve)
+        elif dt > 0:
+            amps = net_current * self.charge_efficiency if net_current > 0 else net_current
+            self.soc += amps * dt / 36.0 / self.capacity_ah
+            if abs(net_current) <= REST_CURRENT:
+                weight = min(1.0, dt / CORRECTION_SECONDS)
+                self.soc += (voltage_soc(voltage, self.curve) - self.soc) * weight
+            if self.last_flows is not None:
+                for key, now, before in zip(ENERGY_TODAY_KEYS, flows, self.last_flows):
+                    self.energy_today[key] += (now + before) * 0.5 * dt / 3.6e6
+        self.soc = min(100.0, max(0.0, self.soc))
+        if voltage >= self.curve[-1][0]:
+            # Absorption voltage means a full battery, whatever the count says
+            self.soc = 100.0
+        self.last_epoch = epoch
+        self.last_flows = flows
+
+        # Solar covers the load first, then the battery, then the grid
+        if load > 0:
+            from_pv = min(pv, load)
+            from_battery = min(discharge_w, load - from_pv)
+            from_grid = load - from_pv - from_battery if record.grid_voltage > GRID_PRESENT_VOLTS else 0
+            shares = (round(from_pv * 100.0 / load, 1), round(from_grid * 100.0 / load, 1),
+                      round(from_battery * 100.0 / load, 1))
+        else:
+            shares = (0.0, 0.0, 0.0)
+
+        load_current = load / record.ac_output_voltage if record.ac_output_voltage > 0 else 0.0
+        record.derived = (
+            round(load_current, 2),
+            net_current,
+            round(voltage * net_current),
+            round(self.soc, 1),
+            round(grid),
+        ) + shares
+        return record.derived
+
+    def update_batch(self, records):
+        for record in records:
+            self.update(record)
+
+    def export_state(self):
+        return {'soc': self.soc, 'last_epoch': self.last_epoch, 'day_end': self.day_end,
+                'last_flows': self.last_flows, 'energy_today': dict(self.energy_today)}
+
+    def import_state(self, saved):
+        """Continue from export_state(); a long gap re-seeds SoC from the curve as usual"""
+        self.soc = saved.get('soc')
+        self.last_epoch = saved.get('last_epoch')
+        self.day_end = saved.get('day_end')
+        self.last_flows = tuple(saved['last_flows']) if saved.get('last_flows') else None
+        self.energy_today.update(saved.get('energy_today', {}))
+
+    def snapshot(self, record=None):
+        """Derived fields of `record` (the newest sample) plus today's totals, for /api/data"""
+        data = dict(zip(DERIVED_FIELDS, record.derived)) if record is not None and record.derived else {}
+        data['energy_today'] = {key: round(value, 3) for key, value in self.energy_today.items()}
+        return data
+
+
+def create_energy_model(config=None):
+    """EnergyModel from a devices.json "battery" entry, defaulting to BATTERY_CAPACITY_AH"""
+    config = dict(config or {})
+    config.setdefault('capacity_ah', float(os.getenv("BATTERY_CAPACITY_AH", "100")))
+    return EnergyModel(**config)
@@ -0,0 +1,307 @@
+import os
+import sqlite3
+import threading
+import time
+from operator import attrgetter
+
+from energy_model import DERIVED_FIELDS
+from qpigs_parser import QPIGS_FIELDS
+
+# Numeric QPIGS fields kept in history (the bit-string fields are not worth storing)
+QPIGS_HISTORY_FIELDS = tuple(name for name, kind in QPIGS_FIELDS if kind is not str)
+
+# ...followed by the energy model's derived values (NULL for samples stored without them)
+HISTORY_FIELDS = QPIGS_HISTORY_FIELDS + DERIVED_FIELDS
+
+_qpigs_values = attrgetter(*QPIGS_HISTORY_FIELDS)
+_NO_DERIVED = (None,) * len(DERIVED_FIELDS)
+_SAMPLE_COLUMNS = "ts INTEGER PRIMARY KEY, " + ", ".join(f"{f} REAL" for f in HISTORY_FIELDS)
+
+# Rollup bucket sizes in seconds: 1 minute, 15 minutes, 1 hour
+ROLLUP_STEPS = (60, 900, 3600)
+
+# Default retention in days per table; None keeps data forever
+DEFAULT_RETENTION = {
+    'samples': 30,
+    60: 180,
+    900: 730,
+    3600: None,
+}
+
+
+def rollup_table(step):
+    return f"rollup_{step}"
+
+
+class HistoryStore:
+    """SQLite (WAL mode) history of inverter samples with min/avg/max rollups.
+
+    Samples are buffered by `append()` and written in one transaction by
+    `flush()`, which also folds them into the 1 min / 15 min / 1 h rollup
+    tables. Rollups keep sum and count rather than the average so buckets
+    can be updated incrementally as samples arrive. Each thread gets its own
+    connection, so the web server can query while the monitor writes.
+    """
+
+    def __init__(self, path, flush_size=60, flush_interval=10.0, retention=None):
+        self.path = path
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.retention = {**DEFAULT_RETENTION, **(retention or {})}
+        self._local = threading.local()
+        self._buffer = []
+        # append() runs on the pipeline thread, flush() also on the checkpoint thread
+        self._buffer_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._last_retention = 0.0
+        self._write_lock = threading.Lock()
+        self._create_schema()
+
+    def connection(self):
+        """Return this thread's connection, opening it on first use"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            # Per-connection staging table used by flush()
+            conn.execute(f"CREATE TEMP TABLE IF NOT EXISTS incoming ({_SAMPLE_COLUMNS})")
+            self._local.conn = conn
+        return conn
+
+    def close(self):
+        self.flush()
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def _create_schema(self):
+        conn = self.connection()
+        conn.execute(f"CREATE TABLE IF NOT EXISTS samples ({_SAMPLE_COLUMNS})")
+        _add_missing_columns(conn, "samples", HISTORY_FIELDS)
+        for step in ROLLUP_STEPS:
+            stats = ", ".join(f"{f}_min REAL, {f}_sum REAL, {f}_max REAL" for f in HISTORY_FIELDS)
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {rollup_table(step)} "
+                         f"(bucket INTEGER PRIMARY KEY, n INTEGER, {stats})")
+            _add_missing_columns(conn, rollup_table(step),
+                                 [f"{f}_{s}" for f in HISTORY_FIELDS for s in ("min", "sum", "max")])
+        conn.execute("CREATE TABLE IF NOT EXISTS imported_files "
+                     "(name TEXT PRIMARY KEY, size INTEGER, mtime REAL, samples INTEGER, imported_at REAL)")
+        conn.commit()
+
+    # ------------------------------------------------------------------ writes
+
+    def append(self, records):
+        """Buffer parsed QpigsRecords and flush once the batch is big or old enough"""
+        rows = [record_row(record) for record in records]
+        with self._buffer_lock:
+            self._buffer.extend(rows)
+
+        if (len(self._buffer) >= self.flush_size
+                or time.monotonic() - self._last_flush >= self.flush_interval):
+            self.flush()
+
+    def flush_if_due(self):
+        """Flush samples buffered for `flush_interval`; called every tick, so a quiet log gets written too"""
+        if self._buffer and time.monotonic() - self._last_flush >= self.flush_interval:
+            return self.flush()
+        return 0
+
+    def append_rows(self, rows):
+        """Write (ts, *HISTORY_FIELDS) tuples straight away, e.g. from the backfill importer"""
+        with self._buffer_lock:
+            self._buffer.extend(rows)
+        return self.flush()
+
+    def flush(self):
+        """Write buffered samples and update the rollups in a single transaction"""
+        self._last_flush = time.monotonic()
+        if not self._buffer:
+            return 0
+
+        with self._buffer_lock:
+            rows, self._buffer = self._buffer, []
+        if not rows:
+            return 0
+        placeholders = ", ".join("?" * (len(HISTORY_FIELDS) + 1))
+        with self._write_lock:
+            conn = self.connection()
+            with conn:
+                # Stage the batch so that timestamps already stored (e.g. a
+                # re-imported log) are dropped before they reach the rollups
+                conn.execute("DELETE FROM temp.incoming")
+                conn.executemany(f"INSERT OR IGNORE INTO temp.incoming VALUES ({placeholders})", rows)
+                conn.execute("DELETE FROM temp.incoming WHERE ts IN "
+                             "(SELECT ts FROM samples WHERE ts BETWEEN ? AND ?)",
+                             (min(r[0] for r in rows), max(r[0] for r in rows)))
+                self._drop_rolled_up(conn)
+                written = conn.execute("INSERT INTO samples SELECT * FROM temp.incoming").rowcount
+                for step in ROLLUP_STEPS:
+                    self._update_rollup(conn, step)
+
+        if time.time() - self._last_retention > 3600:
+            self.apply_retention()
+        return written
+
+    def _drop_rolled_up(self, conn):
+        """Drop staged samples older than the raw retention whose hour is already in the rollups.
+
+        Retention deletes those raw samples right away, so the check against
+        `samples` above cannot catch a re-imported old log; the hourly rollup,
+        kept longest, is the record of what was folded in already.
+        """
+        days = self.retention.get('samples')
+        if days is None:
+            return
+        table = rollup_table(ROLLUP_STEPS[-1])
+        conn.execute(
+            f"DELETE FROM temp.incoming WHERE ts < ? AND EXISTS "
+            f"(SELECT 1 FROM {table} WHERE bucket = ts - ts % {ROLLUP_STEPS[-1]})",
+            (time.time() - days * 86400,))
+
+    def _update_rollup(self, conn, step):
+        table = rollup_table(step)
+        cols = ["n"] + [f"{f}_{s}" for f in HISTORY_FIELDS for s in ("min", "sum", "max")]
+        aggregates = ["count(*)"] + [f"{agg}({f})" for f in HISTORY_FIELDS for agg in ("min", "sum", "max")]
+        updates = ["n = n + excluded.n"]
+        for f in HISTORY_FIELDS:
+            updates.append(f"{f}_min = min({f}_min, excluded.{f}_min)")
+            updates.append(f"{f}_sum = {f}_sum + excluded.{f}_sum")
+            updates.append(f"{f}_max = max({f}_max, excluded.{f}_max)")
+        # "WHERE 1" keeps SQLite from reading ON CONFLICT as part of the SELECT
+        conn.execute(
+            f"INSERT INTO {table} (bucket, {', '.join(cols)}) "
+            f"SELECT ts - ts % {step} AS b, {', '.join(aggregates)} FROM temp.incoming WHERE 1 GROUP BY b "
+            f"ON CONFLICT(bucket) DO UPDATE SET {', '.join(updates)}")
+
+    def apply_retention(self, now=None):
+        """Delete raw samples and rollup buckets older than their retention period"""
+        now = time.time() if now is None else now
+        self._last_retention = now
+        with self._write_lock:
+            conn = self.connection()
+            with conn:
+                days = self.retention.get('samples')
+                if days is not None:
+                    conn.execute("DELETE FROM samples WHERE ts < ?", (now - days * 86400,))
+                for step in ROLLUP_STEPS:
+                    days = self.retention.get(step)
+                    if days is not None:
+                        conn.execute(f"DELETE FROM {rollup_table(step)} WHERE bucket < ?",
+                                     (now - days * 86400,))
+
+    def is_imported(self, name, size, mtime):
+        """True if log file `name` was already imported with this exact size and mtime"""
+        row = self.connection().execute(
+            "SELECT size, mtime FROM imported_files WHERE name = ?", (name,)).fetchone()
+        return row is not None and row[0] == size and row[1] == mtime
+
+    def mark_imported(self, name, size, mtime, samples):
+        with self._write_lock:
+            conn = self.connection()
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO imported_files VALUES (?, ?, ?, ?, ?)",
+                             (name, size, mtime, samples, time.time()))
+
+    # ----------------------------------------------------------------- queries
+
+    def query_samples(self, field, start, end):
+        """Raw (ts, value) pairs for `field` with start <= ts < end"""
+        _check_field(field)
+        return self.connection().execute(
+            f"SELECT ts, {field} FROM samples WHERE ts >= ? AND ts < ? ORDER BY ts",
+            (start, end)).fetchall()
+
+    def query_rollup(self, step, field, start, end):
+        """(bucket, min, avg, max, n) rows for `field` from the `step` second rollup"""
+        _check_field(field)
+        if step not in ROLLUP_STEPS:
+            raise ValueError(f"No rollup with step {step}s")
+        return self.connection().execute(
+            f"SELECT bucket, {field}_min, {field}_sum / n, {field}_max, n FROM {rollup_table(step)} "
+            f"WHERE bucket >= ? AND bucket < ? ORDER BY bucket",
+            (start, end)).fetchall()
+
+    def iter_history(self, field, start, end, step):
+        """Return (source_step, cursor) for `field` aggregated to `step` second buckets.
+
+        Reads from the coarsest rollup whose bucket size still fits inside
+        `step` (raw samples when step < 60), so a week at 15 minute
+        resolution touches ~700 rows instead of ~600k. The cursor yields
+        (t, min, avg, max, n) rows and is meant to be iterated, not fetched
+        all at once.
+        """
+        _check_field(field)
+        step = max(1, int(step))
+        source = choose_rollup_step(step)
+        if source == 0:
+            sql = (f"SELECT ts - ts % :step AS t, min({field}), avg({field}), max({field}), count(*) "
+                   f"FROM samples WHERE ts >= :start AND ts < :end GROUP BY t ORDER BY t")
+        else:
+            sql = (f"SELECT bucket - bucket % :step AS t, min({field}_min), sum({field}_sum) / sum(n), "
+                   f"max({field}_max), sum(n) FROM {rollup_table(source)} "
+                   f"WHERE bucket >= :start AND bucket < :end GROUP BY t ORDER BY t")
+        return source, self.connection().execute(sql, {'step': step, 'start': start, 'end': end})
+
+    def sample_rows(self, fields, start, end):
+        """Raw (ts, *fields) rows with start <= ts < end, for bulk maths"""
+        for field in fields:
+            _check_field(field)
+        return self.connection().execute(
+            f"SELECT ts, {', '.join(fields)} FROM samples WHERE ts >= ? AND ts < ? ORDER BY ts",
+            (start, end)).fetchall()
+
+    def rollup_rows(self, step, fields, start, end):
+        """(bucket, n, *avg(fields)) rows from the `step` second rollup"""
+        for field in fields:
+            _check_field(field)
+        avgs = ", ".join(f"{f}_sum / n" for f in fields)
+        return self.connection().execute(
+            f"SELECT bucket, n, {avgs} FROM {rollup_table(step)} "
+            f"WHERE bucket >= ? AND bucket < ? ORDER BY bucket",
+            (start, end)).fetchall()
+
+    def sample_summary(self, start, end):
+        """(count, newest ts) of the raw samples with start <= ts < end; changes when they do"""
+        return tuple(self.connection().execute(
+            "SELECT count(*), max(ts) FROM samples WHERE ts >= ? AND ts < ?", (start, end)).fetchone())
+
+    def latest_timestamp(self):
+        row = self.connection().execute("SELECT max(ts) FROM samples").fetchone()
+        return row[0]
+
+
+def record_row(record):
+    """(ts, *HISTORY_FIELDS) row for a QpigsRecord (derived values NULL unless the energy model ran)"""
+    ts = record.epoch if record.epoch is not None else record.received
+    return (int(ts),) + _qpigs_values(record) + (record.derived or _NO_DERIVED)
+
+
+def _add_missing_columns(conn, table, columns):
+    """Add REAL columns a database created by an older version does not have yet"""
+    existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    for column in columns:
+        if column not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} REAL")
+
+
+def choose_rollup_step(step):
+    """Largest rollup bucket size that is not coarser than `step`, or 0 for raw samples"""
+    fitting = [s for s in ROLLUP_STEPS if s <= step]
+    return max(fitting) if fitting else 0
+
+
+def _check_field(field):
+    if field not in HISTORY_FIELDS:
+        raise ValueError(f"Unknown history field: {field}")
+
+
+def open_history_store(path=None):
+    """Open the history database named by HISTORY_DB (or `path`), creating it if needed"""
+    path = path or os.getenv("HISTORY_DB") or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "inverter_history.db")
+    retention = {}
+    if os.getenv("HISTORY_RAW_RETENTION_DAYS"):
+        retention['samples'] = int(os.getenv("HISTORY_RAW_RETENTION_DAYS"))
+    return HistoryStore(path, retention=retention)
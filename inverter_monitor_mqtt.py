@@ -1,41 +1,65 @@
+import functools
+import hmac
+import math
 import os
+import signal
+import sys
 import time
-import shutil
-from flask import Flask, render_template
+from flask import Flask, Response, render_template, request, stream_with_context
 import threading
 from datetime import datetime
-import paho.mqtt.client as mqtt
 import requests
 import json
+import logging
 from dotenv import load_dotenv
+from log_watcher import LatencyStats
+from data_sources import open_data_source
+from devices import Device, DevicePool, DeviceRegistry, load_device_registry
+from qpigs_parser import parse_qpigs_line
+from history_store import open_history_store
+from energy_report import daily_energy
+from charts import ChartCache
+from checkpoint import StateCheckpoint
+from alert_delivery import AlertDelivery
+from alert_messages import AlertCoalescer, AlertTemplates
+from alert_rules import load_alert_engine
+from mqtt_publisher import NUMERIC_FIELDS, open_mqtt_publisher
+from logging_setup import setup_logging
+from profiler import StackSampler
+import metrics
 
 load_dotenv()
+setup_logging()
+log = logging.getLogger("inverter_monitor")
 
 # Configuration
+DATA_SOURCE = os.getenv("DATA_SOURCE", "log")  # log (WatchPower Serial-QPIGS.log) or serial
+DEVICES_CONFIG = os.getenv("DEVICES_CONFIG")  # JSON list of inverters; overrides DATA_SOURCE
+DEVICE_WORKERS = int(os.getenv("DEVICE_WORKERS", "0")) or None
 debug_directory = os.getenv("DEBUG_DIRECTORY")
+POLL_INTERVAL = float(os.getenv("POLL_INTERVAL", "5"))
+HISTORY_ENABLED = os.getenv("HISTORY_ENABLED", "1") == "1"
+WEB_SERVER = os.getenv("WEB_SERVER", "auto")  # auto, waitress or dev
+WEB_HOST = os.getenv("WEB_HOST", "192.168.18.101")
+WEB_PORT = int(os.getenv("WEB_PORT", "5000"))
+WEB_THREADS = int(os.getenv("WEB_THREADS", "16"))
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")  # enables /admin/*; send it as "Authorization: Bearer <token>"
 
-# mqtt_client = mqtt.Client()
-# mqtt_client.connect('localhost',1883)
-# mqtt_client.publish('Hello',100)
+# MQTT publishing is enabled by setting MQTT_HOST (see mqtt_publisher.py for the other MQTT_* settings)
+mqtt_publisher = open_mqtt_publisher()
 
 
 WASMS_API_URL = os.getenv("WASMS_API_URL")
 WASMS_API_SECRET = os.getenv("WASMS_API_SECRET")
 WASMS_ACCOUNT_ID = os.getenv("WASMS_ACCOUNT_ID")
 
-# print(debug_directory,WASMS_API_URL,WASMS_API_SECRET,WASMS_ACCOUNT_ID)
-
-def get_todays_qpigs_path():
-    """Get today's QPIGS file path"""
-    today = datetime.now().strftime("%Y-%m-%d")
-    filename = f"{today} Serial-QPIGS.log"
-    return os.path.join(debug_directory, filename)
-
-# Get today's file path
-file_path = get_todays_qpigs_path()
-temp_file_path = os.path.join(debug_directory, "temp_Serial-QPIGS.log")
+ALERT_COALESCE_SECONDS = float(os.getenv("ALERT_COALESCE_SECONDS", "600"))  # 0 sends every alert
+ALERT_MAX_AGE_SECONDS = float(os.getenv("ALERT_MAX_AGE_SECONDS", "3600"))  # undelivered alerts older than this are dropped
+ALERT_SPOOL = os.getenv("ALERT_SPOOL") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "alert_spool.json")
+STATE_FILE = os.getenv("STATE_FILE") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "monitor_state.json")
+CHECKPOINT_INTERVAL = float(os.getenv("CHECKPOINT_INTERVAL", "5"))  # 0 disables the checkpoint
 
-print(f"📁 Monitoring file: {file_path}")
+# print(debug_directory,WASMS_API_URL,WASMS_API_SECRET,WASMS_ACCOUNT_ID)
 
 # Global variables
 current_inverter_data = {
@@ -67,20 +91,80 @@ current_inverter_data = {
     'last_updated': 'Never'
 }
 
-file_read_attempts = 0
-
-# Alert tracking to avoid duplicate messages
-last_alert_sent = {
-    'battery_drain_fast': None,
-    'low_battery': None,
-    'grid_down': None,
-    'battery_drain_limit':None,
-    'grid_up':None,
-    'insufficient_solar_power':None,
-}
+# Every inverter gets its own source, alert rule state, snapshot and live stream. With
+# DEVICES_CONFIG there can be many; otherwise there is one "default" device built from
+# DATA_SOURCE and ALERT_RULES (alert_rules.json by default).
+MULTI_DEVICE = bool(DEVICES_CONFIG)
+if MULTI_DEVICE:
+    device_registry = load_device_registry(DEVICES_CONFIG, initial_data=current_inverter_data)
+else:
+    device_registry = DeviceRegistry([Device('default', open_data_source(), load_alert_engine(),
+                                             data=current_inverter_data)])
+
+# The first device also backs the single-device endpoints (/, /api/data, /api/stream, history)
+primary_device = device_registry.devices[0]
+data_source = primary_device.source
+alert_engine = primary_device.engine
+current_inverter_data = primary_device.data
+latest_snapshot = primary_device.snapshot
+broadcaster = primary_device.broadcaster
+pipeline_stats = primary_device.stats
+
+for configured_device in device_registry:
+    log.info("📁 Device %s: %s", configured_device.id, configured_device.source.describe())
+
+# Polls every device on a shared worker pool in multi-device mode (started in __main__)
+device_pool = None
+
+# Set by async_runtime.py when the monitor runs as asyncio tasks instead of threads
+async_runtime = None
+
+# Sample history (SQLite) of the primary device, opened at startup when HISTORY_ENABLED
+history_store = None
+chart_cache = None
+
+# Time from the watcher waking up to the new sample being parsed and alerts checked
+watch_latency = LatencyStats(target=0.1)
 
 app = Flask(__name__)
 
+# Sampling profiler, switched on and off through /admin/profile/*
+profiler = StackSampler()
+
+# WhatsApp texts, and digests for alerts of one group that fire within ALERT_COALESCE_SECONDS
+alert_templates = AlertTemplates()
+alert_coalescer = AlertCoalescer(ALERT_COALESCE_SECONDS, alert_templates)
+
+# Sends WhatsApp alerts from a background worker with retries (started in __main__)
+alert_delivery = AlertDelivery(WASMS_API_URL, WASMS_API_SECRET, WASMS_ACCOUNT_ID, spool_path=ALERT_SPOOL,
+                               digests=alert_coalescer, max_age=ALERT_MAX_AGE_SECONDS or None)
+
+# Live state saved every CHECKPOINT_INTERVAL seconds and restored at startup (see checkpoint.py)
+state_checkpoint = StateCheckpoint(STATE_FILE, device_registry, coalescer=alert_coalescer,
+                                   interval=CHECKPOINT_INTERVAL)
+
+HTTP_REQUESTS = metrics.counter("http_requests_total", "HTTP requests by route and status", ["route", "status"])
+HTTP_REQUEST_SECONDS = metrics.histogram("http_request_seconds", "Time to produce an HTTP response", ["route"])
+HTTP_IN_FLIGHT = metrics.gauge("http_requests_in_flight", "HTTP requests being handled")
+
+@app.before_request
+def start_request_timer():
+    request.metrics_started = time.perf_counter()
+    HTTP_IN_FLIGHT.inc()
+
+@app.after_request
+def record_request_metrics(response):
+    # Label by route pattern (/api/devices/<device_id>/data), not the raw path
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    HTTP_REQUEST_SECONDS.labels(route).observe(time.perf_counter() - request.metrics_started)
+    HTTP_REQUESTS.labels(route, response.status_code).inc()
+    return response
+
+@app.teardown_request
+def end_request(exc):
+    # Runs even when a view raised, unlike after_request
+    HTTP_IN_FLIGHT.dec()
+
 def get_whatsapp_accounts():
     """Get available WhatsApp accounts from WaSMS.net"""
     try:
@@ -96,241 +180,116 @@ def get_whatsapp_accounts():
         
         if response.status_code == 200:
             accounts = response.json()
-            print("✅ Available WhatsApp accounts:")
+            log.info("✅ Available WhatsApp accounts:")
             for account in accounts:
-                print(f"   📱 Account: {account}")
+                log.info("   📱 Account: %s", account)
             return accounts
         else:
-            print(f"❌ Failed to get WhatsApp accounts: {response.status_code} - {response.text}")
+            log.error("❌ Failed to get WhatsApp accounts: %s - %s", response.status_code, response.text)
             return None
             
     except Exception as e:
-        print(f"❌ Error getting WhatsApp accounts: {e}")
+        log.error("❌ Error getting WhatsApp accounts: %s", e)
         return None
 
-def send_wasms_whatsapp(message,send_others = False):
-    """Send WhatsApp message via WaSMS.net API to multiple recipients"""
+def get_alert_recipients(send_others=False):
+    """WhatsApp numbers an alert goes to"""
     recipients = [os.getenv("SEND_WASMS_NUM1")]
     if send_others:
         recipients += [os.getenv("SEND_WASMS_NUM2")]
-    print(recipients)
-    success_count = 0
-    for number in recipients:
-        try:
-            payload = {
-                'secret': WASMS_API_SECRET,
-                'account': WASMS_ACCOUNT_ID,
-                'recipient': number,
-                'type': 'text',
-                'message': message,
-                'priority': 1
-            }
-            
-            print(f"📤 Sending WhatsApp message to {number}")
-            response = requests.post(WASMS_API_URL, data=payload, timeout=15)
-            
-            if response.status_code == 200:
-                success_count += 1
-                try:
-                    response_data = response.json()
-                    print(f"✅ Sent to {number} | Response: {response_data}")
-                except:
-                    print(f"✅ Sent to {number} | Raw response: {response.text}")
-            else:
-                print(f"❌ Failed to send to {number} | {response.status_code}: {response.text}")
-        
-        except Exception as e:
-            print(f"❌ Error sending to {number}: {e}")
+    return [number for number in recipients if number]
 
-    print(f"📊 WhatsApp message summary: {success_count}/{len(recipients)} successful")
+def send_wasms_whatsapp(message,send_others = False):
+    """Send WhatsApp message via WaSMS.net API to multiple recipients, waiting for the result"""
+    recipients = get_alert_recipients(send_others)
+    log.debug("📱 Recipients: %s", recipients)
+    success_count = sum(alert_delivery.send_now(message, number) for number in recipients)
+    log.info("📊 WhatsApp message summary: %d/%d successful", success_count, len(recipients))
     return success_count > 0
 
-def send_alert(topic, message_code, send_others = False):
+def send_alert(topic, message_code, send_others = False, rule=None, device=None):
     """Send alert to all devices (MQTT + WhatsApp)"""
     successful_sends = 0
+    device_label = f"📍 {device.name} ({device.site})" if device is not None else None
+    if device_label is not None:
+        message_code = f"{device_label}\n{message_code}"
     
-    # Message mapping for WhatsApp
-    whatsapp_messages = {
-        '01': f"⚠️ *INVERTER ALERT – BATTERY DRAINING FAST* ⚡️\n\n{message_code}\n\n⏰ Time: {datetime.now().strftime('%Y-%m-%d %I:%M:%S %p')}",
-        '02': f"🔥 *INVERTER ALERT – BATTERY LOAD LIMIT REACHED* 🚨\n\n{message_code}\n\n⏰ Time: {datetime.now().strftime('%Y-%m-%d %I:%M:%S %p')}",
-        '03': f"⚠️ *INVERTER ALERT – LOW BATTERY* ⚠️\n\n{message_code}\n\n⏰ Time: {datetime.now().strftime('%Y-%m-%d %I:%M:%S %p')}",
-        '04': f"🚨 *INVERTER ALERT – K-ELECTRIC POWER OUTAGE* 💡❌\n\n{message_code}\n\n⏰ Time: {datetime.now().strftime('%Y-%m-%d %I:%M:%S %p')}",
-        '05': f"⚡ *INVERTER ALERT – K-ELECTRIC POWER RESTORED* ✅\n\n{message_code}\n\n⏰ Time: {datetime.now().strftime('%Y-%m-%d %I:%M:%S %p')}",
-        '06': f"🌥️ *INVERTER ALERT – INSUFFICIENT SOLAR POWER* ☀️🔋\n\n{message_code}\n\n⏰ Time: {datetime.now().strftime('%Y-%m-%d %I:%M:%S %p')}"
-    }
-
-    
-    try:
-        # Send to MQTT (existing functionality)
-        # mqtt_client.publish(topic, message_code)
-        print(f"✅ Message sent to MQTT: {topic}, {message_code}")
-        successful_sends += 1
-    except Exception as e:
-        print(f"❌ Failed to send message to MQTT: {e}")
+    if mqtt_publisher is not None:
+        try:
+            # Retained, so subscribers that connect later still see the last alert
+            mqtt_publisher.publish_alert(topic, message_code, key=rule.key if rule else None,
+                                         severity=rule.severity if rule else None,
+                                         device=device.id if device else None)
+            log.info("✅ Alert published to MQTT: %s", topic)
+            successful_sends += 1
+        except Exception as e:
+            log.error("❌ Failed to publish alert to MQTT: %s", e)
     
     try:
-        # Send to WhatsApp via WaSMS
-        whatsapp_message = whatsapp_messages.get(topic, f"🔋 INVERTER ALERT\n\n{message_code}\n\nTimestamp: {datetime.now().strftime('%Y-%m-%d %I:%M:%S %p')}")
-        if send_wasms_whatsapp(whatsapp_message):
+        recipients = get_alert_recipients(send_others)
+        if not alert_coalescer.admit(topic, recipients, group=rule.group if rule else None, device=device_label):
+            # Part of a burst: counted for the digest the delivery worker sends when the window closes
+            log.info("🔁 Alert %s held for the WhatsApp digest", topic)
             successful_sends += 1
-            print(f"✅ Message sent to WhatsApp via WaSMS: {topic}")
+        # Queue for WhatsApp via WaSMS; the delivery worker sends it in the background
+        elif alert_delivery.submit(alert_templates.render(topic, message_code), recipients):
+            successful_sends += 1
+            log.info("✅ Message queued for WhatsApp via WaSMS: %s", topic)
     except Exception as e:
-        print(f"❌ Failed to send message to WhatsApp: {e}")
+        log.error("❌ Failed to queue message for WhatsApp: %s", e)
     
     return successful_sends
 
-cond_1_count = 0
-cond_2_count = 0
-cond_3_count = 0
-cond_6_count = 0
-grid_status = True
-
-def check_alerts(parsed_data):
-    """Check for various alert conditions and send whatsapp if needed"""
-    global last_alert_sent,grid_status
-    global cond_1_count,cond_2_count,cond_3_count,cond_6_count
-    current_time = time.time()
-    
+def check_alerts(sample):
+    """Run the alert rules on a QpigsRecord and send whatsapp for the ones that fire"""
     try:
-        # Convert string values to appropriate types
-        ac_output_power = float(parsed_data.get('ac_output_power', 0))
-        battery_capacity = float(parsed_data.get('battery_capacity', 0))
-        battery_voltage = float(parsed_data.get('battery_voltage', 0))
-        grid_voltage = float(parsed_data.get('grid_voltage', 0))
-        pv_power = float(parsed_data.get('pv_power',0))
-        battery_discharge_current = float(parsed_data.get('battery_discharge_current',0))
-        battery_charging_current = float(parsed_data.get('battery_charging_current',0))
-
-        # ---------------  Alert 01: High Draining Fast (e.g., > 25A), cond_1_count identifies number of times continous alerts sent
-
-        if battery_discharge_current > 25 and cond_1_count < 2 and grid_voltage < 10 and pv_power < 10: 
-            if (last_alert_sent['battery_drain_fast'] is None or 
-                current_time - last_alert_sent['battery_drain_fast'] > 3):  # 3 sec cooldown
-                send_alert('01',f"Current Load: {ac_output_power}Watts\nBattery Discharging At: {battery_discharge_current}A\nIt is higher than normal usage and battery will drop faster. Please reduce the load",True)
-                last_alert_sent['battery_drain_fast'] = current_time
-                cond_1_count += 1
-
-        # Reset condition for Alert 01
-        if battery_discharge_current < 22:
-            cond_1_count = 0
-
-        # --------------- 
-        # --------------- Alert 02: Battery Load Limit Reached (e.g., < 90A)
-
-        # battery_discharge_current = 100             # 100A for testing
-        if battery_discharge_current >= 90 and cond_2_count < 3:               
-            if (last_alert_sent['battery_drain_limit'] is None or
-                current_time - last_alert_sent['battery_drain_limit'] > 3):  # 3 secs cooldown
-                # alerts_triggered.append(f"ALERT! 🚨 BATTERY LOAD LIMIT:\n{battery_discharge_current}A ")
-                send_alert('02',f"Current Load: {ac_output_power}Watts\nBattery Discharging At: {battery_discharge_current}A\nIt exceeds 90A limit and battery might be damaged if exceeds 100A. Please reduce the load",True)
-                last_alert_sent['battery_drain_limit'] = current_time
-                cond_2_count += 1
-        
-        # Reset condition for Alert 02
-        if battery_discharge_current < 80:
-            cond_2_count = 0
-        
-        # --------------- 
-        # --------------- Alert 03: Low Battery (e.g., < 23.0)
-        if battery_voltage < 23.0 and battery_voltage > 19.0:
-            if (last_alert_sent['low_battery'] is None or 
-                current_time - last_alert_sent['low_battery'] > 3):  # 3 secs cooldown
-                # alerts_triggered.append(f"WARNING! ⚠️ LOW BATTERY:\nBattery at {battery_voltage}V - It will shutdown at 21.0V! Reduce the load to keep running for a bit longer")
-                send_alert('03',f"Current Load: {ac_output_power}Watts\nBattery Discharging At: {battery_discharge_current}A\nBattery Voltage: {battery_voltage}V\nIt will shutdown at 21.0V! Reduce the load to keep running for a bit longer",True)
-                last_alert_sent['low_battery'] = current_time
-
-        # --------------- 
-        # --------------- Alert 04: Grid Down
-        if grid_voltage == 0 and grid_status == True:
-            if (last_alert_sent['grid_down'] is None or 
-                current_time - last_alert_sent['grid_down'] > 3):
-                send_alert('04',f"Current Load: {ac_output_power}Watts\nBattery Charging At: {battery_charging_current}A\nBattery Discharging At: {battery_discharge_current}A")
-                last_alert_sent['grid_down'] = current_time
-                grid_status = False
-
-        # --------------- 
-        # --------------- Alert 05: Grid Up
-        if grid_voltage > 210 and grid_status == False:
-            if (last_alert_sent['grid_up'] is None or
-                current_time - last_alert_sent['grid_up'] > 3):
-                send_alert('05',f"Current Load: {ac_output_power}Watts\nBattery Charging At: {battery_charging_current}A\nBattery Discharging At: {battery_discharge_current}A")
-                last_alert_sent['grid_up'] = current_time
-                grid_status = True
-        
-        # ---------------  Alert 06: Insufficient Solar Power 
-        if battery_discharge_current >= 5.0 and battery_discharge_current <= 10.0 and cond_6_count <= 2 and grid_voltage < 10 and pv_power < 800 and ac_output_power > 500 and ac_output_power < 1000: 
-            if (last_alert_sent['insufficient_solar_power'] is None or 
-                current_time - last_alert_sent['insufficient_solar_power'] > 3):  # 3 secs cooldown
-                send_alert('06',f"Current Load: {ac_output_power}Watts\nComing from Solar: {pv_power}Watts\nBattery Discharging At: {battery_discharge_current}A\nPlease turn off the fridges or other extra load.",True)
-                last_alert_sent['insufficient_solar_power'] = current_time
-                cond_6_count += 1
-
-        # Reset condition for Alert 06
-        if battery_discharge_current < 22:
-            cond_6_count = 0    
-        
-            
-    except (ValueError, TypeError) as e:
-        print(f"❌ Error processing alerts: {e}")
+        for firing in alert_engine.evaluate(sample, time.time()):
+            send_alert(firing.rule.id, firing.message, firing.rule.recipients == 'all', firing.rule)
+    except (AttributeError, TypeError) as e:
+        log.error("❌ Error processing alerts: %s", e)
 
 def parse_inverter_data(data_line):
-    """Parse the inverter data line and extract meaningful values"""
-    try:
-        # Extract the data part - look for opening parenthesis
-        start = data_line.find('(')
-        if start == -1:
-            return None
-            
-        # Take everything after the opening parenthesis as data
-        data_part = data_line[start+1:].strip()
-        parts = data_part.split()
-        
-        print(f"🔍 Parsing {len(parts)} parts: {parts}")
-        
-        if len(parts) < 21:
-            return None
-        
-        timestamp_str = data_line[1:20] if data_line.startswith('[') else 'Unknown'
-        timestamp_obj = datetime.strptime(timestamp_str, "%Y-%m-%d %H:%M:%S")
-        timestamp_12h = timestamp_obj.strftime("%Y-%m-%d %I:%M:%S %p")
-
-        parsed_data = {
-            'grid_voltage': parts[0],
-            'grid_frequency': parts[1],
-            'ac_output_voltage': parts[2],
-            'ac_output_frequency': parts[3],
-            'output_apparent_power': parts[4],
-            'ac_output_power': parts[5],
-            'load_percentage': parts[6],
-            'bus_voltage': parts[7],
-            'battery_voltage': parts[8],
-            'battery_charging_current': parts[9],
-            'battery_discharge_current': parts[15],
-            'battery_capacity': parts[10],
-            'heat_sink_temp': parts[11],
-            'pv_voltage': parts[13],
-            'pv_power': parts[19],
-            'reserved': parts[15],
-            'status_bits': parts[16],
-            'fan_battery_offset': parts[17],
-            'eeprom_fw': parts[18],
-            'pv_charging_power': parts[12],
-            'device_status': parts[20],
-            'timestamp': timestamp_12h,
-            'last_updated': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        }
-        
-        # Check for alerts after parsing
-        check_alerts(parsed_data)
-        
-        return parsed_data
-        
-    except Exception as e:
-        print(f"Error parsing data: {e}")
-        print(f"Data line: {data_line}")
-        print(f"Parts: {parts if 'parts' in locals() else 'N/A'}")
+    """Parse the inverter data line into the dict shown by the dashboard and /api/data"""
+    record = parse_qpigs_line(data_line)
+    if record is None:
+        log.warning("Error parsing data line: %s", data_line)
         return None
+    return record.to_dict()
     
+def send_device_alerts(device, firings):
+    """Device hook: send the alerts a device's rules fired, oldest first"""
+    for firing in firings:
+        send_alert(firing.rule.id, firing.message, firing.rule.recipients == 'all', firing.rule,
+                   device if MULTI_DEVICE else None)
+
+def publish_samples_mqtt(device, batch):
+    """Publish every sample of a batch to MQTT (buffered by the publisher while offline)"""
+    if mqtt_publisher is None:
+        return
+    try:
+        for record in batch:
+            mqtt_publisher.publish_sample(record, device=device.id if MULTI_DEVICE else None)
+    except Exception as e:
+        log.error("❌ Failed to publish samples to MQTT: %s", e)
+
+def record_device_batch(device, batch):
+    """Device hook: MQTT for every device, history for the primary one"""
+    publish_samples_mqtt(device, batch)
+    if history_store is not None and device is primary_device:
+        history_store.append(batch)
+
+def flush_device_history(device):
+    """Device hook, every tick: write buffered history even when no new samples arrive"""
+    if history_store is not None and device is primary_device:
+        history_store.flush_if_due()
+
+device_registry.set_hooks(on_alerts=send_device_alerts, on_batch=record_device_batch,
+                          on_tick=flush_device_history)
+
+def process_samples(data_lines):
+    """Parse every new sample of the primary device, check alerts and publish the newest one"""
+    return primary_device.process(data_lines)
+
 def get_latest_inverter_data(lines):
     """Extract the most recent inverter data line (with parentheses)"""
     for line in reversed(lines):
@@ -339,104 +298,272 @@ def get_latest_inverter_data(lines):
             return line
     return None
 
-def copy_and_read_file():
-    """Copy the source file to temp location and read it"""
-    global file_read_attempts
-    
-    try:
-        if os.path.exists(temp_file_path):
-            os.remove(temp_file_path)
-        
-        shutil.copy2(file_path, temp_file_path)
-        file_read_attempts += 1
-        
-        with open(temp_file_path, "r", errors="ignore") as f:
-            content = f.read()
-            lines = content.splitlines()
-        
-        print(f"📋 Copied file (attempt #{file_read_attempts})")
-        print(f"📄 Read {len(lines)} lines from temp file")
-        return lines
-        
-    except Exception as e:
-        print(f"❌ Error copying/reading file: {e}")
-        return None
-
 def monitor_inverter():
-    """Monitor the inverter file and update global data"""
-    global current_inverter_data, file_read_attempts, file_path
-    
-    last_size = 0
-    last_raw_data = None
+    """Read samples from the data source and run them through the pipeline"""
+    log.info("🔋 Starting inverter monitoring from %s...", data_source.describe())
 
-    print("🔋 Starting inverter monitoring...")
-    
     while True:
         try:
-            current_file_path = get_todays_qpigs_path()
-            if current_file_path != file_path:
-                print(f"🔄 Date changed, switching to: {current_file_path}")
-                file_path = current_file_path
-                last_size = 0
-            
-            if not os.path.exists(file_path):
-                print("❌ Today's QPIGS file not found!")
-                time.sleep(5)
-                continue
-                
-            size = os.path.getsize(file_path)
-            print(f"📏 File size: {size} bytes (previous: {last_size})")
-            
+            data_lines = data_source.read()
         except Exception as e:
-            print(f"❌ Error checking file: {e}")
-            time.sleep(5)
+            log.error("❌ Error reading from %s source: %s", data_source.name, e)
+            time.sleep(POLL_INTERVAL)
             continue
 
-        if size != last_size or last_raw_data is None:
-            print("🔄 File changed or no previous data - processing...")
-            last_size = size
-            
-            lines = copy_and_read_file()
-            
-            if lines is not None:
-                data_line = get_latest_inverter_data(lines)
-
-                if data_line:
-                    print("✅ New inverter data found:")
-                    print(data_line)
-                    last_raw_data = data_line
-                    
-                    parsed_data = parse_inverter_data(data_line)
-                    if parsed_data:
-                        current_inverter_data.update(parsed_data)
-                        print(f"📊 SUCCESS! Updated web data: {current_inverter_data['ac_output_power']}W, "
-                              f"{current_inverter_data['battery_capacity']}% battery, "
-                              f"{current_inverter_data['ac_output_voltage']}V")
-                    else:
-                        print("❌ Failed to parse data for web display")
-                else:
-                    print("🔍 No inverter data lines found in file")
-                    if lines:
-                        print("📝 Last 5 lines in file:")
-                        for i, line in enumerate(lines[-5:]):
-                            print(f"  {i}: '{line}'")
+        if data_lines:
+            batch = process_samples(data_lines)
+            if batch:
+                watch_latency.record_event(data_source.last_event_time)
+                log.debug("📊 SUCCESS! Processed %d new samples, latest: %sW, %s%% battery, %sV",
+                          len(batch), current_inverter_data['ac_output_power'],
+                          current_inverter_data['battery_capacity'], current_inverter_data['ac_output_voltage'])
             else:
-                print("❌ Failed to read file")
-                
-        else:
-            print("ℹ️ No file change detected")
-
-        print("---")
-        time.sleep(5)
+                log.warning("❌ Failed to parse data for web display")
+        flush_device_history(primary_device)
 
 @app.route('/')
 def index():
-    return render_template('index.html', data=current_inverter_data)
+    return render_template('index.html', data=latest_snapshot.current.data)
 
 @app.route('/api/data')
 def api_data():
     """JSON API endpoint for other applications"""
-    return current_inverter_data
+    return snapshot_response(latest_snapshot.current)
+
+@app.route('/api/latency')
+def api_latency():
+    """Event-to-parse latency of the log watcher"""
+    return watch_latency.summary()
+
+@app.route('/api/pipeline')
+def api_pipeline():
+    """Number of samples processed per monitor tick, plus the alert delivery and MQTT queues"""
+    stats = dict(pipeline_stats, alert_delivery=dict(alert_delivery.stats, pending=alert_delivery.pending_count()))
+    stats['alert_digests'] = dict(alert_coalescer.stats, held_now=alert_coalescer.held_count(),
+                                  window=alert_coalescer.window)
+    stats['data_source'] = dict(getattr(data_source, 'stats', {}), source=data_source.describe())
+    if mqtt_publisher is not None:
+        stats['mqtt'] = dict(mqtt_publisher.stats, connected=mqtt_publisher.connected,
+                             buffered_now=mqtt_publisher.buffered_count())
+    if device_pool is not None:
+        stats['device_pool'] = device_pool.summary()
+    if chart_cache is not None:
+        stats['chart_cache'] = chart_cache.stats()
+    if async_runtime is not None:
+        stats['async_runtime'] = async_runtime.summary()
+    stats['checkpoint'] = dict(state_checkpoint.stats, interval=state_checkpoint.interval)
+    return stats
+
+def collect_monitor_metrics():
+    """Scrape-time gauges: the newest sample of each device plus queue and client counts"""
+    labels = ["device", "site"]
+    up = metrics.Gauge("inverter_up", "1 when the device sent a sample recently", labels)
+    last_sample = metrics.Gauge("inverter_last_sample_timestamp_seconds", "Unix time of the newest sample", labels)
+    fields = {name: metrics.Gauge(f"inverter_{name}", f"Latest QPIGS {name}", labels) for name in NUMERIC_FIELDS}
+    rolling = metrics.Gauge("inverter_rolling_metric", "Rolling-window alert metrics", labels + ["metric"])
+    sse_clients = metrics.Gauge("inverter_sse_clients", "Connected live-update (SSE) clients", labels)
+    for device in device_registry:
+        key = (device.id, device.site)
+        up.labels(*key).set(1 if device.is_online() else 0)
+        sse_clients.labels(*key).set(device.broadcaster.client_count)
+        record = device.latest
+        if record is None:
+            continue
+        last_sample.labels(*key).set(record.received)
+        for name, gauge in fields.items():
+            gauge.labels(*key).set(getattr(record, name))
+        for name, value in device.engine.metrics.snapshot().items():
+            rolling.labels(*key, name).set(value)
+    collected = [up, last_sample, sse_clients, *fields.values(), rolling]
+
+    queued = metrics.Gauge("alert_delivery_pending", "WhatsApp alerts waiting for delivery or a retry")
+    queued.set(alert_delivery.pending_count())
+    dropped = metrics.Counter("alert_delivery_dropped_total", "WhatsApp alerts dropped (queue full or out of retries)")
+    dropped.inc(alert_delivery.stats['dropped'])
+    held = metrics.Counter("alert_digest_held_total", "WhatsApp alerts held back for a digest")
+    held.inc(alert_coalescer.stats['held'])
+    digests = metrics.Counter("alert_digests_total", "WhatsApp digests sent for coalesced alerts")
+    digests.inc(alert_coalescer.stats['digests'])
+    collected += [queued, dropped, held, digests]
+    if mqtt_publisher is not None:
+        connected = metrics.Gauge("mqtt_connected", "1 while connected to the MQTT broker")
+        connected.set(1 if mqtt_publisher.connected else 0)
+        buffered = metrics.Gauge("mqtt_buffered", "MQTT messages buffered while offline")
+        buffered.set(mqtt_publisher.buffered_count())
+        mqtt_dropped = metrics.Counter("mqtt_dropped_total", "MQTT messages dropped because the offline buffer was full")
+        mqtt_dropped.inc(mqtt_publisher.stats['dropped'])
+        collected += [connected, buffered, mqtt_dropped]
+    if device_pool is not None:
+        overruns = metrics.Counter("device_pool_overruns_total", "Device ticks that started later than their interval")
+        overruns.inc(device_pool.stats['overruns'])
+        collected.append(overruns)
+    return collected
+
+metrics.REGISTRY.add_collector(collect_monitor_metrics)
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus scrape endpoint"""
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+def admin_only(view):
+    """Only serve `view` to requests carrying ADMIN_TOKEN; without a token set the route does not exist"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not ADMIN_TOKEN:
+            return {'error': 'Not found'}, 404
+        auth = request.headers.get('Authorization', '')
+        supplied = auth[len('Bearer '):] if auth.startswith('Bearer ') else request.args.get('token', '')
+        if not hmac.compare_digest(supplied.encode(), ADMIN_TOKEN.encode()):
+            return {'error': 'Unauthorized'}, 401
+        return view(*args, **kwargs)
+    return wrapper
+
+@app.route('/admin/profile/start', methods=['POST'])
+@admin_only
+def admin_profile_start():
+    """Start sampling stacks for ?seconds= (default 60, at most 3600), every ?interval_ms="""
+    try:
+        seconds = float(request.args.get('seconds', 60))
+        interval = float(request.args.get('interval_ms', 20)) / 1000
+    except ValueError:
+        return {'error': 'seconds and interval_ms must be numbers'}, 400
+    if not 0 < seconds <= 3600:
+        return {'error': 'seconds must be more than 0 and at most 3600'}, 400
+    if not profiler.start(seconds=seconds, interval=min(1.0, max(0.001, interval)),
+                          include_idle=request.args.get('idle') == '1'):
+        return dict(profiler.status(), error='Profiler already running'), 409
+    log.warning("🔬 Profiler started for %.0fs", seconds)
+    return profiler.status()
+
+@app.route('/admin/profile/stop', methods=['POST'])
+@admin_only
+def admin_profile_stop():
+    status = profiler.stop()
+    log.warning("🔬 Profiler stopped after %d samples (%.2f%% overhead)", status['samples'], status['overhead_pct'])
+    return status
+
+@app.route('/admin/profile')
+@admin_only
+def admin_profile_status():
+    """Profiler state and the functions the busy samples were in"""
+    return dict(profiler.status(), top=profiler.top())
+
+@app.route('/admin/profile/collapsed')
+@admin_only
+def admin_profile_collapsed():
+    """The profile so far as collapsed stacks, for flamegraph.pl / speedscope / inferno"""
+    filename = f"inverter-profile-{datetime.now():%Y%m%d-%H%M%S}.folded"
+    return Response(profiler.collapsed(), content_type="text/plain; charset=utf-8",
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+def snapshot_response(snapshot):
+    """Serve a pre-serialized Snapshot, answering 304 when the client already has it"""
+    headers = {'ETag': snapshot.etag, 'Cache-Control': 'no-cache'}
+    if request.headers.get('If-None-Match') == snapshot.etag:
+        return Response(status=304, headers=headers)
+    return Response(snapshot.body, mimetype='application/json', headers=headers)
+
+@app.route('/api/devices')
+def api_devices():
+    """Every configured inverter with its source, freshness and pipeline counters"""
+    return {'devices': [device.status() for device in device_registry]}
+
+@app.route('/api/devices/<device_id>/data')
+def api_device_data(device_id):
+    """Latest sample of one device, like /api/data"""
+    device = device_registry.get(device_id)
+    if device is None:
+        return {'error': f'Unknown device {device_id}'}, 404
+    return snapshot_response(device.snapshot.current)
+
+@app.route('/api/devices/<device_id>/stream')
+def api_device_stream(device_id):
+    """Server-Sent Events stream of one device, like /api/stream"""
+    device = device_registry.get(device_id)
+    if device is None:
+        return {'error': f'Unknown device {device_id}'}, 404
+    client = device.broadcaster.subscribe()
+    return Response(device.broadcaster.events(client), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/aggregate')
+def api_aggregate():
+    """PV, load and battery power summed across the online devices, in total and per site"""
+    return device_registry.aggregate()
+
+@app.route('/api/stream')
+def api_stream():
+    """Server-Sent Events stream: a full snapshot first, then only the fields that change"""
+    client = broadcaster.subscribe()
+    return Response(broadcaster.events(client), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def parse_time_arg(value, default):
+    """Accept epoch seconds or an ISO date/time in query strings"""
+    if not value:
+        return default
+    try:
+        seconds = float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+    if not math.isfinite(seconds):
+        raise ValueError(f"Not a time: {value}")
+    return seconds
+
+@app.route('/api/history')
+def api_history():
+    """Min/avg/max of one field over time, read from the coarsest rollup that fits `step`"""
+    if history_store is None:
+        return {'error': 'History is disabled'}, 503
+
+    field = request.args.get('field', 'pv_power')
+    try:
+        end = parse_time_arg(request.args.get('to'), time.time())
+        start = parse_time_arg(request.args.get('from'), end - 86400)
+        step = int(request.args.get('step') or max(1, (end - start) // 1000))
+        if step <= 0:
+            raise ValueError("step must be a positive number of seconds")
+        source, rows = history_store.iter_history(field, int(start), int(end), step)
+    except (ValueError, OverflowError) as e:
+        return {'error': str(e)}, 400
+
+    def generate():
+        # Streamed row by row; derived fields can be NULL, which has to come out as null
+        header = json.dumps({'field': field, 'from': int(start), 'to': int(end), 'step': step,
+                             'source_step': source, 'columns': ["t", "min", "avg", "max", "n"]})
+        yield header[:-1] + ', "points": ['
+        first = True
+        for t, lo, avg, hi, n in rows:
+            point = json.dumps([t, lo, round(avg, 3) if avg is not None else None, hi, n])
+            yield point if first else "," + point
+            first = False
+        yield ']}'
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+@app.route('/api/chart')
+def api_chart():
+    """One field over 1h/24h/7d, LTTB-downsampled on the server to `width` points"""
+    if chart_cache is None:
+        return {'error': 'History is disabled'}, 503
+    try:
+        chart = chart_cache.get(request.args.get('field', 'pv_power'), request.args.get('range', '24h'),
+                                int(request.args.get('width') or 600))
+    except ValueError as e:
+        return {'error': str(e)}, 400
+    return Response(chart, mimetype='application/json', headers={'Cache-Control': 'no-cache'})
+
+@app.route('/api/energy')
+def api_energy():
+    """Energy totals (kWh) for one day: load, PV, grid and battery in/out"""
+    if history_store is None:
+        return {'error': 'History is disabled'}, 503
+    day = request.args.get('day') or datetime.now().strftime("%Y-%m-%d")
+    try:
+        return daily_energy(history_store, day)
+    except ValueError as e:
+        return {'error': str(e)}, 400
 
 @app.route('/send-test-whatsapp')
 def send_test_whatsapp():
@@ -447,18 +574,23 @@ def send_test_whatsapp():
     mqtt_success = 0
     whatsapp_success = 0
     
-    try:
-        # mqtt_client.publish('test', 'Test message')
-        mqtt_success = 1
-        print("✅ Test message sent to MQTT")
-    except Exception as e:
-        print(f"❌ Failed to send test message to MQTT: {e}")
+    if mqtt_publisher is None:
+        log.warning("⚠️ MQTT is not configured (set MQTT_HOST)")
+    else:
+        try:
+            if mqtt_publisher.publish('test', test_message, qos=mqtt_publisher.qos_alerts):
+                mqtt_success = 1
+                log.info("✅ Test message sent to MQTT")
+            else:
+                log.warning("⚠️ MQTT broker not connected, test message buffered")
+        except Exception as e:
+            log.error("❌ Failed to send test message to MQTT: %s", e)
     
     if send_wasms_whatsapp(test_message):
         whatsapp_success = 1
-        print("✅ Test message sent to WhatsApp")
+        log.info("✅ Test message sent to WhatsApp")
     else:
-        print("❌ Failed to send test message to WhatsApp")
+        log.error("❌ Failed to send test message to WhatsApp")
     
     return f"Test messages sent - MQTT: {mqtt_success}, WhatsApp: {whatsapp_success}"
 
@@ -471,28 +603,114 @@ def get_wa_accounts():
     else:
         return "Failed to get WhatsApp accounts"
 
+def log_endpoints():
+    log.info("🚀 Starting web server...")
+    log.info("📡 Web interface available at: http://localhost:5000")
+    log.info("📊 JSON API available at: http://localhost:5000/api/data")
+    log.info("📡 Live updates (SSE) available at: http://localhost:5000/api/stream")
+    log.info("⏱️ Watcher latency available at: http://localhost:5000/api/latency")
+    log.info("🧮 Samples per tick available at: http://localhost:5000/api/pipeline")
+    log.info("📉 Prometheus metrics available at: http://localhost:5000/metrics")
+    log.info("📈 History available at: http://localhost:5000/api/history?field=pv_power&from=2025-10-11&step=900")
+    log.info("📉 Charts available at: http://localhost:5000/api/chart?field=pv_power&range=24h&width=600")
+    log.info("🔌 Daily energy available at: http://localhost:5000/api/energy?day=2025-10-11")
+    log.info("🏭 Devices available at: http://localhost:5000/api/devices (and /api/aggregate)")
+    log.info("📱 Test whatsapp available at: http://localhost:5000/send-test-whatsapp")
+    log.info("👥 Get WhatsApp accounts at: http://localhost:5000/get-accounts")
+    if ADMIN_TOKEN:
+        log.info("🔬 Profiler at: http://localhost:5000/admin/profile (POST .../start?seconds=60, .../stop, GET .../collapsed)")
+
+def create_web_server():
+    """Bind the web server (waitress when available, else the Flask dev server).
+
+    Returns (serve_forever, shutdown); shutdown() may be called from another thread.
+    """
+    if WEB_SERVER in ("auto", "waitress"):
+        try:
+            from waitress.server import create_server
+        except ImportError:
+            if WEB_SERVER == "waitress":
+                raise
+            log.warning("⚠️ waitress not installed, using the Flask development server")
+        else:
+            # Each open dashboard holds one SSE connection, so allow plenty of threads
+            log.info("🍽️ Serving with waitress (%d threads)", WEB_THREADS)
+            server = create_server(app, host=WEB_HOST, port=WEB_PORT, threads=WEB_THREADS)
+
+            def serve_forever():
+                try:
+                    server.run()
+                finally:
+                    server.task_dispatcher.shutdown(timeout=5)
+
+            def shutdown():
+                # Close every socket from waitress's own loop thread, which makes run() return
+                server.trigger.pull_trigger(lambda: server.asyncore.close_all(server._map))
+
+            return serve_forever, shutdown
+
+    from werkzeug.serving import make_server
+    server = make_server(WEB_HOST, WEB_PORT, app, threaded=True)
+    return server.serve_forever, server.shutdown
+
+def close_live_streams():
+    """End the open /api/stream connections, so the web server's threads can finish"""
+    for device in device_registry:
+        device.broadcaster.close()
+
+def stop_on_sigterm(signum, frame):
+    """SIGTERM (`kill`, systemd): exit through __main__'s finally, so the last state is saved"""
+    log.info("🛑 Terminated, shutting down...")
+    # Neither a dashboard stream nor a WaSMS retry may keep the web server from stopping
+    close_live_streams()
+    alert_delivery.stop()
+    sys.exit(0)
+
+def warm_start():
+    """Restore the last checkpoint and check the WaSMS accounts without holding up startup"""
+    if CHECKPOINT_INTERVAL > 0:
+        state_checkpoint.restore()
+    log.info("🔧 Checking WaSMS.net configuration in the background...")
+    threading.Thread(target=get_whatsapp_accounts, name="wasms-accounts", daemon=True).start()
+
 def start_web_server():
-    """Start the Flask web server"""
-    print("🚀 Starting web server...")
-    print("📡 Web interface available at: http://localhost:5000")
-    print("📊 JSON API available at: http://localhost:5000/api/data")
-    print("📱 Test whatsapp available at: http://localhost:5000/send-test-whatsapp")
-    print("👥 Get WhatsApp accounts at: http://localhost:5000/get-accounts")
-    app.run(host='192.168.18.101', port=5000, debug=False, use_reloader=False)
+    """Start the web server and serve until the process exits"""
+    log_endpoints()
+    serve_forever, _ = create_web_server()
+    serve_forever()
 
 if __name__ == "__main__":
-    print("🔋 Inverter Monitoring System Starting...")
-    print(f"📁 Monitoring file: {file_path}")
+    log.info("🔋 Inverter Monitoring System Starting...")
     
-    # First, let's get the WhatsApp accounts to help user configure
-    print("🔧 Checking WaSMS.net configuration...")
-    get_whatsapp_accounts()
-    
-    if not os.path.exists(file_path):
-        print("❌ Source file not found!")
+    if not MULTI_DEVICE and not data_source.ready():
+        log.error("❌ Data source not available!")
         exit()
     
-    monitor_thread = threading.Thread(target=monitor_inverter, daemon=True)
-    monitor_thread.start()
+    warm_start()
+    alert_delivery.start()
+    if mqtt_publisher is not None:
+        mqtt_publisher.start()
+    
+    if HISTORY_ENABLED:
+        history_store = open_history_store()
+        chart_cache = ChartCache(history_store)
+        state_checkpoint.history = history_store
+        log.info("🗄️ Recording history to: %s", history_store.path)
     
-    start_web_server()
\ No newline at end of file
+    if MULTI_DEVICE:
+        for configured_device in device_registry:
+            if not configured_device.source.ready():
+                log.warning("⚠️ Device %s not available yet, will keep polling", configured_device.id)
+        device_pool = DevicePool(device_registry, workers=DEVICE_WORKERS).start()
+    else:
+        monitor_thread = threading.Thread(target=monitor_inverter, daemon=True)
+        monitor_thread.start()
+    state_checkpoint.start()
+    signal.signal(signal.SIGTERM, stop_on_sigterm)
+    
+    try:
+        start_web_server()
+    finally:
+        if history_store is not None:
+            history_store.close()
+        state_checkpoint.stop()
\ No newline at end of file
@@ -0,0 +1,109 @@
+import json
+import queue
+import threading
+
+# Queued to a client to end its stream (see Broadcaster.close)
+_CLOSED = object()
+
+
+class LiveClient:
+    """One connected dashboard: a bounded queue of pending updates"""
+
+    def __init__(self, max_pending):
+        self.queue = queue.Queue(maxsize=max_pending)
+        # Set when updates had to be dropped; the client then gets a full snapshot
+        self.resync = False
+
+
+class Broadcaster:
+    """Fan-out of live sample updates to Server-Sent Events clients.
+
+    `publish()` is called from the monitor thread and never blocks: each
+    client has its own bounded queue, and a client that falls behind has its
+    backlog thrown away and is flagged to receive a full snapshot instead.
+    """
+
+    def __init__(self, max_pending=32):
+        self.max_pending = max_pending
+        self._clients = set()
+        self._lock = threading.Lock()
+        self._last = {}
+        self._closed = False
+
+    @property
+    def client_count(self):
+        return len(self._clients)
+
+    def subscribe(self):
+        client = LiveClient(self.max_pending)
+        client.resync = True
+        with self._lock:
+            self._clients.add(client)
+        return client
+
+    def unsubscribe(self, client):
+        with self._lock:
+            self._clients.discard(client)
+
+    def close(self):
+        """End every open stream, e.g. at shutdown, so no server thread is left waiting in one"""
+        with self._lock:
+            self._closed = True
+            clients = list(self._clients)
+        for client in clients:
+            _drain(client.queue)
+            try:
+                client.queue.put_nowait(_CLOSED)
+            except queue.Full:
+                # A publish() that was already under way refilled it; the stream checks on its next wake-up
+                pass
+
+    def publish(self, data):
+        """Send the fields of `data` that changed since the last publish; returns them"""
+        changes = {k: v for k, v in data.items() if self._last.get(k) != v}
+        self._last = dict(data)
+        if not changes:
+            return changes
+
+        message = json.dumps(changes)
+        with self._lock:
+            clients = list(self._clients)
+        for client in clients:
+            if self._closed:
+                break
+            try:
+                client.queue.put_nowait(message)
+            except queue.Full:
+                _drain(client.queue)
+                client.resync = True
+        return changes
+
+    def snapshot_message(self):
+        return json.dumps(self._last)
+
+    def events(self, client, keepalive=15):
+        """SSE byte stream for one client; unsubscribes when the client disconnects"""
+        try:
+            while not self._closed:
+                if client.resync:
+                    client.resync = False
+                    _drain(client.queue)
+                    yield f"event: snapshot\ndata: {self.snapshot_message()}\n\n"
+                try:
+                    message = client.queue.get(timeout=keepalive)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                if message is _CLOSED:
+                    return
+                yield f"data: {message}\n\n"
+        finally:
+            self.unsubscribe(client)
+
+
+def _drain(q):
+    while True:
+        try:
+            q.get_nowait()
+        except queue.Empty:
+            return
@@ -0,0 +1,150 @@
+import logging
+import os
+
+log = logging.getLogger(__name__)
+
+
+def _drop_partial_head(data, start):
+    """Drop the first line of a chunk read from `start`, unless `start` is the file start.
+
+    The chunk starts one byte early (see callers) so a chunk that begins
+    exactly on a line boundary only loses that preceding newline.
+    """
+    if start == 0:
+        return data
+    newline = data.find(b"\n")
+    return data[newline + 1:] if newline != -1 else b""
+
+
+class LogTailReader:
+    """Follow a growing log file and return only the lines appended since the last read.
+
+    Keeps one open handle and a byte offset so every poll costs O(new bytes)
+    instead of copying and re-reading the whole day's log. A trailing line that
+    WatchPower has not finished writing is held back until its newline arrives.
+    """
+
+    def __init__(self, recover_bytes=64 * 1024):
+        self.recover_bytes = recover_bytes
+        self.path = None
+        self.handle = None
+        self.file_id = None
+        self.offset = 0
+        self.partial = b""
+        self.bytes_read = 0
+        # True when the last read was a recovery from EOF rather than a true append
+        self.recovered = False
+
+    def close(self):
+        """Close the current handle and forget the file position"""
+        if self.handle is not None:
+            try:
+                self.handle.close()
+            except OSError:
+                pass
+        self.handle = None
+        self.file_id = None
+        self.offset = 0
+        self.partial = b""
+
+    def _open(self, path):
+        self.close()
+        self.handle = open(path, "rb")
+        st = os.fstat(self.handle.fileno())
+        self.file_id = (st.st_dev, st.st_ino)
+        self.path = path
+
+    def resume(self, path, offset, file_id=None):
+        """Continue tailing `path` from a saved `offset` instead of recovering from EOF.
+
+        Refused (returns False) when the file is not the one the offset was
+        saved for, or is now shorter than it.
+        """
+        try:
+            self._open(path)
+            size = os.fstat(self.handle.fileno()).st_size
+        except OSError as e:
+            log.warning("❌ Error resuming %s: %s", path, e)
+            self.close()
+            self.path = None
+            return False
+        if (file_id is not None and tuple(file_id) != self.file_id) or size < offset:
+            self.close()
+            self.path = None
+            return False
+        self.offset = offset
+        return True
+
+    def read_new_lines(self, path, from_start=False):
+        """Return the complete lines appended to `path` since the last call.
+
+        On the first call for a file (startup, or after an unexpected truncate
+        or replace) the reader recovers with a bounded reverse seek from EOF so
+        the latest sample is available without scanning the whole file. Pass
+        `from_start=True` when switching to a fresh day's file so no samples
+        written before the first poll are skipped.
+
+        Returns None if the file cannot be read.
+        """
+        try:
+            if path != self.path or self.handle is None:
+                self._open(path)
+                if not from_start:
+                    return self._recover()
+
+            st = os.stat(path)
+            if (st.st_dev, st.st_ino) != self.file_id or st.st_size < self.offset:
+                # File was replaced or truncated underneath us
+                self._open(path)
+                return self._recover()
+
+            self.recovered = False
+            if st.st_size == self.offset:
+                return []
+
+            self.handle.seek(self.offset)
+            data = self.handle.read(st.st_size - self.offset)
+            self.offset += len(data)
+            self.bytes_read += len(data)
+            return self._split(data)
+
+        except OSError as e:
+            log.warning("❌ Error tailing file: %s", e)
+            self.close()
+            self.path = None
+            return None
+
+    def _recover(self):
+        """Seek back at most `recover_bytes` from EOF and return the tail lines"""
+        self.recovered = True
+        size = os.fstat(self.handle.fileno()).st_size
+        start = max(0, size - self.recover_bytes - 1)
+        self.handle.seek(start)
+        data = self.handle.read(size - start)
+        self.offset = start + len(data)
+        self.bytes_read += len(data)
+        return self._split(_drop_partial_head(data, start))
+
+    def read_last_lines(self, path, max_bytes=None):
+        """Return the complete lines in the last `max_bytes` of `path` without moving the tail position"""
+        max_bytes = max_bytes or self.recover_bytes
+        try:
+            with open(path, "rb") as f:
+                f.seek(0, os.SEEK_END)
+                size = f.tell()
+                start = max(0, size - max_bytes - 1)
+                f.seek(start)
+                data = f.read()
+        except OSError as e:
+            log.warning("❌ Error reading tail of file: %s", e)
+            return None
+        return _drop_partial_head(data, start).decode("utf-8", errors="ignore").splitlines()
+
+    def _split(self, data):
+        data = self.partial + data
+        end = data.rfind(b"\n")
+        if end == -1:
+            self.partial = data
+            return []
+        self.partial = data[end + 1:]
+        return data[:end].decode("utf-8", errors="ignore").splitlines()
@@ -0,0 +1,167 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import sys
+import time
+
+log = logging.getLogger(__name__)
+
+# inotify constants from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class LatencyStats:
+    """Running event-to-parse latency counters for the monitor loop"""
+
+    def __init__(self, target=0.1):
+        self.target = target
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+        self.within_target = 0
+        self._last_event = None
+
+    def record_event(self, event_time):
+        """Record the age of the watcher event `event_time` (monotonic), once per event.
+
+        A read that returns on a wait timeout still sees the previous
+        event's time, and counting it again would record a stale age.
+        """
+        if event_time is None or event_time == self._last_event:
+            return False
+        self._last_event = event_time
+        self.record(time.monotonic() - event_time)
+        return True
+
+    def record(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.last = seconds
+        if seconds > self.max:
+            self.max = seconds
+        if seconds <= self.target:
+            self.within_target += 1
+
+    def summary(self):
+        return {
+            'samples': self.count,
+            'last_ms': round(self.last * 1000, 3),
+            'avg_ms': round(self.total / self.count * 1000, 3) if self.count else 0,
+            'max_ms': round(self.max * 1000, 3),
+            'within_target_pct': round(self.within_target / self.count * 100, 1) if self.count else 0,
+            'target_ms': self.target * 1000,
+        }
+
+
+class PollingWatcher:
+    """Fallback watcher: wakes every `interval` seconds whether or not the file changed"""
+
+    mode = "poll"
+
+    def __init__(self, interval=5):
+        self.interval = interval
+        self.last_event_time = None
+
+    def wait(self, timeout=None):
+        time.sleep(self.interval)
+        self.last_event_time = time.monotonic()
+        return True
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """Wake up as soon as a file in `directory` is modified or created (Linux only).
+
+    Uses libc's inotify through ctypes so no extra dependency is needed.
+    `wait()` returns True when a matching event arrived and False on timeout,
+    so the caller can still run its periodic checks (e.g. the midnight file
+    switch).
+    """
+
+    mode = "inotify"
+
+    def __init__(self, directory, filename_filter=None):
+        libc_name = ctypes.util.find_library("c") or "libc.so.6"
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        mask = IN_MODIFY | IN_CLOSE_WRITE | IN_CREATE | IN_MOVED_TO
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory), mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(err, f"inotify_add_watch failed for {directory}")
+
+        self.filename_filter = filename_filter
+        self.last_event_time = None
+
+    def _read_events(self):
+        """Drain pending events and return the names of the files they refer to"""
+        names = []
+        while True:
+            try:
+                buf = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return names
+            offset = 0
+            while offset + _EVENT_HEADER.size <= len(buf):
+                _, _, _, name_len = _EVENT_HEADER.unpack_from(buf, offset)
+                offset += _EVENT_HEADER.size
+                name = buf[offset:offset + name_len].rstrip(b"\0")
+                offset += name_len
+                names.append(os.fsdecode(name))
+
+    def wait(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            ready, _, _ = select.select([self.fd], [], [], remaining)
+            if not ready:
+                return False
+
+            now = time.monotonic()
+            names = self._read_events()
+            if self.filename_filter is None or any(self.filename_filter(n) for n in names):
+                self.last_event_time = now
+                return True
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+def create_watcher(mode, directory, interval=5, filename_filter=None):
+    """Create the log watcher selected by `mode` ("auto", "inotify" or "poll").
+
+    "auto" uses inotify on Linux and falls back to polling anywhere else or
+    if inotify cannot be set up.
+    """
+    mode = (mode or "auto").lower()
+    if mode in ("auto", "inotify") and sys.platform.startswith("linux"):
+        try:
+            watcher = InotifyWatcher(directory, filename_filter)
+            log.info("👀 Watching %s with inotify", directory)
+            return watcher
+        except (OSError, AttributeError) as e:
+            log.warning("⚠️ inotify unavailable (%s), falling back to polling", e)
+    elif mode == "inotify":
+        log.warning("⚠️ inotify is only available on Linux, falling back to polling")
+
+    log.info("⏱️ Polling %s every %ss", directory, interval)
+    return PollingWatcher(interval)
@@ -0,0 +1,236 @@
+import json
+import logging
+import os
+import struct
+import threading
+import time
+from collections import deque
+
+import paho.mqtt.client as mqtt
+
+from qpigs_parser import QPIGS_FIELDS
+
+log = logging.getLogger(__name__)
+
+NUMERIC_FIELDS = tuple(name for name, kind in QPIGS_FIELDS if kind is not str)
+
+# Packed sample: format version, epoch, then every numeric field as float32
+PACKED_VERSION = 1
+PACKED_FORMAT = struct.Struct("<Bd" + "f" * len(NUMERIC_FIELDS))
+
+TOPIC_MODES = ('aggregate', 'fields', 'both')
+PAYLOAD_FORMATS = ('json', 'binary')
+
+
+def pack_sample(record):
+    """Binary payload of a QpigsRecord (see PACKED_FORMAT)"""
+    return PACKED_FORMAT.pack(PACKED_VERSION, record.epoch or 0.0,
+                              *(getattr(record, name) for name in NUMERIC_FIELDS))
+
+
+def unpack_sample(payload):
+    """Inverse of pack_sample(), for subscribers written in Python"""
+    values = PACKED_FORMAT.unpack(payload)
+    if values[0] != PACKED_VERSION:
+        raise ValueError(f"unknown packed sample version {values[0]}")
+    sample = dict(zip(NUMERIC_FIELDS, (round(v, 3) for v in values[2:])))
+    sample['epoch'] = values[1]
+    return sample
+
+
+def sample_json(record):
+    """Compact JSON payload of a QpigsRecord with the protocol field names"""
+    data = {name: getattr(record, name) for name, _ in QPIGS_FIELDS}
+    data['epoch'] = record.epoch
+    return json.dumps(data, separators=(',', ':'))
+
+
+class MqttPublisher:
+    """Publishes samples and alerts over one long-lived, self-reconnecting MQTT client.
+
+    paho's network loop runs in its own thread (`loop_start`) and reconnects
+    with backoff after the broker goes away. While disconnected, messages
+    are kept in a bounded offline buffer (oldest dropped first) and sent once
+    the connection is back. Telemetry topics skip values that did not change,
+    but are republished every `republish_interval` seconds so subscribers can
+    tell the monitor is alive. Alerts are retained, so a dashboard that
+    subscribes later still sees the last one.
+
+    Topics, under `base_topic`:
+        status              "online"/"offline" (retained, also the last will)
+        state               full sample, JSON or packed binary (aggregate mode)
+        <field>             one numeric field as text (fields mode)
+        <device>/...        the above per device, in multi-device mode
+        alert/<id>          last firing of each alert rule (retained)
+        alert/last          last alert of any rule (retained)
+    """
+
+    def __init__(self, host, port=1883, base_topic="inverter", topics="aggregate", payload="json",
+                 qos_telemetry=0, qos_alerts=1, username=None, password=None, client_id=None,
+                 keepalive=30, max_buffer=1000, republish_interval=300, client=None):
+        if topics not in TOPIC_MODES:
+            raise ValueError(f"unknown MQTT topic mode {topics!r}")
+        if payload not in PAYLOAD_FORMATS:
+            raise ValueError(f"unknown MQTT payload format {payload!r}")
+        self.host = host
+        self.port = port
+        self.base_topic = base_topic.rstrip("/")
+        self.topics = topics
+        self.payload = payload
+        self.qos_telemetry = qos_telemetry
+        self.qos_alerts = qos_alerts
+        self.keepalive = keepalive
+        self.republish_interval = republish_interval
+
+        self.connected = False
+        self._ever_connected = False
+        self._buffer = deque()
+        self._max_buffer = max_buffer
+        self._last = {}
+        self._lock = threading.Lock()
+        self.stats = {'published': 0, 'deduplicated': 0, 'buffered': 0, 'dropped': 0, 'reconnects': 0}
+
+        self.client = client or _new_client(client_id)
+        if username:
+            self.client.username_pw_set(username, password)
+        self.client.will_set(self.topic("status"), "offline", qos=1, retain=True)
+        self.client.reconnect_delay_set(min_delay=1, max_delay=60)
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+
+    def topic(self, suffix):
+        return f"{self.base_topic}/{suffix}"
+
+    # ------------------------------------------------------------------ public
+
+    def start(self):
+        log.info("📡 Connecting to MQTT broker %s:%s", self.host, self.port)
+        self.client.connect_async(self.host, self.port, keepalive=self.keepalive)
+        self.client.loop_start()
+        return self
+
+    def stop(self):
+        if self.connected:
+            self.client.publish(self.topic("status"), "offline", qos=1, retain=True)
+        self.client.disconnect()
+        self.client.loop_stop()
+
+    def publish_sample(self, record, device=None):
+        """Publish one parsed sample to the telemetry topics (under base/<device>/ if given)"""
+        prefix = f"{device}/" if device else ""
+        if self.topics in ('aggregate', 'both'):
+            if self.payload == 'binary':
+                payload = pack_sample(record)
+                key = payload[1 + 8:]
+            else:
+                payload = sample_json(record)
+                key = tuple(getattr(record, name) for name, _ in QPIGS_FIELDS)
+            self._publish_changed(prefix + "state", key, payload)
+        if self.topics in ('fields', 'both'):
+            for name in NUMERIC_FIELDS:
+                value = getattr(record, name)
+                self._publish_changed(prefix + name, value, str(value))
+
+    def publish_alert(self, alert_id, message, key=None, severity=None, when=None, device=None):
+        """Publish an alert to its retained per-rule topic and to alert/last"""
+        prefix = f"{device}/" if device else ""
+        payload = json.dumps({
+            'id': alert_id,
+            'device': device,
+            'key': key,
+            'severity': severity,
+            'message': message,
+            'time': when if when is not None else time.time(),
+        }, ensure_ascii=False, separators=(',', ':'))
+        self.publish(f"{prefix}alert/{alert_id}", payload, qos=self.qos_alerts, retain=True)
+        self.publish("alert/last", payload, qos=self.qos_alerts, retain=True)
+
+    def publish(self, suffix, payload, qos=0, retain=False):
+        """Publish to base_topic/suffix, buffering while the broker is unreachable"""
+        message = (self.topic(suffix), payload, qos, retain)
+        with self._lock:
+            if self.connected and self._send(message):
+                return True
+            if len(self._buffer) >= self._max_buffer:
+                self._buffer.popleft()
+                self.stats['dropped'] += 1
+            self._buffer.append(message)
+            self.stats['buffered'] += 1
+        return False
+
+    def buffered_count(self):
+        return len(self._buffer)
+
+    # ---------------------------------------------------------------- internal
+
+    def _publish_changed(self, suffix, key, payload):
+        now = time.monotonic()
+        # paho's thread clears _last on reconnect, so check and update it under the lock
+        with self._lock:
+            last = self._last.get(suffix)
+            if last is not None and last[0] == key and now - last[1] < self.republish_interval:
+                self.stats['deduplicated'] += 1
+                return
+            self._last[suffix] = (key, now)
+        self.publish(suffix, payload, qos=self.qos_telemetry)
+
+    def _send(self, message):
+        # Caller holds self._lock
+        topic, payload, qos, retain = message
+        info = self.client.publish(topic, payload, qos=qos, retain=retain)
+        if info.rc != mqtt.MQTT_ERR_SUCCESS:
+            return False
+        self.stats['published'] += 1
+        return True
+
+    def _on_connect(self, client, userdata, flags, reason_code, properties=None):
+        if getattr(reason_code, 'is_failure', reason_code != 0):
+            log.error("❌ MQTT connection refused: %s", reason_code)
+            return
+        log.info("✅ Connected to MQTT broker %s:%s", self.host, self.port)
+        client.publish(self.topic("status"), "online", qos=1, retain=True)
+        with self._lock:
+            if self._ever_connected:
+                self.stats['reconnects'] += 1
+            self.connected = self._ever_connected = True
+            # Telemetry is republished in full after a reconnect
+            self._last.clear()
+            if self._buffer:
+                log.info("📬 Sending %d MQTT messages buffered while offline", len(self._buffer))
+            while self._buffer:
+                if not self._send(self._buffer[0]):
+                    break
+                self._buffer.popleft()
+
+    def _on_disconnect(self, client, userdata, *args):
+        with self._lock:
+            self.connected = False
+        log.warning("⚠️ Disconnected from MQTT broker, reconnecting in the background")
+
+
+def _new_client(client_id):
+    # paho-mqtt 2.x wants the callback API version; 1.x has no such argument
+    if hasattr(mqtt, "CallbackAPIVersion"):
+        return mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=client_id or "")
+    return mqtt.Client(client_id=client_id or "")
+
+
+def open_mqtt_publisher():
+    """MqttPublisher configured from MQTT_* environment variables, or None without MQTT_HOST"""
+    host = os.getenv("MQTT_HOST")
+    if not host:
+        return None
+    return MqttPublisher(
+        host,
+        port=int(os.getenv("MQTT_PORT", "1883")),
+        base_topic=os.getenv("MQTT_BASE_TOPIC", "inverter"),
+        topics=os.getenv("MQTT_TOPICS", "aggregate"),
+        payload=os.getenv("MQTT_PAYLOAD", "json"),
+        qos_telemetry=int(os.getenv("MQTT_QOS_TELEMETRY", "0")),
+        qos_alerts=int(os.getenv("MQTT_QOS_ALERTS", "1")),
+        username=os.getenv("MQTT_USERNAME"),
+        password=os.getenv("MQTT_PASSWORD"),
+        client_id=os.getenv("MQTT_CLIENT_ID"),
+        max_buffer=int(os.getenv("MQTT_BUFFER", "1000")),
+        republish_interval=float(os.getenv("MQTT_REPUBLISH_INTERVAL", "300")),
+    )
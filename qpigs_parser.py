@@ -0,0 +1,149 @@
+import time
+from datetime import datetime
+
+# QPIGS response fields in protocol order, with the type each one is stored as
+QPIGS_FIELDS = (
+    ('grid_voltage', float),
+    ('grid_frequency', float),
+    ('ac_output_voltage', float),
+    ('ac_output_frequency', float),
+    ('output_apparent_power', int),
+    ('ac_output_power', int),
+    ('load_percentage', int),
+    ('bus_voltage', int),
+    ('battery_voltage', float),
+    ('battery_charging_current', int),
+    ('battery_capacity', int),
+    ('heat_sink_temp', int),
+    ('pv_input_current', float),
+    ('pv_voltage', float),
+    ('battery_voltage_scc', float),
+    ('battery_discharge_current', int),
+    ('status_bits', str),
+    ('fan_battery_offset', int),
+    ('eeprom_fw', str),
+    ('pv_power', int),
+    ('device_status', str),
+)
+
+QPIGS_FIELD_COUNT = len(QPIGS_FIELDS)
+
+# Midnight epoch per "YYYY-MM-DD", so each line only needs integer maths
+_midnight_cache = {}
+
+
+def _midnight_epoch(day):
+    epoch = _midnight_cache.get(day)
+    if epoch is None:
+        epoch = time.mktime((int(day[0:4]), int(day[5:7]), int(day[8:10]), 0, 0, 0, 0, 0, -1))
+        if len(_midnight_cache) > 64:
+            _midnight_cache.clear()
+        _midnight_cache[day] = epoch
+    return epoch
+
+
+class QpigsRecord:
+    """One parsed QPIGS sample with numeric fields and a precomputed epoch timestamp"""
+
+    __slots__ = tuple(name for name, _ in QPIGS_FIELDS) + ('epoch', 'received', 'derived')
+
+    def __init__(self, parts, epoch, received):
+        self.grid_voltage = float(parts[0])
+        self.grid_frequency = float(parts[1])
+        self.ac_output_voltage = float(parts[2])
+        self.ac_output_frequency = float(parts[3])
+        self.output_apparent_power = int(parts[4])
+        self.ac_output_power = int(parts[5])
+        self.load_percentage = int(parts[6])
+        self.bus_voltage = int(parts[7])
+        self.battery_voltage = float(parts[8])
+        self.battery_charging_current = int(parts[9])
+        self.battery_capacity = int(parts[10])
+        self.heat_sink_temp = int(parts[11])
+        self.pv_input_current = float(parts[12])
+        self.pv_voltage = float(parts[13])
+        self.battery_voltage_scc = float(parts[14])
+        self.battery_discharge_current = int(parts[15])
+        self.status_bits = parts[16]
+        self.fan_battery_offset = int(parts[17])
+        self.eeprom_fw = parts[18]
+        self.pv_power = int(parts[19])
+        self.device_status = parts[20]
+        self.epoch = epoch
+        self.received = received
+        # Filled in by energy_model.EnergyModel
+        self.derived = None
+
+    def to_dict(self):
+        """API/dashboard view of the sample, using the field names /api/data has always had"""
+        return {
+            'grid_voltage': self.grid_voltage,
+            'grid_frequency': self.grid_frequency,
+            'ac_output_voltage': self.ac_output_voltage,
+            'ac_output_frequency': self.ac_output_frequency,
+            'output_apparent_power': self.output_apparent_power,
+            'ac_output_power': self.ac_output_power,
+            'load_percentage': self.load_percentage,
+            'bus_voltage': self.bus_voltage,
+            'battery_voltage': self.battery_voltage,
+            'battery_charging_current': self.battery_charging_current,
+            'battery_discharge_current': self.battery_discharge_current,
+            'battery_capacity': self.battery_capacity,
+            'heat_sink_temp': self.heat_sink_temp,
+            'pv_voltage': self.pv_voltage,
+            'pv_power': self.pv_power,
+            'pv_input_current': self.pv_input_current,
+            'status_bits': self.status_bits,
+            'fan_battery_offset': self.fan_battery_offset,
+            'eeprom_fw': self.eeprom_fw,
+            # Old name of pv_input_current (it is a current, not a power), kept for API clients
+            'pv_charging_power': self.pv_input_current,
+            'device_status': self.device_status,
+            'timestamp': format_epoch_12h(self.epoch),
+            'last_updated': datetime.fromtimestamp(self.received).strftime("%Y-%m-%d %H:%M:%S"),
+        }
+
+
+def format_epoch_12h(epoch):
+    """Format an epoch the way the dashboard shows sample times"""
+    if epoch is None:
+        return 'Unknown'
+    return datetime.fromtimestamp(epoch).strftime("%Y-%m-%d %I:%M:%S %p")
+
+
+def parse_timestamp(line):
+    """Epoch seconds of a "[YYYY-MM-DD HH:MM:SS] ..." log line, or None if it has no timestamp"""
+    if line[0:1] != '[' or line[20:21] != ']':
+        return None
+    return (_midnight_epoch(line[1:11])
+            + int(line[12:14]) * 3600 + int(line[15:17]) * 60 + int(line[18:20]))
+
+
+def parse_qpigs_line(line, received=None):
+    """Parse one WatchPower log line into a QpigsRecord, or None if it is not a valid sample"""
+    start = line.find('(')
+    if start == -1:
+        return None
+
+    parts = line[start + 1:].split()
+    if len(parts) < QPIGS_FIELD_COUNT:
+        return None
+
+    try:
+        return QpigsRecord(parts, parse_timestamp(line),
+                           time.time() if received is None else received)
+    except (ValueError, IndexError):
+        return None
+
+
+def parse_qpigs_lines(lines, received=None):
+    """Parse many lines in one go, dropping the ones that are not valid samples"""
+    if received is None:
+        received = time.time()
+    records = []
+    append = records.append
+    for line in lines:
+        record = parse_qpigs_line(line, received)
+        if record is not None:
+            append(record)
+    return records
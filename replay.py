@@ -0,0 +1,281 @@
+"""Replay recorded Serial-QPIGS.log files (or .qpc day files) through the monitor pipeline.
+
+Samples go through the same stages as the live monitor: QPIGS parser, alert
+engine and dashboard state update (snapshot + live broadcast). Time is
+virtual: rule cooldowns and rolling metrics follow the sample timestamps,
+and `--speed` paces the replay at N times real time (0 = as fast as
+possible). Nothing is sent; the alerts that would have fired are collected
+into a report together with per-stage throughput, so rule changes can be
+checked against weeks of real data in seconds. With `--coalesce SECONDS`
+the fired alerts also go through the WhatsApp digest window, to see how
+many messages a storm would really send.
+
+    python replay.py LOG_OR_DIR [...] [--speed N] [--rules PATH] [--coalesce SECONDS]
+                     [--report out.json] [--expect previous.json]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import Counter
+
+from alert_messages import AlertCoalescer, AlertTemplates
+from alert_rules import load_alert_engine
+from backfill import find_daily_logs
+from day_archive import SUFFIX, DayFile, find_day_files
+from live_updates import Broadcaster
+from qpigs_parser import format_epoch_12h, parse_qpigs_lines
+from snapshot import SnapshotHolder
+
+READ_CHUNK = 2000
+
+
+class VirtualClock:
+    """Simulated time driven by the sample timestamps.
+
+    `advance()` moves the clock to a sample time and, unless the speed is
+    0, sleeps so that simulated time runs at `speed` times wall time.
+    """
+
+    def __init__(self, speed=0.0):
+        self.speed = speed
+        self.now = None
+        self.start_sim = None
+        self.start_wall = None
+        self.slept = 0.0
+
+    def advance(self, sim_time):
+        if sim_time is None:
+            return self.now
+        if self.start_sim is None:
+            self.start_sim = sim_time
+            self.start_wall = time.perf_counter()
+        self.now = sim_time if self.now is None else max(self.now, sim_time)
+        if self.speed > 0:
+            due = self.start_wall + (self.now - self.start_sim) / self.speed
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+                self.slept += delay
+        return self.now
+
+    def simulated_seconds(self):
+        return 0.0 if self.start_sim is None else self.now - self.start_sim
+
+
+class StageTimer:
+    """Accumulated wall time and item counts per pipeline stage"""
+
+    def __init__(self, *stages):
+        self.seconds = {stage: 0.0 for stage in stages}
+        self.items = {stage: 0 for stage in stages}
+
+    def add(self, stage, seconds, items):
+        self.seconds[stage] += seconds
+        self.items[stage] += items
+
+    def summary(self):
+        return {stage: {
+            'seconds': round(seconds, 4),
+            'items': self.items[stage],
+            'per_second': round(self.items[stage] / seconds) if seconds > 0 else None,
+        } for stage, seconds in self.seconds.items()}
+
+
+def expand_paths(paths):
+    """Files to replay, in order; directories expand to their daily logs (or else day files)"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(find_daily_logs(path) or find_day_files(path))
+        else:
+            files.append(path)
+    return files
+
+
+def read_chunks(files, timer, chunk=READ_CHUNK):
+    """Yield lists of data lines from `files`, timing the reads"""
+    for path in files:
+        if path.endswith(SUFFIX):
+            yield from _day_file_chunks(path, timer, chunk)
+            continue
+        with open(path, "r", errors="ignore") as f:
+            while True:
+                started = time.perf_counter()
+                lines = [line for line in (f.readline() for _ in range(chunk)) if line]
+                data_lines = [line for line in lines if "(" in line]
+                timer.add('read', time.perf_counter() - started, len(lines))
+                if not lines:
+                    break
+                if data_lines:
+                    yield data_lines
+
+
+def _day_file_chunks(path, timer, chunk):
+    lines = DayFile(path).iter_lines()
+    while True:
+        started = time.perf_counter()
+        data_lines = [line for _, line in zip(range(chunk), lines)]
+        timer.add('read', time.perf_counter() - started, len(data_lines))
+        if not data_lines:
+            break
+        yield data_lines
+
+
+def split_by_time(records, batch_seconds):
+    """Group parsed records into the batches a monitor polling every `batch_seconds` would see"""
+    batch = []
+    batch_end = None
+    for record in records:
+        if record.epoch is not None:
+            if batch_end is None:
+                batch_end = record.epoch + batch_seconds
+            elif record.epoch >= batch_end:
+                if batch:
+                    yield batch
+                batch = []
+                batch_end = record.epoch + batch_seconds
+        batch.append(record)
+    if batch:
+        yield batch
+
+
+def replay(files, engine, speed=0.0, batch_seconds=5.0, coalesce=None):
+    """Run every sample in `files` through parse -> alerts -> state; returns the report dict"""
+    clock = VirtualClock(speed)
+    timer = StageTimer('read', 'parse', 'alerts', 'state')
+    state = {}
+    snapshots = SnapshotHolder(state)
+    broadcaster = Broadcaster()
+    fired = []
+    coalescer = AlertCoalescer(coalesce, AlertTemplates()) if coalesce is not None else None
+    messages = 0
+    lines_total = samples_total = 0
+    sample_clock = lambda s: s.epoch if s.epoch is not None else clock.now
+
+    wall_started = time.perf_counter()
+    for data_lines in read_chunks(files, timer):
+        started = time.perf_counter()
+        records = parse_qpigs_lines(data_lines)
+        timer.add('parse', time.perf_counter() - started, len(data_lines))
+        lines_total += len(data_lines)
+        samples_total += len(records)
+
+        for batch in split_by_time(records, batch_seconds):
+            clock.advance(batch[-1].epoch)
+
+            started = time.perf_counter()
+            firings = engine.evaluate_batch(batch, sample_clock)
+            fired.extend(firings)
+            timer.add('alerts', time.perf_counter() - started, len(batch))
+            if coalescer is not None:
+                messages += sum(coalescer.admit(f.rule.id, ['replay'], group=f.rule.group, now=f.time)
+                                for f in firings)
+                messages += len(coalescer.due(clock.now))
+
+            started = time.perf_counter()
+            state.update(batch[-1].to_dict())
+            state['metrics'] = engine.metrics.snapshot()
+            snapshots.publish(state)
+            broadcaster.publish(state)
+            timer.add('state', time.perf_counter() - started, len(batch))
+    wall = time.perf_counter() - wall_started
+
+    simulated = clock.simulated_seconds()
+    if coalescer is not None:
+        messages += len(coalescer.due(float('inf')))
+    report = {
+        'files': [os.path.basename(path) for path in files],
+        'lines': lines_total,
+        'samples': samples_total,
+        'parse_failures': lines_total - samples_total,
+        'simulated_seconds': round(simulated, 1),
+        'wall_seconds': round(wall, 3),
+        'sleep_seconds': round(clock.slept, 3),
+        'speedup': round(simulated / wall) if wall > 0 else None,
+        'stages': timer.summary(),
+        'alert_counts': dict(sorted(Counter(f.rule.id for f in fired).items())),
+        'alerts': [{
+            'time': format_epoch_12h(f.time) if f.time is not None else None,
+            'epoch': f.time,
+            'rule': f.rule.id,
+            'key': f.rule.key,
+            'severity': f.rule.severity,
+            'message': f.message,
+        } for f in fired],
+    }
+    if coalescer is not None:
+        report['whatsapp'] = dict(coalescer.stats, window=coalesce, messages=messages)
+    return report
+
+
+def compare_alerts(expected, actual):
+    """Differences between two reports' alert lists as (missing, unexpected)"""
+    key = lambda alert: (alert['epoch'], alert['rule'])
+    expected_keys = Counter(map(key, expected['alerts']))
+    actual_keys = Counter(map(key, actual['alerts']))
+    return sorted((expected_keys - actual_keys).elements()), sorted((actual_keys - expected_keys).elements())
+
+
+def print_report(report, list_alerts=True):
+    print(f"📼 Replayed {report['samples']} samples from {len(report['files'])} files "
+          f"({report['parse_failures']} unparsed lines)")
+    print(f"⏱️ {report['simulated_seconds'] / 3600:.1f}h simulated in {report['wall_seconds']:.2f}s "
+          f"({report['speedup']}x, {report['sleep_seconds']:.1f}s paced)")
+    for stage, stats in report['stages'].items():
+        rate = f"{stats['per_second']:,}/s" if stats['per_second'] is not None else "-"
+        print(f"   {stage:<7} {stats['seconds']:8.3f}s  {stats['items']:>9} items  {rate:>14}")
+    print(f"🚨 {len(report['alerts'])} alerts fired: "
+          + (", ".join(f"{rule}×{count}" for rule, count in report['alert_counts'].items()) or "none"))
+    if 'whatsapp' in report:
+        whatsapp = report['whatsapp']
+        print(f"📱 {whatsapp['messages']} WhatsApp messages with a {whatsapp['window']:g}s digest window "
+              f"({whatsapp['sent_immediately']} immediate, {whatsapp['digests']} digests "
+              f"covering {whatsapp['held']} alerts)")
+    for alert in report['alerts'] if list_alerts else ():
+        print(f"   [{alert['time']}] {alert['rule']} {alert['key']}: {alert['message'].splitlines()[0]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("paths", nargs="+", help="Serial-QPIGS.log files or directories of daily logs")
+    parser.add_argument("--speed", type=float, default=0.0,
+                        help="replay speed as a multiple of real time (default 0 = max speed)")
+    parser.add_argument("--batch-seconds", type=float, default=5.0,
+                        help="simulated seconds of samples per pipeline batch (default 5, like POLL_INTERVAL)")
+    parser.add_argument("--rules", default=None, help="alert rules file (default: ALERT_RULES)")
+    parser.add_argument("--coalesce", type=float, default=None, metavar="SECONDS",
+                        help="count WhatsApp messages with this digest window (see ALERT_COALESCE_SECONDS)")
+    parser.add_argument("--report", help="write the full report as JSON")
+    parser.add_argument("--expect", help="earlier JSON report; exit 1 if the fired alerts differ")
+    parser.add_argument("--quiet", action="store_true", help="do not list every alert")
+    args = parser.parse_args()
+
+    files = expand_paths(args.paths)
+    if not files:
+        parser.error("no log files found")
+
+    report = replay(files, load_alert_engine(args.rules), args.speed, args.batch_seconds, args.coalesce)
+    print_report(report, list_alerts=not args.quiet)
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 Report written to {args.report}")
+
+    if args.expect:
+        with open(args.expect, "r", encoding="utf-8") as f:
+            expected = json.load(f)
+        missing, unexpected = compare_alerts(expected, report)
+        for epoch, rule in missing:
+            print(f"➖ missing: rule {rule} at {format_epoch_12h(epoch)}")
+        for epoch, rule in unexpected:
+            print(f"➕ new: rule {rule} at {format_epoch_12h(epoch)}")
+        if missing or unexpected:
+            sys.exit(1)
+        print("✅ Alerts match the expected report")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+import math
+import threading
+from collections import deque
+
+
+class RollingWindow:
+    """Time-based sliding window over (t, value) samples with O(1) amortized updates.
+
+    Keeps running sums for mean and least-squares slope, and monotonic
+    deques for min/max, so every statistic is available without rescanning
+    the window. Times are stored relative to the first sample to keep the
+    squared sums precise, and the sums are rebuilt from scratch every so
+    often to stop floating point drift from the subtractions.
+    """
+
+    REBUILD_EVERY = 10000
+
+    __slots__ = ('seconds', 'items', 'min_q', 'max_q', 't0', 'n_added',
+                 'sum_v', 'sum_x', 'sum_xx', 'sum_xv')
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.items = deque()
+        self.min_q = deque()
+        self.max_q = deque()
+        self.t0 = None
+        self.n_added = 0
+        self.sum_v = self.sum_x = self.sum_xx = self.sum_xv = 0.0
+
+    def add(self, t, value):
+        if self.t0 is None or not self.items:
+            self._reset(t)
+        x = t - self.t0
+        self.items.append((x, value))
+        self.sum_v += value
+        self.sum_x += x
+        self.sum_xx += x * x
+        self.sum_xv += x * value
+
+        min_q = self.min_q
+        while min_q and min_q[-1][1] >= value:
+            min_q.pop()
+        min_q.append((x, value))
+        max_q = self.max_q
+        while max_q and max_q[-1][1] <= value:
+            max_q.pop()
+        max_q.append((x, value))
+
+        cutoff = x - self.seconds
+        items = self.items
+        while items[0][0] <= cutoff:
+            old_x, old_v = items.popleft()
+            self.sum_v -= old_v
+            self.sum_x -= old_x
+            self.sum_xx -= old_x * old_x
+            self.sum_xv -= old_x * old_v
+        while min_q[0][0] <= cutoff:
+            min_q.popleft()
+        while max_q[0][0] <= cutoff:
+            max_q.popleft()
+
+        self.n_added += 1
+        if self.n_added % self.REBUILD_EVERY == 0:
+            self._rebuild()
+
+    def _reset(self, t):
+        self.t0 = t
+        self.items.clear()
+        self.min_q.clear()
+        self.max_q.clear()
+        self.sum_v = self.sum_x = self.sum_xx = self.sum_xv = 0.0
+
+    def _rebuild(self):
+        # Re-base times on the oldest sample and recompute the sums exactly
+        shift = self.items[0][0]
+        self.t0 += shift
+        self.items = deque((x - shift, v) for x, v in self.items)
+        self.min_q = deque((x - shift, v) for x, v in self.min_q)
+        self.max_q = deque((x - shift, v) for x, v in self.max_q)
+        self.sum_v = math.fsum(v for _, v in self.items)
+        self.sum_x = math.fsum(x for x, _ in self.items)
+        self.sum_xx = math.fsum(x * x for x, _ in self.items)
+        self.sum_xv = math.fsum(x * v for x, v in self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def span(self):
+        """Seconds between the oldest and newest sample in the window"""
+        return self.items[-1][0] - self.items[0][0] if self.items else 0.0
+
+    def mean(self):
+        return self.sum_v / len(self.items)
+
+    def min(self):
+        return self.min_q[0][1]
+
+    def max(self):
+        return self.max_q[0][1]
+
+    def slope(self):
+        """Least-squares slope in value units per second (0 with fewer than 2 samples)"""
+        n = len(self.items)
+        denominator = n * self.sum_xx - self.sum_x * self.sum_x
+        if n < 2 or denominator <= 0:
+            return 0.0
+        return (n * self.sum_xv - self.sum_x * self.sum_v) / denominator
+
+    def fitted_latest(self):
+        """Value of the regression line at the newest sample (a de-noised current value)"""
+        n = len(self.items)
+        mean_x = self.sum_x / n
+        return self.sum_v / n + self.slope() * (self.items[-1][0] - mean_x)
+
+
+class EMA:
+    """Time-aware exponential moving average with time constant `tau` seconds"""
+
+    __slots__ = ('tau', 'value', 'last_t')
+
+    def __init__(self, tau):
+        self.tau = tau
+        self.value = None
+        self.last_t = None
+
+    def add(self, t, value):
+        if self.value is None:
+            self.value = value
+        else:
+            dt = max(0.0, t - self.last_t)
+            self.value += (1.0 - math.exp(-dt / self.tau)) * (value - self.value)
+        self.last_t = t
+        return self.value
+
+
+STATS = ('mean', 'min', 'max', 'slope', 'ema', 'runtime')
+
+
+class MetricSpec:
+    """A derived metric: `stat` of sample field `field` over the last `window` seconds.
+
+    `scale` multiplies the result (e.g. 600 turns a V/s slope into V per
+    10 min). `runtime` estimates seconds until `field` falls to `target` at
+    its current slope. Window stats stay None until the window holds at
+    least `coverage` of its length, so "sustained for 30 s" cannot fire on
+    the first sample after startup.
+    """
+
+    def __init__(self, name, config):
+        self.name = name
+        self.field = config['field']
+        self.stat = config['stat']
+        if self.stat not in STATS:
+            raise ValueError(f"metric {name}: unknown stat {self.stat!r}")
+        self.window = float(config['window'])
+        self.scale = float(config.get('scale', 1))
+        self.target = float(config['target']) if 'target' in config else None
+        self.coverage = float(config.get('coverage', 0.8))
+        if self.stat == 'runtime' and self.target is None:
+            raise ValueError(f"metric {name}: runtime needs a target")
+
+
+class MetricsTracker:
+    """Maintains every configured metric, sharing one window per (field, window)"""
+
+    def __init__(self, specs):
+        self.specs = specs
+        self.windows = {}
+        self.emas = {}
+        for spec in specs:
+            if spec.stat == 'ema':
+                self.emas[spec.name] = EMA(spec.window)
+            else:
+                self.windows.setdefault((spec.field, spec.window), RollingWindow(spec.window))
+        self.fields = sorted({spec.field for spec in specs})
+        self.values = {spec.name: None for spec in specs}
+        # Only contended while the checkpoint thread copies the windows out
+        self._lock = threading.Lock()
+
+    def export_state(self):
+        """Window contents (absolute times) and EMA values, JSON-serializable, for checkpoints.
+
+        Safe to call from another thread: the copy is taken under the lock
+        `update()` holds, so it never sees a window half way through a
+        sample or a rebuild.
+        """
+        with self._lock:
+            return {
+                'windows': [[field, seconds, [[window.t0 + x, v] for x, v in window.items]]
+                            for (field, seconds), window in self.windows.items()],
+                'emas': {name: [ema.value, ema.last_t] for name, ema in self.emas.items()},
+            }
+
+    def import_state(self, saved):
+        """Refill the windows from export_state(); windows no longer configured are ignored"""
+        with self._lock:
+            for field, seconds, samples in saved.get('windows', ()):
+                window = self.windows.get((field, float(seconds)))
+                if window is not None:
+                    for t, value in samples:
+                        window.add(t, value)
+            for name, (value, last_t) in saved.get('emas', {}).items():
+                ema = self.emas.get(name)
+                if ema is not None:
+                    ema.value, ema.last_t = value, last_t
+
+    def update(self, sample, t):
+        """Feed one sample observed at time `t` and return the metric values"""
+        with self._lock:
+            return self._update(sample, t)
+
+    def _update(self, sample, t):
+        for (field, _), window in self.windows.items():
+            window.add(t, getattr(sample, field))
+
+        values = self.values
+        for spec in self.specs:
+            if spec.stat == 'ema':
+                values[spec.name] = self.emas[spec.name].add(t, getattr(sample, spec.field)) * spec.scale
+                continue
+
+            window = self.windows[(spec.field, spec.window)]
+            if window.span() < spec.window * spec.coverage:
+                values[spec.name] = None
+            elif spec.stat == 'mean':
+                values[spec.name] = window.mean() * spec.scale
+            elif spec.stat == 'min':
+                values[spec.name] = window.min() * spec.scale
+            elif spec.stat == 'max':
+                values[spec.name] = window.max() * spec.scale
+            elif spec.stat == 'slope':
+                values[spec.name] = window.slope() * spec.scale
+            else:
+                slope = window.slope()
+                level = window.fitted_latest()
+                if slope < 0 and level > spec.target:
+                    values[spec.name] = (level - spec.target) / -slope * spec.scale
+                else:
+                    values[spec.name] = math.inf
+        return values
+
+    def snapshot(self):
+        """JSON-friendly copy of the current values (inf becomes None)"""
+        return {name: (round(v, 4) if v is not None and math.isfinite(v) else None)
+                for name, v in self.values.items()}
@@ -0,0 +1,32 @@
+import hashlib
+import json
+import time
+
+
+class Snapshot:
+    """Immutable, pre-serialized view of the latest inverter data"""
+
+    __slots__ = ('data', 'body', 'etag', 'created')
+
+    def __init__(self, data):
+        self.data = dict(data)
+        self.body = json.dumps(self.data, separators=(',', ':')).encode()
+        self.etag = '"' + hashlib.blake2b(self.body, digest_size=8).hexdigest() + '"'
+        self.created = time.time()
+
+
+class SnapshotHolder:
+    """Holds the current Snapshot; the monitor swaps in a new one per sample.
+
+    Replacing `current` is a single reference assignment, so request threads
+    always see either the old or the new snapshot, never a half-updated dict,
+    and serving it costs no serialization.
+    """
+
+    def __init__(self, data):
+        self.current = Snapshot(data)
+
+    def publish(self, data):
+        snapshot = Snapshot(data)
+        self.current = snapshot
+        return snapshot
@@ -72,24 +72,80 @@ async function fetchData() {
     const data = await response.json();
 
     // console.log("✅ Data received, updating dashboard...", data);
-    updateDashboard(data);
-    updateAllStatusOnRefresh(data);
-    document.getElementById(
-      "battery_capacity"
-    ).textContent = `${updateBatteryPercentage(data.battery_voltage)}%`;
-    // ✅ Make sure data.timestamp exists and is a valid date
-    if (data.timestamp) {
-      const lastUpdateTime = new Date(data.timestamp);
-      const status = checkConnection(new Date(), lastUpdateTime);
-      updateElementTextContent("lastReadingTime", status);
-    } else {
-      updateElementTextContent("lastReadingTime", "⚠️ Missing timestamp");
-    }
+    applyData(data);
   } catch (error) {
     console.error("❌ Error fetching data:", error);
   }
 }
 
+// Render a full data object (from polling or the live stream)
+function applyData(data) {
+  updateDashboard(data);
+  updateAllStatusOnRefresh(data);
+  updateConnectionStatus(data);
+}
+
+function updateConnectionStatus(data) {
+  // ✅ Make sure data.timestamp exists and is a valid date
+  if (data.timestamp) {
+    const lastUpdateTime = new Date(data.timestamp);
+    const status = checkConnection(new Date(), lastUpdateTime);
+    updateElementTextContent("lastReadingTime", status);
+  } else {
+    updateElementTextContent("lastReadingTime", "⚠️ Missing timestamp");
+  }
+}
+
+// Live updates over Server-Sent Events, falling back to polling
+let liveData = {};
+let liveStatusInterval;
+
+function setLiveMode(live) {
+  const pollIndicator = document.getElementById("pollIndicator");
+  const liveIndicator = document.getElementById("liveIndicator");
+  if (pollIndicator) pollIndicator.classList.toggle("hidden", live);
+  if (liveIndicator) liveIndicator.classList.toggle("hidden", !live);
+
+  if (live) {
+    clearInterval(countdownInterval);
+    countdownInterval = null;
+    // Samples only arrive when they change, so re-check staleness on a timer
+    clearInterval(liveStatusInterval);
+    liveStatusInterval = setInterval(() => updateConnectionStatus(liveData), 5000);
+  } else {
+    clearInterval(liveStatusInterval);
+    if (!countdownInterval) {
+      startCountdown();
+    }
+  }
+}
+
+function startLiveUpdates() {
+  if (!window.EventSource) {
+    startCountdown();
+    return;
+  }
+
+  const source = new EventSource("/api/stream");
+
+  source.onopen = () => setLiveMode(true);
+
+  // Full snapshot on connect (and after the server had to drop updates)
+  source.addEventListener("snapshot", (event) => {
+    liveData = JSON.parse(event.data);
+    applyData(liveData);
+  });
+
+  // Regular messages only carry the fields that changed
+  source.onmessage = (event) => {
+    Object.assign(liveData, JSON.parse(event.data));
+    applyData(liveData);
+  };
+
+  // EventSource reconnects by itself; poll in the meantime
+  source.onerror = () => setLiveMode(false);
+}
+
 const checkConnection = (currentTime, lastUpdateTime) => {
   const difference = (currentTime - lastUpdateTime) / 1000;
   const body = document.body;
@@ -120,11 +176,7 @@ function updateDashboard(data) {
   updateElementValue("ac_output_power", data.ac_output_power, "W");
   updateElementValue("output_apparent_power", data.output_apparent_power, "VA");
   updateElementValue("load_percentage", data.load_percentage, "");
-  updateElementValue(
-    "load_ampere",
-    parseFloat((data.ac_output_power / data.ac_output_voltage).toFixed(2)),
-    "A"
-  );
+  updateElementValue("load_ampere", data.load_current, "A");
   updateElementValue("ac_output_voltage", data.ac_output_voltage, "V");
   updateElementTextContent(
     "ac_output_frequency",
@@ -134,10 +186,16 @@ function updateDashboard(data) {
   // Solar Production Section
   updateElementValue("pv_power", data.pv_power, "W");
   updateElementValue("pv_voltage", data.pv_voltage, "V");
-  updateElementValue("pv_charging_power", data.pv_charging_power, "A");
+  updateElementValue("pv_charging_power", data.pv_input_current, "A");
 
-  // Battery Status Section
-  updateElementValue("battery_capacity", data.battery_capacity, "%");
+  // Battery Status Section (state of charge and net current come from the server's energy model)
+  updateElementValue("battery_capacity", data.battery_soc, "%");
+  updateElementTextContent(
+    "battery_current",
+    data.battery_net_current == null
+      ? "--"
+      : Math.abs(data.battery_net_current).toFixed(1)
+  );
   updateElementValue("battery_voltage", data.battery_voltage, "V");
   updateElementTextContent(
     "battery_charging_current",
@@ -160,7 +218,6 @@ function updateDashboard(data) {
   updateElementTextContent("status_binary", "Binary: " + data.status_bits);
   updateElementTextContent("fan_battery_offset", data.fan_battery_offset);
   updateElementTextContent("eeprom_fw", data.eeprom_fw);
-  updateElementTextContent("reserved", data.reserved);
 
   // Timestamps
 
@@ -221,37 +278,6 @@ function updateAllStatusOnRefresh(data) {
   }
 }
 
-function updateBatteryPercentage(voltage) {
-  const FULL_VOLTAGE = 28.6; // bulk charge
-  const FLOAT_VOLTAGE = 27.0; // float voltage (around 90-95%)
-  const EMPTY_VOLTAGE = 21.0; // cutoff voltage
-
-  // Clamp voltage to expected range
-  if (voltage >= FULL_VOLTAGE) return 100;
-  if (voltage <= EMPTY_VOLTAGE) return 0;
-
-  // Approximate curve (LiFePO4 voltage vs SOC, scaled to your 24V system)
-  const voltageToPercent = [
-    [21.0, 0],
-    [23.0, 10],
-    [25.0, 40],
-    [26.0, 70],
-    [27.0, 90],
-    [28.6, 100],
-  ];
-
-  // Find where the voltage lies between two points
-  for (let i = 0; i < voltageToPercent.length - 1; i++) {
-    const [v1, p1] = voltageToPercent[i];
-    const [v2, p2] = voltageToPercent[i + 1];
-    if (voltage >= v1 && voltage <= v2) {
-      // Linear interpolation between points
-      return Math.round(p1 + ((voltage - v1) / (v2 - v1)) * (p2 - p1));
-    }
-  }
-
-  return 0; // fallback
-}
 // Update element with value and unit (for card values)
 function updateElementValue(elementId, value, unit) {
   const element = document.getElementById(elementId);
@@ -347,7 +373,6 @@ function checkAllElements() {
     "status_binary",
     "fan_battery_offset",
     "eeprom_fw",
-    "reserved",
     "lastReadingTime",
     "lastUpdateTime",
     "operatingMode",
@@ -363,12 +388,88 @@ function checkAllElements() {
   });
 }
 
+// Trend charts: /api/chart sends at most one point per canvas pixel
+let chartRange = "24h";
+
+async function loadChart(canvas) {
+  const width = Math.round(canvas.clientWidth * (window.devicePixelRatio || 1));
+  const url = `/api/chart?field=${canvas.dataset.field}&range=${chartRange}&width=${width}`;
+  const response = await fetch(url);
+  if (response.status === 503) {
+    // History is disabled on the server
+    document.getElementById("chartsSection").classList.add("hidden");
+    return;
+  }
+  drawChart(canvas, await response.json());
+}
+
+function drawChart(canvas, chart) {
+  const dpr = window.devicePixelRatio || 1;
+  canvas.width = Math.round(canvas.clientWidth * dpr);
+  canvas.height = Math.round(canvas.clientHeight * dpr);
+  const ctx = canvas.getContext("2d");
+  ctx.clearRect(0, 0, canvas.width, canvas.height);
+  if (!chart.v || chart.v.length === 0) {
+    ctx.fillStyle = "#94a3b8";
+    ctx.font = `${12 * dpr}px sans-serif`;
+    ctx.fillText("No data", 8 * dpr, 20 * dpr);
+    return;
+  }
+
+  // Times arrive as offsets from the previous point
+  const times = [chart.t0];
+  chart.dt.forEach((dt, i) => times.push(times[i] + dt));
+  const lo = Math.min(...chart.v);
+  const hi = Math.max(...chart.v);
+  const pad = 16 * dpr;
+  const x = (t) => ((t - chart.from) / (chart.to - chart.from)) * canvas.width;
+  const y = (v) =>
+    canvas.height - pad - ((v - lo) / (hi - lo || 1)) * (canvas.height - 2 * pad);
+
+  ctx.strokeStyle = canvas.dataset.color;
+  ctx.lineWidth = 1.5 * dpr;
+  ctx.beginPath();
+  chart.v.forEach((v, i) => {
+    if (i === 0) ctx.moveTo(x(times[i]), y(v));
+    else ctx.lineTo(x(times[i]), y(v));
+  });
+  ctx.stroke();
+
+  ctx.fillStyle = "#64748b";
+  ctx.font = `${11 * dpr}px sans-serif`;
+  ctx.fillText(hi.toFixed(1), 4 * dpr, 12 * dpr);
+  ctx.fillText(lo.toFixed(1), 4 * dpr, canvas.height - 4 * dpr);
+}
+
+function refreshCharts() {
+  document.querySelectorAll(".trend-chart").forEach((canvas) => {
+    loadChart(canvas).catch((error) =>
+      console.error("❌ Error loading chart:", error)
+    );
+  });
+}
+
+function initCharts() {
+  document.querySelectorAll(".chart-range-btn").forEach((button) => {
+    button.addEventListener("click", () => {
+      document
+        .querySelectorAll(".chart-range-btn")
+        .forEach((b) => b.classList.toggle("active", b === button));
+      chartRange = button.dataset.range;
+      refreshCharts();
+    });
+  });
+  refreshCharts();
+  setInterval(refreshCharts, 60000);
+}
+
 // Initialize everything when page loads
 document.addEventListener("DOMContentLoaded", function () {
   // console.log("🚀 DOM Content Loaded - Solar Monitor Initialized");
 
   updateCurrentTime();
-  startCountdown();
+  startLiveUpdates();
+  initCharts();
 
   // Update time every second
   setInterval(updateCurrentTime, 1000);
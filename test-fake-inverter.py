@@ -0,0 +1,87 @@
+"""Fake Voltronic/Axpert inverter on a pseudo-terminal, for trying the serial data source.
+
+Creates a pty, prints its device path and answers QPIGS (and QMOD) the way
+the inverter does, with values that drift slowly. `--fail-rate` answers
+some requests with a corrupted CRC or not at all, so the driver's error
+handling can be watched. POSIX only (Linux/macOS).
+
+    python test-fake-inverter.py --delay 0.05 --fail-rate 0.1
+    DATA_SOURCE=serial SERIAL_PORT=/dev/pts/N python inverter_monitor_mqtt.py
+"""
+import argparse
+import os
+import random
+import time
+import tty
+
+from voltronic import build_response, crc16
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--delay", type=float, default=0.05, help="seconds before answering")
+parser.add_argument("--fail-rate", type=float, default=0.0,
+                    help="fraction of requests answered with a bad CRC or not at all")
+parser.add_argument("--link", help="also create a symlink to the pty at this path")
+args = parser.parse_args()
+
+state = {'battery_voltage': 26.0, 'load': 450, 'pv_power': 0, 'grid_voltage': 230.0}
+
+
+def qpigs_payload():
+    state['battery_voltage'] = min(28.8, max(21.0, state['battery_voltage'] + random.uniform(-0.05, 0.05)))
+    state['load'] = max(0, state['load'] + random.randint(-20, 20))
+    state['pv_power'] = max(0, min(3000, state['pv_power'] + random.randint(-40, 50)))
+    grid = state['grid_voltage']
+    battery = state['battery_voltage']
+    discharge = 0 if grid > 0 or state['pv_power'] > state['load'] else state['load'] // 24
+    return (f"{grid:05.1f} 50.0 230.0 50.0 {int(state['load'] * 1.12):04d} {state['load']:04d} "
+            f"{state['load'] * 100 // 3000:03d} 390 {battery:05.2f} 000 "
+            f"{max(0, min(100, int((battery - 21) * 13))):03d} 0041 "
+            f"{state['pv_power'] / 250:04.1f} 250.0 {battery:05.2f} {discharge:05d} "
+            f"00010110 00 00 {state['pv_power']:05d} 101")
+
+
+def answer(command):
+    if command == b"QPIGS":
+        return build_response(qpigs_payload())
+    if command == b"QMOD":
+        return build_response("L" if state['grid_voltage'] > 0 else "B")
+    return build_response("NAK")
+
+
+def main():
+    master, slave = os.openpty()
+    tty.setraw(slave)
+    path = os.ttyname(slave)
+    if args.link:
+        if os.path.lexists(args.link):
+            os.remove(args.link)
+        os.symlink(path, args.link)
+    print(f"🔌 Fake inverter listening on {path}" + (f" (linked as {args.link})" if args.link else ""))
+
+    buffer = b""
+    served = 0
+    while True:
+        buffer += os.read(master, 256)
+        while b"\r" in buffer:
+            frame, buffer = buffer.split(b"\r", 1)
+            command, crc = frame[:-2], frame[-2:]
+            if crc16(command) != crc:
+                print(f"⚠️ Bad command CRC: {frame!r}")
+                continue
+            served += 1
+            time.sleep(args.delay)
+            if random.random() < args.fail_rate:
+                if random.random() < 0.5:
+                    print(f"#{served} {command.decode()}: (no answer)")
+                    continue
+                response = build_response(qpigs_payload())
+                response = response[:-3] + b"\x00\x00\r"
+                print(f"#{served} {command.decode()}: corrupted CRC")
+            else:
+                response = answer(command)
+                print(f"#{served} {command.decode()}: {response[:40]!r}...")
+            os.write(master, response)
+
+
+if __name__ == "__main__":
+    main()
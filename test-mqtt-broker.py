@@ -0,0 +1,207 @@
+"""Tiny in-process MQTT 3.1.1 broker for trying out the MQTT publisher without mosquitto.
+
+Supports CONNECT (with a last will), PUBLISH at QoS 0/1/2, retained messages,
+SUBSCRIBE with + and # wildcards and PINGREQ; everything is delivered to
+subscribers at QoS 0. Every publish is printed. `--drop-every N` closes all
+client connections every N seconds, so reconnects and the offline buffer
+can be watched in action.
+
+    python test-mqtt-broker.py --port 1883 --drop-every 60
+    MQTT_HOST=localhost python inverter_monitor_mqtt.py
+"""
+import argparse
+import socket
+import socketserver
+import struct
+import threading
+import time
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--port", type=int, default=1883)
+parser.add_argument("--drop-every", type=float, default=0.0, help="disconnect all clients every N seconds")
+parser.add_argument("--quiet", action="store_true", help="do not print every publish")
+args = parser.parse_args()
+
+lock = threading.Lock()
+sessions = set()
+retained = {}
+received = 0
+
+
+def topic_matches(pattern, topic):
+    pattern_parts = pattern.split("/")
+    topic_parts = topic.split("/")
+    for i, part in enumerate(pattern_parts):
+        if part == "#":
+            return True
+        if i >= len(topic_parts) or (part != "+" and part != topic_parts[i]):
+            return False
+    return len(pattern_parts) == len(topic_parts)
+
+
+def encode_length(n):
+    out = bytearray()
+    while True:
+        byte, n = n % 128, n // 128
+        out.append(byte | (0x80 if n else 0))
+        if not n:
+            return bytes(out)
+
+
+def utf8(s):
+    data = s.encode()
+    return struct.pack("!H", len(data)) + data
+
+
+def publish_packet(topic, payload, retain=False):
+    body = utf8(topic) + payload
+    return bytes([0x30 | (1 if retain else 0)]) + encode_length(len(body)) + body
+
+
+def route(topic, payload, retain):
+    global received
+    received += 1
+    if not args.quiet:
+        shown = payload.decode(errors="replace") if payload.isascii() else f"<{len(payload)} bytes>"
+        print(f"#{received} {topic}{' (retained)' if retain else ''}: {shown[:120]}")
+    with lock:
+        if retain:
+            if payload:
+                retained[topic] = payload
+            else:
+                retained.pop(topic, None)
+        targets = [s for s in sessions if any(topic_matches(f, topic) for f in s.filters)]
+    for session in targets:
+        session.send(publish_packet(topic, payload))
+
+
+class Session(socketserver.BaseRequestHandler):
+    def setup(self):
+        self.filters = set()
+        self.will = None
+        self.write_lock = threading.Lock()
+
+    def send(self, data):
+        with self.write_lock:
+            try:
+                self.request.sendall(data)
+            except OSError:
+                pass
+
+    def read_exact(self, n):
+        data = b""
+        while len(data) < n:
+            chunk = self.request.recv(n - len(data))
+            if not chunk:
+                raise ConnectionError
+            data += chunk
+        return data
+
+    def read_packet(self):
+        header = self.read_exact(1)[0]
+        length, shift = 0, 0
+        while True:
+            byte = self.read_exact(1)[0]
+            length |= (byte & 0x7F) << shift
+            shift += 7
+            if not byte & 0x80:
+                break
+        return header, self.read_exact(length)
+
+    def handle(self):
+        with lock:
+            sessions.add(self)
+        clean = False
+        try:
+            while True:
+                header, body = self.read_packet()
+                kind = header >> 4
+                if kind == 1:    # CONNECT
+                    self.on_connect(body)
+                elif kind == 3:  # PUBLISH
+                    self.on_publish(header, body)
+                elif kind == 6:  # PUBREL
+                    self.send(b"\x70\x02" + body[:2])
+                elif kind == 8:  # SUBSCRIBE
+                    self.on_subscribe(body)
+                elif kind == 12:  # PINGREQ
+                    self.send(b"\xd0\x00")
+                elif kind == 14:  # DISCONNECT
+                    clean = True
+                    return
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            with lock:
+                sessions.discard(self)
+            if not clean and self.will:
+                route(*self.will)
+            print(f"👋 Client {self.client_address[0]}:{self.client_address[1]} disconnected")
+
+    def on_connect(self, body):
+        pos = 2 + struct.unpack("!H", body[:2])[0]
+        flags = body[pos + 1]
+        pos += 4
+        client_id_len = struct.unpack("!H", body[pos:pos + 2])[0]
+        pos += 2 + client_id_len
+        if flags & 0x04:
+            topic_len = struct.unpack("!H", body[pos:pos + 2])[0]
+            topic = body[pos + 2:pos + 2 + topic_len].decode()
+            pos += 2 + topic_len
+            payload_len = struct.unpack("!H", body[pos:pos + 2])[0]
+            self.will = (topic, body[pos + 2:pos + 2 + payload_len], bool(flags & 0x20))
+        print(f"🤝 Client {self.client_address[0]}:{self.client_address[1]} connected")
+        self.send(b"\x20\x02\x00\x00")
+
+    def on_publish(self, header, body):
+        qos = (header >> 1) & 0x03
+        topic_len = struct.unpack("!H", body[:2])[0]
+        topic = body[2:2 + topic_len].decode()
+        pos = 2 + topic_len
+        if qos:
+            packet_id = body[pos:pos + 2]
+            pos += 2
+            self.send((b"\x40\x02" if qos == 1 else b"\x50\x02") + packet_id)
+        route(topic, body[pos:], bool(header & 0x01))
+
+    def on_subscribe(self, body):
+        packet_id, pos = body[:2], 2
+        granted = bytearray()
+        new_filters = []
+        while pos < len(body):
+            length = struct.unpack("!H", body[pos:pos + 2])[0]
+            new_filters.append(body[pos + 2:pos + 2 + length].decode())
+            pos += 3 + length
+            granted.append(0)
+        self.filters.update(new_filters)
+        self.send(b"\x90" + encode_length(2 + len(granted)) + packet_id + bytes(granted))
+        with lock:
+            matches = [(t, p) for t, p in retained.items() if any(topic_matches(f, t) for f in new_filters)]
+        for topic, payload in matches:
+            self.send(publish_packet(topic, payload, retain=True))
+
+
+def drop_clients():
+    while True:
+        time.sleep(args.drop_every)
+        with lock:
+            current = list(sessions)
+        print(f"✂️ Dropping {len(current)} client connections")
+        for session in current:
+            try:
+                session.request.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+class Broker(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+if __name__ == "__main__":
+    if args.drop_every > 0:
+        threading.Thread(target=drop_clients, daemon=True).start()
+    print(f"🦟 Test MQTT broker listening on port {args.port}")
+    with Broker(("", args.port), Session) as server:
+        server.serve_forever()
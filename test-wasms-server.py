@@ -0,0 +1,53 @@
+"""Local stand-in for the WaSMS send API, for trying out alert delivery.
+
+Point the monitor at it with WASMS_API_URL=http://localhost:8081/api/send/whatsapp
+and it will answer slowly and/or fail some requests so retries and the
+spool file can be watched in action.
+
+    python test-wasms-server.py --delay 5 --fail-rate 0.5
+"""
+import argparse
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--port", type=int, default=8081)
+parser.add_argument("--delay", type=float, default=0.0, help="seconds to wait before answering")
+parser.add_argument("--fail-rate", type=float, default=0.0, help="fraction of requests answered with HTTP 500")
+args = parser.parse_args()
+
+received = 0
+
+
+class FakeWasms(BaseHTTPRequestHandler):
+    def do_POST(self):
+        global received
+        length = int(self.headers.get("Content-Length", 0))
+        form = parse_qs(self.rfile.read(length).decode())
+        received += 1
+        time.sleep(args.delay)
+
+        recipient = form.get("recipient", ["?"])[0]
+        if random.random() < args.fail_rate:
+            status, body = 500, {"status": 500, "message": "Simulated failure"}
+        else:
+            status, body = 200, {"status": 200, "message": "WhatsApp chat has been queued for sending!"}
+        print(f"#{received} {recipient}: {status} | {form.get('message', [''])[0].splitlines()[0]}")
+
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+print(f"🧪 Fake WaSMS listening on http://localhost:{args.port}/api/send/whatsapp "
+      f"(delay {args.delay}s, fail rate {args.fail_rate:.0%})")
+ThreadingHTTPServer(("", args.port), FakeWasms).serve_forever()
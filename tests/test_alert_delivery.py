@@ -0,0 +1,164 @@
+"""AlertDelivery against a local stub of the WaSMS send API"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import pytest
+
+from alert_delivery import AlertDelivery
+
+
+class StubWasms:
+    """Answers POSTs with the next status of `statuses` (200 once they run out)"""
+
+    def __init__(self):
+        self.statuses = []
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                form = parse_qs(self.rfile.read(length).decode())
+                stub.requests.append((time.monotonic(), form['recipient'][0], form['message'][0]))
+                status = stub.statuses.pop(0) if stub.statuses else 200
+                body = json.dumps({'status': status}).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/send"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub():
+    server = StubWasms()
+    yield server
+    server.close()
+
+
+def make_delivery(url, **options):
+    options.setdefault('base_delay', 0.05)
+    options.setdefault('timeout', 5)
+    return AlertDelivery(url, "secret", "account", **options)
+
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.01)
+
+
+def test_retries_with_growing_backoff(stub):
+    stub.statuses = [500, 500, 500]
+    delivery = make_delivery(stub.url).start()
+    try:
+        assert delivery.submit("Grid down", ["+100"])
+        wait_for(lambda: delivery.stats['delivered'] == 1)
+    finally:
+        delivery.stop()
+
+    assert delivery.stats['failed_attempts'] == 3
+    assert delivery.pending_count() == 0
+    times = [t for t, _, _ in stub.requests]
+    gaps = [b - a for a, b in zip(times, times[1:])]
+    # base_delay * 2 ** (attempt - 1), with +-20% jitter
+    for gap, expected in zip(gaps, (0.05, 0.1, 0.2)):
+        assert gap >= expected * 0.8
+    assert gaps[2] > gaps[0]
+
+
+def test_gives_up_after_max_attempts(stub):
+    stub.statuses = [500] * 10
+    delivery = make_delivery(stub.url, max_attempts=2).start()
+    try:
+        delivery.submit("Low battery", ["+100"])
+        wait_for(lambda: delivery.stats['dropped'] == 1)
+    finally:
+        delivery.stop()
+    assert len(stub.requests) == 2
+    assert delivery.pending_count() == 0
+
+
+def test_only_failed_recipients_are_retried(stub):
+    stub.statuses = [500]
+    delivery = make_delivery(stub.url, max_workers=1).start()
+    try:
+        delivery.submit("Grid down", ["+100", "+200"])
+        wait_for(lambda: delivery.stats['delivered'] == 2)
+    finally:
+        delivery.stop()
+    recipients = [recipient for _, recipient, _ in stub.requests]
+    assert len(recipients) == 3
+    assert recipients.count(recipients[0]) == 2
+
+
+def test_spool_is_replayed_after_restart(stub, tmp_path):
+    spool = str(tmp_path / "spool.json")
+    # Not started: the alert only reaches the spool
+    first = make_delivery(stub.url, spool_path=spool)
+    first.submit("Grid down", ["+100"])
+    first.stop()
+    with open(spool, encoding="utf-8") as f:
+        assert [alert['message'] for alert in json.load(f)] == ["Grid down"]
+
+    second = make_delivery(stub.url, spool_path=spool)
+    assert second.pending_count() == 1
+    second.start()
+    try:
+        wait_for(lambda: second.stats['delivered'] == 1)
+    finally:
+        second.stop()
+    assert [message for _, _, message in stub.requests] == ["Grid down"]
+    with open(spool, encoding="utf-8") as f:
+        assert json.load(f) == []
+
+
+def test_stale_spooled_alerts_are_dropped(stub, tmp_path):
+    spool = tmp_path / "spool.json"
+    now = time.time()
+    spool.write_text(json.dumps([
+        {'id': 'old', 'message': "Grid down", 'recipients': ["+100"], 'attempts': 1, 'created': now - 7200},
+        {'id': 'new', 'message': "Low battery", 'recipients': ["+100"], 'attempts': 1, 'created': now - 60},
+    ]), encoding="utf-8")
+
+    delivery = make_delivery(stub.url, spool_path=str(spool), max_age=3600)
+    assert delivery.stats['expired'] == 1
+    assert [alert['id'] for alert in delivery.pending_alerts()] == ['new']
+    delivery.start()
+    try:
+        wait_for(lambda: delivery.stats['delivered'] == 1)
+    finally:
+        delivery.stop()
+    assert [message for _, _, message in stub.requests] == ["Low battery"]
+
+
+def test_queue_is_bounded(stub):
+    delivery = make_delivery(stub.url, max_queue=2)
+    assert delivery.submit("one", ["+100"])
+    assert delivery.submit("two", ["+100"])
+    assert not delivery.submit("three", ["+100"])
+    assert delivery.stats['dropped'] == 1
+    assert delivery.pending_count() == 2
+
+    delivery.start()
+    try:
+        wait_for(lambda: delivery.stats['delivered'] == 2)
+    finally:
+        delivery.stop()
+    assert sorted(message for _, _, message in stub.requests) == ["one", "two"]
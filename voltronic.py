@@ -0,0 +1,66 @@
+"""Framing for the Voltronic/Axpert serial protocol (QPIGS and friends).
+
+A command is the ASCII command, a CRC16 and a carriage return. A response
+is "(" + ASCII payload + CRC16 + "\r". The CRC is CRC-16/XMODEM, except that
+a CRC byte equal to "(", "\r" or "\n" is bumped by one so it can never be
+mistaken for framing.
+"""
+
+_RESERVED = (0x28, 0x0D, 0x0A)
+
+
+def _crc_table():
+    table = []
+    for byte in range(256):
+        crc = byte << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else (crc << 1)
+        table.append(crc & 0xFFFF)
+    return tuple(table)
+
+
+_CRC_TABLE = _crc_table()
+
+
+def crc16(data):
+    """Protocol CRC of `data` as two bytes, high byte first"""
+    crc = 0
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFF) ^ _CRC_TABLE[(crc >> 8) ^ byte]
+    high, low = crc >> 8, crc & 0xFF
+    if high in _RESERVED:
+        high += 1
+    if low in _RESERVED:
+        low += 1
+    return bytes((high, low))
+
+
+def build_command(command):
+    """Frame an ASCII command such as "QPIGS" for sending"""
+    data = command.encode("ascii")
+    return data + crc16(data) + b"\r"
+
+
+def build_response(payload):
+    """Frame a response payload the way the inverter sends it (used by the fake inverter)"""
+    data = b"(" + payload.encode("ascii")
+    return data + crc16(data) + b"\r"
+
+
+class ProtocolError(ValueError):
+    pass
+
+
+def parse_response(frame):
+    """Check a response frame's CRC and return its payload text (without "(")"""
+    if frame.endswith(b"\r"):
+        frame = frame[:-1]
+    if len(frame) < 3 or not frame.startswith(b"("):
+        raise ProtocolError(f"malformed response {frame[:40]!r}")
+    data, crc = frame[:-2], frame[-2:]
+    if crc16(data) != crc:
+        raise ProtocolError(f"CRC mismatch in response {frame[:40]!r}")
+    payload = data[1:].decode("ascii", errors="replace")
+    if payload.startswith("NAK"):
+        raise ProtocolError("inverter answered NAK")
+    return payload